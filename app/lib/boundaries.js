@@ -0,0 +1,65 @@
+// Cue boundaries packed as parallel sorted arrays, see
+// preprocessing/scripts/boundaries.py.
+
+function decodeBoundaries(buf) {
+	let pos = 0;
+	function readVarint() {
+		let value = 0;
+		let scale = 1;
+		for (;;) {
+			const byte = buf[pos++];
+			value += (byte & 0x7f) * scale;
+			if (!(byte & 0x80)) return value;
+			scale *= 0x80;
+		}
+	}
+
+	const n = readVarint();
+	const offsets = new Array(n);
+	const times = new Array(n);
+	let prev = 0;
+	for (let i = 0; i < n; i++) {
+		prev += readVarint();
+		offsets[i] = prev;
+	}
+	prev = 0;
+	for (let i = 0; i < n; i++) {
+		const zigzag = readVarint();
+		prev += zigzag % 2 ? -(zigzag + 1) / 2 : zigzag / 2;
+		times[i] = prev;
+	}
+	return { offsets, times };
+}
+
+// Index of the first offset >= value.
+function lowerBound(offsets, value) {
+	let lo = 0;
+	let hi = offsets.length;
+	while (lo < hi) {
+		const mid = (lo + hi) >>> 1;
+		if (offsets[mid] < value) lo = mid + 1;
+		else hi = mid;
+	}
+	return lo;
+}
+
+// [startTime, text] of a phrase match at index: the text between the last
+// boundary at or before the match and the first one at or after its end.
+function boundarySnippet(text, { offsets, times }, index, length) {
+	let i = lowerBound(offsets, index + 1) - 1;
+	const startIndex = i >= 0 ? offsets[i] : 0;
+	const startTime = i >= 0 ? times[i] : 0;
+
+	let endIndex = index + length;
+	if (endIndex < text.length) {
+		const j = lowerBound(offsets, endIndex);
+		endIndex = j < offsets.length ? offsets[j] : text.length;
+	}
+
+	return [startTime || 0, text.substring(startIndex, endIndex).trim()];
+}
+
+module.exports = {
+	decodeBoundaries,
+	boundarySnippet,
+};
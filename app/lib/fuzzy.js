@@ -0,0 +1,74 @@
+// Near-spellings by symmetric deletion, see preprocessing/scripts/fuzzy.py:
+// the constants and functions here must match it.
+
+const PREFIX = 7;
+const MAX_EDITS = 2;
+const MIN_LENGTH = 4;
+const MAX_LENGTH = 32;
+const MAX_CANDIDATES = 2000;
+const MAX_EXPANSIONS = 10;
+
+function canExpand(word) {
+	return word.length >= MIN_LENGTH && word.length <= MAX_LENGTH && /^[a-z]+$/.test(word);
+}
+
+// Edits allowed for a query: one for short words, where two match too much.
+function maxDistance(word) {
+	return word.length <= 5 ? 1 : MAX_EDITS;
+}
+
+// The fuzzy keys of a word: its prefix with up to MAX_EDITS characters deleted.
+function deletes(word) {
+	const keys = new Set([word.substring(0, PREFIX)]);
+	let edge = [...keys];
+	for (let edits = 0; edits < MAX_EDITS; edits++) {
+		const next = new Set();
+		for (const key of edge) {
+			for (let i = 0; i < key.length; i++) next.add(key.substring(0, i) + key.substring(i + 1));
+		}
+		for (const key of next) keys.add(key);
+		edge = [...next];
+	}
+	return [...keys].sort();
+}
+
+// Optimal string alignment distance.
+function distance(a, b) {
+	let prev2 = null;
+	let prev = Array.from({ length: b.length + 1 }, (_, j) => j);
+	for (let i = 1; i <= a.length; i++) {
+		const row = [i];
+		for (let j = 1; j <= b.length; j++) {
+			const cost = a[i - 1] === b[j - 1] ? 0 : 1;
+			row[j] = Math.min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost);
+			if (i > 1 && j > 1 && a[i - 1] === b[j - 2] && a[i - 2] === b[j - 1]) {
+				row[j] = Math.min(row[j], prev2[j - 2] + 1);
+			}
+		}
+		prev2 = prev;
+		prev = row;
+	}
+	return prev[b.length];
+}
+
+// The best [ word, mentions ] candidates within the word's limit, closest
+// and most mentioned first.
+function rank(word, candidates) {
+	const limit = maxDistance(word);
+	const scored = [];
+	for (const [candidate, mentions] of candidates) {
+		if (candidate === word || Math.abs(candidate.length - word.length) > limit) continue;
+		const d = distance(word, candidate);
+		if (d <= limit) scored.push([d, mentions, candidate]);
+	}
+	scored.sort((x, y) => x[0] - y[0] || y[1] - x[1] || (x[2] < y[2] ? -1 : x[2] > y[2] ? 1 : 0));
+	return scored.slice(0, MAX_EXPANSIONS).map(([, mentions, candidate]) => [candidate, mentions]);
+}
+
+module.exports = {
+	MAX_CANDIDATES,
+	canExpand,
+	deletes,
+	distance,
+	rank,
+};
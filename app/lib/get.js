@@ -1,89 +1,604 @@
 const Database = require('better-sqlite3');
+const fs = require('fs');
 const path = require('path');
+const { readPostings } = require('./postings');
+const { decodeBoundaries, boundarySnippet } = require('./boundaries');
+const { LRU } = require('./lru');
+const { loadDictionary, decodeTranscript } = require('./transcripts');
+const { MAX_CANDIDATES, canExpand, deletes, rank } = require('./fuzzy');
 
-const db = new Database(path.join(__dirname, '..', 'data', 'squeex.db'));
-
-// Cache meta (small — vid, title, upload_date for all videos)
-const meta = {};
-for (const row of db.prepare('SELECT vid, title, upload_date FROM videos').iterate()) {
-	const yyyymmdd = row.upload_date.toString();
-	const year  = yyyymmdd.substring(0, 4);
-	const month = yyyymmdd.substring(4, 6);
-	const day   = yyyymmdd.substring(6, 8);
-	meta[row.vid] = {
-		title: row.title,
-		upload_date: new Date(year, month - 1, day),
-	};
+const dbPath = path.join(__dirname, '..', 'data', 'squeex.db');
+
+// Upload days a search covers, inclusive, as YYYYMMDD.
+const ALL_DAYS = { from: 0, to: 99999999 };
+
+// Pages of results: videos in descending (upload_date, vid) order, after
+// a cursor (the last video of the previous page).
+const FIRST_PAGE = { day: 100000000, vid: '' };
+const afterCursor = 'v.upload_date BETWEEN ? AND ? AND (v.upload_date < ? OR (v.upload_date = ? AND v.vid < ?))';
+
+// The database and its prepared statements. Deployments swap a new file in
+// (preprocessing/scripts/delta.py apply), so checkVersion reopens it when
+// the inode at dbPath changes; the old file stays readable until closed.
+let db;
+let dbIno;
+let stmtUpdatedAt;
+let stmtWordMap;
+let stmtSegments;
+let hasBoundaries;
+let phraseColumns;
+let stmtAllVideos;
+let hasSegmentsTable;
+let stmtWordSegments;
+let stmtWordSegmentsInRange;
+let stmtWordsSegments;
+let hasWordDaily;
+let stmtWordDaily;
+let stmtFuzzy;
+let stmtCompletions;
+let stmtCompletionScan;
+let hasFts;
+let stmtPhraseCandidates;
+let stmtWordPage;
+let stmtSegment;
+let stmtPhrasePageCandidates;
+let stmtPhrasePageVideos;
+let stmtPhraseRow;
+let dictionary; // of the compressed transcript columns (lib/transcripts.js), if any
+
+function open() {
+	db = new Database(dbPath);
+	dbIno = fs.statSync(dbPath).ino;
+
+	// postings(segment_indexes): one row per segment index of a word_map entry.
+	db.table('postings', {
+		columns: ['idx'],
+		rows: function* (segmentIndexes) {
+			for (const idx of readPostings(segmentIndexes)) yield [idx];
+		},
+	});
+
+	dictionary = loadDictionary(db);
+	stmtUpdatedAt = db.prepare("SELECT value FROM info WHERE key = 'updatedAt'");
+	stmtWordMap = db.prepare('SELECT vid, segment_indexes FROM word_map WHERE word = ?');
+	stmtSegments = db.prepare('SELECT segments FROM videos WHERE vid = ?');
+	// Packed cue boundaries, when the DB has them; otherwise the idx_to_time JSON.
+	hasBoundaries = !!db.prepare("SELECT 1 FROM pragma_table_info('videos') WHERE name = 'boundaries'").get();
+	phraseColumns = hasBoundaries ? 'v.vid, v.full_text, v.boundaries' : 'v.vid, v.full_text, v.idx_to_time';
+	stmtAllVideos = db.prepare(`
+		SELECT ${phraseColumns} FROM videos v
+		WHERE v.upload_date BETWEEN ? AND ?
+		ORDER BY v.rowid
+	`);
+
+	// Matched segments of a word in one indexed join, when the DB has the
+	// normalized segments table (see preprocessing/scripts/migrate_segments.py).
+	hasSegmentsTable = !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'segments'").get();
+	stmtWordSegments = hasSegmentsTable && db.prepare(`
+		SELECT w.vid, s.start, s.text
+		FROM word_map w, postings(w.segment_indexes) p
+		JOIN segments s ON s.vid = w.vid AND s.idx = p.idx
+		WHERE w.word = ?
+		ORDER BY w.vid, s.idx
+	`);
+	stmtWordSegmentsInRange = hasSegmentsTable && db.prepare(`
+		SELECT w.vid, s.start, s.text
+		FROM word_map w, postings(w.segment_indexes) p
+		JOIN segments s ON s.vid = w.vid AND s.idx = p.idx
+		WHERE w.word = ? AND w.vid IN (SELECT vid FROM videos WHERE upload_date BETWEEN ? AND ?)
+		ORDER BY w.vid, s.idx
+	`);
+	// The same for a word and its near-spellings (a JSON array), each
+	// segment once.
+	stmtWordsSegments = hasSegmentsTable && db.prepare(`
+		SELECT DISTINCT w.vid, s.idx, s.start, s.text
+		FROM word_map w, postings(w.segment_indexes) p
+		JOIN segments s ON s.vid = w.vid AND s.idx = p.idx
+		WHERE w.word IN (SELECT value FROM json_each(?))
+			AND w.vid IN (SELECT vid FROM videos WHERE upload_date BETWEEN ? AND ?)
+		ORDER BY w.vid, s.idx
+	`);
+
+	// Mentions of a word per upload day, when the DB has them (build_db.py).
+	hasWordDaily = !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'word_daily'").get();
+	stmtWordDaily = hasWordDaily && db.prepare('SELECT day, count, videos FROM word_daily WHERE word = ? ORDER BY day').raw();
+
+	// Words under a word's symmetric-deletion keys (a JSON array), with
+	// their mentions, when the DB has them (build_db.py, see lib/fuzzy.js).
+	// Past the limit the most mentioned are kept, as fuzzy.py does.
+	stmtFuzzy = !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'fuzzy'").get() && db.prepare(`
+		SELECT DISTINCT f.word, t.mentions
+		FROM fuzzy f JOIN word_totals t ON t.word = f.word
+		WHERE f.key IN (SELECT value FROM json_each(?))
+		ORDER BY t.mentions DESC, f.word
+		LIMIT ?
+	`).raw();
+
+	// Autocomplete: the top words of short prefixes, precomputed by
+	// build_db.py; longer prefixes read word_totals by range.
+	const hasCompletions = !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'completions'").get();
+	stmtCompletions = hasCompletions && db.prepare('SELECT words FROM completions WHERE prefix = ?').pluck();
+	stmtCompletionScan = hasCompletions && db.prepare(`
+		SELECT word FROM word_totals
+		WHERE word >= ? AND word < ? AND mentions >= ?
+		ORDER BY mentions DESC, word
+		LIMIT ?
+	`).pluck();
+
+	// Phrase candidates from the FTS5 trigram index, when the DB has one.
+	hasFts = !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'videos_fts'").get();
+	stmtPhraseCandidates = hasFts && db.prepare(`
+		SELECT ${phraseColumns}
+		FROM videos_fts f JOIN videos v ON v.rowid = f.rowid
+		WHERE videos_fts MATCH ? AND v.upload_date BETWEEN ? AND ?
+		ORDER BY f.rowid
+	`);
+
+	stmtWordPage = db.prepare(`
+		SELECT w.vid, w.segment_indexes
+		FROM word_map w JOIN videos v ON v.vid = w.vid
+		WHERE w.word = ? AND ${afterCursor}
+		ORDER BY v.upload_date DESC, v.vid DESC
+		LIMIT ?
+	`);
+	stmtSegment = hasSegmentsTable && db.prepare('SELECT start, text FROM segments WHERE vid = ? AND idx = ?').raw();
+	stmtPhrasePageCandidates = hasFts && db.prepare(`
+		SELECT v.rowid
+		FROM videos_fts f JOIN videos v ON v.rowid = f.rowid
+		WHERE videos_fts MATCH ? AND ${afterCursor}
+		ORDER BY v.upload_date DESC, v.vid DESC
+	`).pluck();
+	stmtPhrasePageVideos = db.prepare(`
+		SELECT v.rowid FROM videos v
+		WHERE ${afterCursor}
+		ORDER BY v.upload_date DESC, v.vid DESC
+	`).pluck();
+	stmtPhraseRow = db.prepare(`SELECT ${phraseColumns} FROM videos v WHERE v.rowid = ?`);
 }
 
-// Cache updatedAt
-const updatedAt = db.prepare("SELECT value FROM info WHERE key = 'updatedAt'").get().value;
+// Cached from the DB, reloaded by checkVersion when info.updatedAt changes.
+let meta;       // small — vid, title, upload_date for all videos
+let metaJson;
+let videoDays;  // vid -> upload day as YYYYMMDD
+let dayRange;   // [ first, last ] upload day
+let updatedAt;
+let stmtResult; // precomputed results (preprocessing/scripts/materialize.py), if current
+let completionParams; // { prefix, count, minMentions } of the completions table
 
-// Prepared statements
-const stmtWordMap = db.prepare('SELECT vid, segment_indexes FROM word_map WHERE word = ?');
-const stmtSegments = db.prepare('SELECT segments FROM videos WHERE vid = ?');
-const stmtAllVideos = db.prepare('SELECT vid, full_text, idx_to_time FROM videos');
+function load() {
+	meta = {};
+	videoDays = {};
+	for (const row of db.prepare('SELECT vid, title, upload_date FROM videos').iterate()) {
+		const yyyymmdd = row.upload_date.toString();
+		videoDays[row.vid] = Number(yyyymmdd);
+		const year  = yyyymmdd.substring(0, 4);
+		const month = yyyymmdd.substring(4, 6);
+		const day   = yyyymmdd.substring(6, 8);
+		// UTC midnight, so the client reads back the same day in any time zone.
+		meta[row.vid] = {
+			title: row.title,
+			upload_date: new Date(Date.UTC(year, month - 1, day)),
+		};
+	}
+	metaJson = JSON.stringify(meta);
+	const allDays = Object.values(videoDays);
+	dayRange = allDays.length ? [Math.min(...allDays), Math.max(...allDays)] : [];
+	updatedAt = stmtUpdatedAt.get().value;
+
+	const resultsAt = db.prepare("SELECT value FROM info WHERE key = 'resultsUpdatedAt'").get();
+	const hasResults = resultsAt && resultsAt.value === updatedAt
+		&& !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'results'").get();
+	stmtResult = hasResults && db.prepare('SELECT segments, num_results, num_videos FROM results WHERE query = ?');
+
+	const completions = db.prepare("SELECT value FROM info WHERE key = 'completions'").get();
+	completionParams = stmtCompletions && completions && JSON.parse(completions.value);
+}
+open();
+load();
+
+// Serialized segments of recent queries, keyed by normalized query and range.
+const cache = new LRU((parseInt(process.env.RESULT_CACHE_MB) || 64) * 1024 * 1024);
+const cacheCounts = { hits: 0, precomputed: 0, misses: 0, invalidations: 0 };
+// Decompressed transcript columns of recently matched videos, keyed by column and vid.
+const transcriptCache = new LRU((parseInt(process.env.TRANSCRIPT_CACHE_MB) || 16) * 1024 * 1024);
+
+function checkVersion() {
+	const stat = fs.statSync(dbPath, { throwIfNoEntry: false });
+	if (stat && stat.ino !== dbIno) {
+		db.close();
+		open();
+	} else if (stmtUpdatedAt.get().value === updatedAt) {
+		return;
+	}
+	load();
+	cache.clear();
+	transcriptCache.clear();
+	cacheCounts.invalidations += 1;
+}
 
 // https://stackoverflow.com/questions/3446170/escape-string-for-use-in-javascript-regex
 function escapeRegExp(string) {
 	return string.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
 }
 
-function getWord(word) {
+// Trigrams need 3+ characters, and non-ASCII case folding may differ from the
+// regex 'i' flag, so those phrases still scan every video.
+function canUseFts(phrase) {
+	return stmtPhraseCandidates && [...phrase].length >= 3 && /^[\x00-\x7f]*$/.test(phrase);
+}
+
+// An FTS5 string: the whole phrase, matched as a substring by the trigram tokenizer.
+function ftsPhrase(phrase) {
+	return '"' + phrase.toLowerCase().replace(/"/g, '""') + '"';
+}
+
+function inRange(vid, range) {
+	const day = videoDays[vid];
+	return day >= range.from && day <= range.to;
+}
+
+// The word and its near-spellings in the vocabulary, the closest and most
+// mentioned first (at most fuzzy.js MAX_EXPANSIONS of them).
+function expand(word) {
+	word = word.toLowerCase();
+	if (!stmtFuzzy || !canExpand(word)) return [word];
+	const candidates = stmtFuzzy.all(JSON.stringify(deletes(word)), MAX_CANDIDATES);
+	return [word, ...rank(word, candidates).map(([near]) => near)];
+}
+
+// words: the word and its near-spellings to search for, from expand().
+function getWord(word, range = null, words = null) {
+	if (words && words.length > 1) {
+		const segmentData = {};
+		const { from, to } = range || ALL_DAYS;
+		for (const row of stmtWordsSegments.iterate(JSON.stringify(words), from, to)) {
+			(segmentData[row.vid] ||= []).push([row.start, row.text]);
+		}
+		return { word, segments: segmentData, meta, updatedAt };
+	}
+
+	if (stmtWordSegments) {
+		const segmentData = {};
+		const rows = range
+			? stmtWordSegmentsInRange.iterate(word.toLowerCase(), range.from, range.to)
+			: stmtWordSegments.iterate(word.toLowerCase());
+		for (const row of rows) {
+			(segmentData[row.vid] ||= []).push([row.start, row.text]);
+		}
+		return { word, segments: segmentData, meta, updatedAt };
+	}
+
 	const rows = stmtWordMap.all(word.toLowerCase());
 	const segmentData = {};
 
 	for (const row of rows) {
-		const indexes = JSON.parse(row.segment_indexes);
+		if (range && !inRange(row.vid, range)) continue;
+		const indexes = readPostings(row.segment_indexes);
 		const vidRow = stmtSegments.get(row.vid);
 		if (!vidRow) continue;
-		const allSegments = JSON.parse(vidRow.segments);
+		const allSegments = JSON.parse(transcript(row.vid, 'segments', vidRow.segments));
 		segmentData[row.vid] = allSegments.filter((x, i) => indexes.includes(i));
 	}
 
 	return { word, segments: segmentData, meta, updatedAt };
 }
 
-function getPhrase(phrase) {
+// A video's transcript column as text, decompressed at most once while cached.
+function transcript(vid, column, value) {
+	if (!Buffer.isBuffer(value)) return value;
+	const key = `${column}:${vid}`;
+	let text = transcriptCache.get(key);
+	if (text === undefined) {
+		text = decodeTranscript(value, dictionary);
+		transcriptCache.set(key, text, text.length);
+	}
+	return text;
+}
+
+// [startTime, text] of every match of regex in a video's full_text, or null.
+function phraseSegments(row, regex, phrase) {
+	const text = transcript(row.vid, 'full_text', row.full_text);
+	if (!text) return null;
+
+	const indices = Array.from(text.matchAll(regex)).map(m => m.index);
+	if (indices.length === 0) return null;
+
+	if (row.boundaries) {
+		const boundaries = decodeBoundaries(row.boundaries);
+		return indices.map(index => boundarySnippet(text, boundaries, index, phrase.length));
+	}
+
+	const idx_to_time = JSON.parse(transcript(row.vid, 'idx_to_time', row.idx_to_time));
+
+	return indices.map(index => {
+		let dec = 0;
+		while (index - dec > 0 && !((index - dec) in idx_to_time)) {
+			dec += 1;
+		}
+
+		let inc = phrase.length;
+		while (index + inc < text.length && !((index + inc) in idx_to_time)) {
+			inc += 1;
+		}
+
+		const startIndex = index - dec;
+		const endIndex = index + inc;
+
+		const startTime = idx_to_time[startIndex] || 0;
+		const segmentPhrase = text.substring(startIndex, endIndex).trim();
+
+		return [startTime, segmentPhrase];
+	});
+}
+
+function getPhrase(phrase, range = null) {
 	const regex = new RegExp(escapeRegExp(phrase), 'gi');
 	const segmentData = {};
+	const { from, to } = range || ALL_DAYS;
+
+	const rows = canUseFts(phrase)
+		? stmtPhraseCandidates.iterate(ftsPhrase(phrase), from, to)
+		: stmtAllVideos.iterate(from, to);
+
+	for (const row of rows) {
+		const segments = phraseSegments(row, regex, phrase);
+		if (segments) segmentData[row.vid] = segments;
+	}
 
-	for (const row of stmtAllVideos.iterate()) {
-		const text = row.full_text;
-		if (!text) continue;
+	return { word: phrase, segments: segmentData, meta, updatedAt };
+}
 
-		const indices = Array.from(text.matchAll(regex)).map(m => m.index);
-		if (indices.length === 0) continue;
+// Queries with the same results share a key: search ignores case, for
+// non-ASCII queries only as the regex 'i' flag does, so those are kept as is.
+// Same as normalize_query in preprocessing/scripts/materialize.py.
+function normalizeQuery(query) {
+	return /^[\x00-\x7f]*$/.test(query) ? query.toLowerCase() : query;
+}
 
-		const idx_to_time = JSON.parse(row.idx_to_time);
+function isPhrase(query) {
+	return query.trim().includes(' ');
+}
 
-		const segments = indices.map(index => {
-			let dec = 0;
-			while (index - dec > 0 && !((index - dec) in idx_to_time)) {
-				dec += 1;
-			}
+function search(query, range) {
+	return isPhrase(query) ? getPhrase(query, range) : getWord(query, range);
+}
 
-			let inc = phrase.length;
-			while (index + inc < text.length && !((index + inc) in idx_to_time)) {
-				inc += 1;
-			}
+function cacheKey(query, range, fuzzy) {
+	return normalizeQuery(query) + (range ? `\n${range.from}-${range.to}` : '') + (fuzzy ? '\nfuzzy' : '');
+}
 
-			const startIndex = index - dec;
-			const endIndex = index + inc;
+// Serialized segments and counts of a query from the LRU or the precomputed
+// results (which cover all days, without near-spellings), or null.
+function cached(query, range, fuzzy = false) {
+	const key = cacheKey(query, range, fuzzy);
+	let entry = cache.get(key);
+	if (entry) {
+		cacheCounts.hits += 1;
+		return entry;
+	}
+	const row = !range && !fuzzy && stmtResult && stmtResult.get(key);
+	if (!row) return null;
+	cacheCounts.precomputed += 1;
+	entry = { segments: row.segments, numResults: row.num_results, numVideos: row.num_videos };
+	cache.set(key, entry, entry.segments.length);
+	return entry;
+}
 
-			const startTime = idx_to_time[startIndex] || 0;
-			const segmentPhrase = text.substring(startIndex, endIndex).trim();
+// The same, searching when it is not cached. fuzzy: also match the
+// near-spellings of a word (listed in entry.expanded); phrases ignore it.
+function lookup(query, range, fuzzy = false) {
+	checkVersion();
+	fuzzy = fuzzy && !isPhrase(query);
+	let entry = cached(query, range, fuzzy);
+	if (entry) return entry;
 
-			return [startTime, segmentPhrase];
+	cacheCounts.misses += 1;
+	const words = fuzzy ? expand(query) : null;
+	const { segments } = words ? getWord(query, range, words) : search(query, range);
+	entry = {
+		segments: JSON.stringify(segments),
+		numResults: Object.values(segments).flat(1).length,
+		numVideos: Object.values(segments).length,
+		expanded: words ? words.slice(1) : undefined,
+	};
+	cache.set(cacheKey(query, range, fuzzy), entry, entry.segments.length);
+	return entry;
+}
+
+// The JSON response for a query: what res.json({ word, segments, meta,
+// updatedAt }) would send, plus `expanded` with fuzzy. range: { from, to }
+// upload days, or null.
+function getResults(query, range = null, fuzzy = false) {
+	const entry = lookup(query, range, fuzzy);
+	const expanded = entry.expanded ? `,"expanded":${JSON.stringify(entry.expanded)}` : '';
+	const body = `{"word":${JSON.stringify(query)},"segments":${entry.segments},"meta":${metaJson},"updatedAt":${JSON.stringify(updatedAt)}${expanded}}`;
+	return { body, numResults: entry.numResults, numVideos: entry.numVideos };
+}
+
+function isAfter(vid, cursor) {
+	const day = videoDays[vid];
+	return day < cursor.day || (day === cursor.day && vid < cursor.vid);
+}
+
+function byDateDescending(a, b) {
+	return videoDays[b] - videoDays[a] || (a < b ? 1 : a > b ? -1 : 0);
+}
+
+// A cached entry's videos newest first, [ [ vid, segments ] ]. Parsed once
+// and kept on the entry, so later pages and the histogram only slice it;
+// the entry then counts twice its serialized size in the LRU.
+function entryVideos(entry, key) {
+	if (!entry.videos) {
+		const segments = JSON.parse(entry.segments);
+		entry.videos = Object.keys(segments).sort(byDateDescending).map(vid => [vid, segments[vid]]);
+		cache.set(key, entry, entry.segments.length * 2);
+	}
+	return entry.videos;
+}
+
+// Index of the first of videos (newest first) after the cursor.
+function firstAfter(videos, cursor) {
+	let lo = 0;
+	let hi = videos.length;
+	while (lo < hi) {
+		const mid = (lo + hi) >>> 1;
+		if (isAfter(videos[mid][0], cursor)) hi = mid;
+		else lo = mid + 1;
+	}
+	return lo;
+}
+
+// Segments of a word in one video, the first `cap` if given.
+function wordSnippets(vid, indexes, cap) {
+	const shown = cap ? indexes.slice(0, cap) : indexes;
+	if (stmtSegment) return shown.map(idx => stmtSegment.get(vid, idx)).filter(Boolean);
+	const allSegments = JSON.parse(transcript(vid, 'segments', stmtSegments.get(vid).segments));
+	return shown.map(idx => allSegments[idx]).filter(Boolean);
+}
+
+// Up to n (or all, n < 0) [ vid, match count, segments(cap) ] of a query
+// after the cursor. Words page through word_map in SQL, a page of each of
+// `words` merged; phrases slice a cached result, or run the regex one video
+// at a time until the page is full.
+function pageVideos(query, range, cursor, n, words) {
+	const { from, to } = range || ALL_DAYS;
+	const bounds = [from, to, cursor.day, cursor.day, cursor.vid];
+
+	if (words) {
+		const byVid = new Map();
+		for (const word of words) {
+			for (const row of stmtWordPage.all(word, ...bounds, n)) {
+				const indexes = readPostings(row.segment_indexes);
+				const seen = byVid.get(row.vid);
+				byVid.set(row.vid, seen ? [...new Set([...seen, ...indexes])].sort((a, b) => a - b) : indexes);
+			}
+		}
+		const vids = [...byVid.keys()].sort(byDateDescending).slice(0, n < 0 ? undefined : n);
+		return vids.map(vid => {
+			const indexes = byVid.get(vid);
+			return [vid, indexes.length, cap => wordSnippets(vid, indexes, cap)];
 		});
+	}
 
-		if (segments.length > 0) segmentData[row.vid] = segments;
+	const entry = cached(query, range);
+	if (entry) {
+		const videos = entryVideos(entry, cacheKey(query, range));
+		const start = firstAfter(videos, cursor);
+		return videos.slice(start, n < 0 ? undefined : start + n)
+			.map(([vid, segments]) => [vid, segments.length, cap => segments.slice(0, cap || undefined)]);
 	}
 
-	return { word: phrase, segments: segmentData, meta, updatedAt };
+	const regex = new RegExp(escapeRegExp(query), 'gi');
+	const ids = canUseFts(query)
+		? stmtPhrasePageCandidates.iterate(ftsPhrase(query), ...bounds)
+		: stmtPhrasePageVideos.iterate(...bounds);
+	const videos = [];
+	for (const id of ids) {
+		const row = stmtPhraseRow.get(id);
+		const segments = phraseSegments(row, regex, query);
+		if (!segments) continue;
+		videos.push([row.vid, segments.length, cap => segments.slice(0, cap || undefined)]);
+		if (videos.length === n) break;
+	}
+	return videos;
+}
+
+// One page of results, newest videos first:
+// { word, segments, counts, meta, next, updatedAt }
+// counts holds every video's number of matches, segments at most `snippets`
+// of them; next is the cursor of the following page, or null. meta covers
+// every video, or with metaOnly just those on the page. With fuzzy, words
+// also match their near-spellings, listed in `expanded`.
+function getPage(query, range, { limit, cursor, snippets, metaOnly, fuzzy }) {
+	checkVersion();
+	const words = isPhrase(query) ? null : fuzzy ? expand(query) : [query.toLowerCase()];
+	const videos = pageVideos(query, range, cursor || FIRST_PAGE, limit ? limit + 1 : -1, words);
+	const more = limit && videos.length > limit;
+	if (more) videos.length = limit;
+
+	const segments = {};
+	const counts = {};
+	const pageMeta = {};
+	let numResults = 0;
+	for (const [vid, count, snippetsOf] of videos) {
+		segments[vid] = snippetsOf(snippets);
+		counts[vid] = count;
+		pageMeta[vid] = meta[vid];
+		numResults += count;
+	}
+	const last = videos[videos.length - 1];
+	const next = more ? `${videoDays[last[0]]}_${last[0]}` : null;
+
+	const expanded = fuzzy && words ? words.slice(1) : undefined;
+	const body = JSON.stringify({ word: query, segments, counts, meta: metaOnly ? pageMeta : meta, next, updatedAt, expanded });
+	return { body, numResults, numVideos: videos.length };
+}
+
+// Mentions per upload day, [ [ day, mentions, videos ] ] sorted by day, and
+// the first and last upload day of the corpus. Words read word_daily;
+// phrases and words with near-spellings (fuzzy) are counted from their
+// (cached) results. For words, mentions are the segments they appear in
+// (word_map.mentions); for phrases, the matches. The client labels them so.
+function getHistogram(query, fuzzy = false) {
+	checkVersion();
+	const expanded = fuzzy && !isPhrase(query) && expand(query).length > 1;
+	let days;
+	if (!isPhrase(query) && stmtWordDaily && !expanded) {
+		days = stmtWordDaily.all(query.toLowerCase());
+	} else {
+		const byDay = new Map();
+		const videos = entryVideos(lookup(query, null, expanded), cacheKey(query, null, expanded));
+		for (const [vid, matches] of videos) {
+			const day = videoDays[vid];
+			const counts = byDay.get(day) || [day, 0, 0];
+			counts[1] += matches.length;
+			counts[2] += 1;
+			byDay.set(day, counts);
+		}
+		days = [...byDay.values()].sort((a, b) => a[0] - b[0]);
+	}
+	return { word: query, days, range: dayRange, updatedAt };
+}
+
+// Longer prefixes cannot start a word worth completing.
+const MAX_PREFIX_LENGTH = 32;
+
+// Words starting with prefix, the most mentioned first, at most `limit`
+// (and the count build_db.py kept per prefix): one primary key lookup, or
+// for prefixes longer than the precomputed ones a range of word_totals.
+function getCompletions(prefix, limit) {
+	checkVersion();
+	prefix = prefix.toLowerCase();
+	const length = [...prefix].length;
+	let words = [];
+	if (completionParams && length <= MAX_PREFIX_LENGTH) {
+		if (length <= completionParams.prefix) {
+			const json = stmtCompletions.get(prefix);
+			words = json ? JSON.parse(json) : [];
+		} else {
+			words = stmtCompletionScan.all(prefix, prefix + '\u{10ffff}', completionParams.minMentions, completionParams.count);
+		}
+	}
+	return { prefix, words: words.slice(0, limit), updatedAt };
+}
+
+function getCacheStats() {
+	return {
+		...cacheCounts,
+		entries: cache.entries.size,
+		size: cache.size,
+		maxSize: cache.maxSize,
+		precomputedResults: !!stmtResult,
+		updatedAt,
+	};
 }
 
 module.exports = {
 	getWord,
 	getPhrase,
+	getResults,
+	getPage,
+	getHistogram,
+	getCompletions,
+	getCacheStats,
 };
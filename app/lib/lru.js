@@ -0,0 +1,42 @@
+// Least recently used cache bounded by the total size of its values.
+// A Map iterates in insertion order, so re-inserting an entry on every
+// get keeps the least recently used one first.
+
+class LRU {
+	constructor(maxSize) {
+		this.maxSize = maxSize;
+		this.size = 0;
+		this.entries = new Map();
+	}
+
+	get(key) {
+		const entry = this.entries.get(key);
+		if (entry === undefined) return undefined;
+		this.entries.delete(key);
+		this.entries.set(key, entry);
+		return entry.value;
+	}
+
+	set(key, value, size) {
+		if (size > this.maxSize) return;
+		const old = this.entries.get(key);
+		if (old !== undefined) {
+			this.size -= old.size;
+			this.entries.delete(key);
+		}
+		this.entries.set(key, { value, size });
+		this.size += size;
+		for (const [oldest, entry] of this.entries) {
+			if (this.size <= this.maxSize) break;
+			this.entries.delete(oldest);
+			this.size -= entry.size;
+		}
+	}
+
+	clear() {
+		this.entries.clear();
+		this.size = 0;
+	}
+}
+
+module.exports = { LRU };
@@ -0,0 +1,40 @@
+// Query string parameters of the search routes (routes/index.js).
+
+const MAX_PAGE = 100;
+
+// An upload day, YYYYMMDD, or null.
+function parseDay(value) {
+	return /^\d{8}$/.test(value) ? Number(value) : null;
+}
+
+// { from, to } upload days, inclusive, or null for all of them.
+function parseRange({ from, to }) {
+	from = parseDay(from);
+	to = parseDay(to);
+	if (from === null && to === null) return null;
+	return { from: from ?? 0, to: to ?? 99999999 };
+}
+
+function parseCount(value, max = Infinity) {
+	return /^\d+$/.test(value) && Number(value) > 0 ? Math.min(Number(value), max) : null;
+}
+
+// A cursor is `${upload day}_${vid}` of the last video of a page.
+function parseCursor(value) {
+	const m = /^(\d{8})_(.+)$/.exec(value || '');
+	return m ? { day: Number(m[1]), vid: m[2] } : null;
+}
+
+// The page options of getPage, or null for every match in one response.
+function parsePage(params) {
+	const page = {
+		limit: parseCount(params.limit, MAX_PAGE),
+		cursor: parseCursor(params.cursor),
+		snippets: parseCount(params.snippets),
+		metaOnly: params.meta === 'results',
+	};
+	if (!page.limit && !page.cursor && !page.snippets && !page.metaOnly) return null;
+	return page;
+}
+
+module.exports = { parseRange, parseCount, parseCursor, parsePage };
@@ -0,0 +1,49 @@
+// Posting-list codec, see preprocessing/scripts/postings.py.
+// Sorted segment indexes, stored as gaps written as LEB128 varints.
+
+function decodePostings(buf) {
+	const out = [];
+	let value = 0;
+	let scale = 1;
+	let prev = 0;
+	for (let i = 0; i < buf.length; i++) {
+		const byte = buf[i];
+		value += (byte & 0x7f) * scale;
+		if (byte & 0x80) {
+			scale *= 0x80;
+		} else {
+			prev += value;
+			out.push(prev);
+			value = 0;
+			scale = 1;
+		}
+	}
+	return out;
+}
+
+function encodePostings(indexes) {
+	const sorted = [...new Set(indexes)].sort((a, b) => a - b);
+	const out = [];
+	let prev = 0;
+	for (const idx of sorted) {
+		let gap = idx - prev;
+		prev = idx;
+		while (gap >= 0x80) {
+			out.push((gap % 0x80) | 0x80);
+			gap = Math.floor(gap / 0x80);
+		}
+		out.push(gap);
+	}
+	return Buffer.from(out);
+}
+
+// Databases built before the codec store JSON arrays as text.
+function readPostings(value) {
+	return typeof value === 'string' ? JSON.parse(value) : decodePostings(value);
+}
+
+module.exports = {
+	decodePostings,
+	encodePostings,
+	readPostings,
+};
@@ -0,0 +1,22 @@
+const zlib = require('zlib');
+
+// Decoder for the transcript columns of squeex.db (videos.segments,
+// full_text and idx_to_time), see preprocessing/scripts/transcripts.py:
+// raw deflate streams with a preset dictionary stored in the database.
+// Databases built before store them as TEXT, returned as they are.
+
+const DICTIONARY = 'transcripts';
+
+// The stored dictionary, or null for a database without one.
+function loadDictionary(db) {
+	const hasTable = !!db.prepare("SELECT 1 FROM sqlite_master WHERE name = 'dictionaries'").get();
+	const row = hasTable && db.prepare('SELECT data FROM dictionaries WHERE name = ?').get(DICTIONARY);
+	return row ? row.data : null;
+}
+
+function decodeTranscript(value, dictionary) {
+	if (!Buffer.isBuffer(value)) return value;
+	return zlib.inflateRawSync(value, { dictionary }).toString('utf8');
+}
+
+module.exports = { loadDictionary, decodeTranscript };
@@ -1,27 +1,52 @@
 var express = require('express');
 var router = express.Router();
-var { getWord, getPhrase } = require('../lib/get');
+var { getResults, getPage, getHistogram, getCompletions, getCacheStats } = require('../lib/get');
+var { parseRange, parseCount, parsePage } = require('../lib/params');
 
+const MAX_COMPLETIONS = 10;
 
-/* GET query */
+
+/* GET result cache counters */
+router.get('/stats/cache', function(req, res, next) {
+  return res.json(getCacheStats());
+});
+
+/* GET mentions per upload day */
+router.get('/histogram/:query', function(req, res, next) {
+  return res.json(getHistogram(req.params.query, req.query.fuzzy === '1'));
+});
+
+/* GET words starting with a prefix, most mentioned first (?limit=N, max 10) */
+router.get('/complete/:prefix', function(req, res, next) {
+  const limit = parseCount(req.query.limit, MAX_COMPLETIONS) || MAX_COMPLETIONS;
+  return res.json(getCompletions(req.params.prefix, limit));
+});
+
+/*
+ * GET query, optionally
+ *   ?from=YYYYMMDD&to=YYYYMMDD  upload days, inclusive
+ *   &limit=N                    videos per page, newest first (max 100)
+ *   &cursor=...                 the `next` of the previous page
+ *   &snippets=N                 segments per video, all of them are counted
+ *   &meta=results               meta of the videos on the page only
+ *   &fuzzy=1                    words also match their near-spellings,
+ *                               listed in `expanded`
+ * Without limit, cursor, snippets and meta, every match in one response.
+ */
 router.get('/:query', function(req, res, next) {
   const start = Date.now();
   const { query } = req.params;
 
-  // return res.json(getPhrase(query));
-  const hasSpace = query.trim().includes(' ');
-  const results = hasSpace ? getPhrase(query) : getWord(query);
-  let numResults = 0;
-  let numVideos = 0;
+  const range = parseRange(req.query);
+  const page = parsePage(req.query);
+  const fuzzy = req.query.fuzzy === '1';
+  const { body, numResults, numVideos } = page ? getPage(query, range, { ...page, fuzzy }) : getResults(query, range, fuzzy);
 
   // log some stats
-  if (results.segments) {
-    numVideos = Object.values(results.segments).length;
-    numResults = Object.values(results.segments).flat(1).length;
-  }
   const end = Date.now();
   logResults(end-start, query, numResults, numVideos);
-  return res.json(results);
+  res.type('json');
+  return res.send(body);
 });
 
 function logResults(timeTaken, query, numResults, numVideos) {
@@ -31,23 +31,53 @@ function sendHTTPRequest(type, url, jsonParams, { token, raw=false }={}) {
   return request;
 }
 
-function sendRequest(word) {
-  const url = HOST + '/' + word;
-  const request = sendHTTPRequest('GET', url, null);
+// Results come in pages of videos, newest first, with the first few
+// segments of each video.
+const PAGE_SIZE = 24;
+const SNIPPETS_PER_VIDEO = 20;
+
+// range: { from, to } upload days as YYYYMMDD, or null for all of them
+// cursor: the `next` of the previous page, or null for the first page
+function sendRequest(word, range, cursor) {
+  const params = new URLSearchParams({ limit: PAGE_SIZE, snippets: SNIPPETS_PER_VIDEO, meta: 'results' });
+  if (range) {
+    params.set('from', range.from);
+    params.set('to', range.to);
+  }
+  if (cursor) params.set('cursor', cursor);
+  if (fuzzyToggle.checked) params.set('fuzzy', 1);
+  const request = sendHTTPRequest('GET', HOST + '/' + word + '?' + params, null);
   return request;
 }
 
+// Mentions per upload day, for the chart
+function sendHistogramRequest(word) {
+  const params = fuzzyToggle.checked ? '?fuzzy=1' : '';
+  return sendHTTPRequest('GET', HOST + '/histogram/' + word + params, null);
+}
+
+// Most mentioned words starting with a prefix, for the datalist
+function sendCompleteRequest(prefix) {
+  return sendHTTPRequest('GET', HOST + '/complete/' + encodeURIComponent(prefix), null);
+}
+
 const vidContainerTemplate = qs('#template-video-container');
 const segmentTemplate = qs('#segment-template');
 const resultsContainer = qs('#results-container');
 const ctx = qs('#barchart');
+const fuzzyToggle = qs('#fuzzy-toggle input');
 const spinner = qs('#loading-spinner');
 const scrollLeftBtn = qs('.results-scroll.left');
 const scrollRightBtn = qs('.results-scroll.right');
 let chart;
 let currentWord = '';
-let chartDays = [];
-let chartVideoIds = []; // Maps bar index to array of video IDs for that date
+let expandedWords = []; // Near-spellings the results also match (fuzzy)
+let chartDays = []; // Maps bar index to its upload day (YYYYMMDD)
+let chartRange = null; // Upload days the results are filtered to
+let histogramDays = []; // [ [ day, mentions, videos ] ] of the current word
+let resultsRequest = 0; // Latest request, older responses are dropped
+let nextCursor = null; // Next (older) page of results, null after the last
+let loadingMore = false;
 let chartGlobalMin = null;
 let chartGlobalMax = null;
 let hoverDateX = null;
@@ -69,7 +99,7 @@ const hoverDatePlugin = {
     const dateVal = xScale.getValueForPixel(hoverDateX);
     if (!dateVal) return;
     const date = new Date(dateVal);
-    const label = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric', year: 'numeric' });
+    const label = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric', year: 'numeric', timeZone: 'UTC' });
     const ctx = chart.ctx;
     const colors = getChartColors();
     ctx.save();
@@ -107,17 +137,56 @@ function setupScrollButtons(container, leftBtn, rightBtn, scrollAmount) {
 
 const updateResultsScroll = setupScrollButtons(resultsContainer, scrollLeftBtn, scrollRightBtn, 320);
 
-function filterVideosByChartRange() {
+// Older videos are on the left: fetch the next page when scrolling near it
+resultsContainer.addEventListener('scroll', () => {
+  if (resultsContainer.scrollLeft < 640) loadMore();
+});
+
+function loadMore() {
+  if (!nextCursor || loadingMore) return Promise.resolve(false);
+  loadingMore = true;
+  const request = resultsRequest;
+  spinner.classList.add('active');
+  return sendRequest(currentWord, chartRange, nextCursor).then(res => {
+    loadingMore = false;
+    if (request !== resultsRequest) return false;
+    return handleResponse(res, true);
+  }).catch(err => {
+    loadingMore = false;
+    console.error('Search error:', err);
+    spinner.classList.remove('active');
+    return false;
+  });
+}
+
+// Load older pages until one has a video from this day
+function loadUntilDay(day) {
+  const cards = qsa(`.video-container[data-day="${day}"]`);
+  if (cards.length > 0 || !nextCursor) return Promise.resolve(cards);
+  return loadMore().then(loaded => loaded ? loadUntilDay(day) : cards);
+}
+
+// Reload the results for the visible part of the chart
+function filterResultsByChartRange() {
   if (!chart) return;
   const xScale = chart.scales.x;
   const visMin = xScale.min;
   const visMax = xScale.max;
-  resultsContainer.querySelectorAll('.video-container').forEach(card => {
-    const date = Number(card.getAttribute('data-upload-date'));
-    if (!date) return;
-    card.style.display = (date >= visMin && date <= visMax) ? '' : 'none';
+  const all = visMin <= chartGlobalMin.getTime() && visMax >= chartGlobalMax.getTime();
+  const range = all ? null : { from: timeToDay(visMin), to: timeToDay(visMax) };
+  if (JSON.stringify(range) === JSON.stringify(chartRange)) return;
+  chartRange = range;
+
+  const request = ++resultsRequest;
+  loadingMore = false;
+  spinner.classList.add('active');
+  sendRequest(currentWord, range).then(res => {
+    if (request !== resultsRequest) return;
+    if (handleResponse(res)) updateStats();
+  }).catch(err => {
+    console.error('Search error:', err);
+    spinner.classList.remove('active');
   });
-  updateResultsScroll();
 }
 
 // Suggestion scroll buttons
@@ -126,7 +195,24 @@ const sugScrollLeft = qs('.suggestions-scroll.left');
 const sugScrollRight = qs('.suggestions-scroll.right');
 const updateSuggestionsScroll = setupScrollButtons(suggestionsContainer, sugScrollLeft, sugScrollRight, 200);
 
-function handleResponse(res) {
+// What the counts count: the segments a word appears in, or the matches
+// of a phrase (see getHistogram in app/lib/get.js).
+function countUnit(count, word = currentWord) {
+  if (word.trim().includes(' ')) return count === 1 ? 'match' : 'matches';
+  return count === 1 ? 'segment' : 'segments';
+}
+
+// Totals come from the histogram, the results only hold a page of videos
+function updateStats() {
+  const days = histogramDays.filter(([day]) => !chartRange || (day >= chartRange.from && day <= chartRange.to));
+  const totalMentions = days.reduce((acc, [day, mentions]) => acc + mentions, 0);
+  const videoCount = days.reduce((acc, [day, mentions, videos]) => acc + videos, 0);
+  const also = expandedWords.length ? ` (with ${expandedWords.join(', ')})` : '';
+  qs('#stats-main').innerHTML = `<span class="stats-word">${currentWord}</span> <strong>${totalMentions}</strong> ${countUnit(totalMentions)} across <strong>${videoCount}</strong> videos${also}`;
+}
+
+// Render a page of results; append adds an older page on the left.
+function handleResponse(res, append = false) {
   spinner.classList.remove('active');
   let parsed;
   try {
@@ -137,39 +223,36 @@ function handleResponse(res) {
     info += `Queries can only contain dictionary words (try squeaks instead of squeex). `;
     qs('#info-message').innerText = info;
     console.log(error);
-    return;
+    return false;
   }
-  const { word, segments, meta, updatedAt } = parsed;
+  const { word, segments, counts, meta, next, updatedAt, expanded } = parsed;
 
   if (!word) {
     let info = `No results for "${qs('input').value}". `;
     info += `Common words and swears (decided by YT) are excluded.`;
     qs('#info-message').innerText = info;
     qs('#search-stats').classList.remove('visible');
-    return;
+    return false;
   }
 
   currentWord = word;
+  expandedWords = expanded || [];
+  nextCursor = next;
 
   // Show when data was last updated
-  const totalMentions = Object.values(segments).reduce((acc, vidSegments) => {
-    return acc + vidSegments.reduce((acc, [time, text]) => {
-      return acc + (text.match(new RegExp(escapeRegExp(word), 'ig')) || []).length;
-    }, 0)
-  }, 0);
   qs('#info-message').innerText = '';
-  const statsMain = qs('#stats-main');
-  const statsUpdated = qs('#stats-updated');
-  const videoCount = Object.keys(segments).length;
-  statsMain.innerHTML = `<span class="stats-word">${word}</span> <strong>${totalMentions}</strong> mentions across <strong>${videoCount}</strong> videos`;
-  statsUpdated.textContent = `Updated ${formatDate(updatedAt)}`;
+  qs('#stats-updated').textContent = `Updated ${formatDate(updatedAt)}`;
   qs('#search-stats').classList.add('visible');
 
   // Empty out the results container.
-  Array.from(resultsContainer.childNodes).forEach(n => {
-    if (n.id === 'template-video-container') return;
-    n.remove();
-  })
+  if (!append) {
+    Array.from(resultsContainer.childNodes).forEach(n => {
+      if (n.id === 'template-video-container') return;
+      n.remove();
+    })
+  }
+
+  const highlight = new RegExp(`(${[currentWord, ...expandedWords].map(escapeRegExp).join('|')})`, 'gi');
 
   // Sort segments by date (oldest first, left to right)
   const segmentEntries = Object.entries(segments);
@@ -179,7 +262,7 @@ function handleResponse(res) {
     return aDate.getTime() - bDate.getTime();
   });
 
-  segmentEntries.forEach(([id, vidSegments]) => {
+  const cards = segmentEntries.map(([id, vidSegments]) => {
     const vidContainer = vidContainerTemplate.cloneNode(true);
     vidContainer.removeAttribute('id');
 
@@ -188,6 +271,7 @@ function handleResponse(res) {
     // Add video ID and date for chart click navigation and filtering
     vidContainer.setAttribute('data-video-id', id);
     vidContainer.setAttribute('data-upload-date', new Date(upload_date).getTime());
+    vidContainer.setAttribute('data-day', timeToDay(new Date(upload_date).getTime()));
 
     // Thumbnail
     const thumbLink = qs('.video-thumbnail', vidContainer);
@@ -203,9 +287,9 @@ function handleResponse(res) {
     titleNode.innerText = title;
     titleNode.setAttribute('title', title);
     titleNode.setAttribute('href', `https://youtube.com/watch?v=${id}`);
-    uploadNode.innerText = formatDate(upload_date);
-    const count = vidSegments.length;
-    mentionNode.innerText = `${count} mention${count !== 1 ? 's' : ''}`;
+    uploadNode.innerText = formatDay(upload_date);
+    const count = counts[id];
+    mentionNode.innerText = `${count} ${countUnit(count)}`;
 
     const segsContainer = qs('.segments-container', vidContainer);
     vidSegments.forEach(segment => {
@@ -217,55 +301,56 @@ function handleResponse(res) {
 
       aNode.setAttribute('href', `https://youtube.com/watch?v=${id}&t=${t}`);
       // Highlight matching word
-      const highlighted = text.replace(
-        new RegExp(`(${escapeRegExp(currentWord)})`, 'gi'),
-        '<mark>$1</mark>'
-      );
+      const highlighted = text.replace(highlight, '<mark>$1</mark>');
       aNode.innerHTML = `${startTime}: ${highlighted}`;
       segsContainer.append(segNode);
     });
 
-    resultsContainer.append(vidContainer);
+    // Segments past the first few are left to YouTube
+    if (count > vidSegments.length) {
+      const segNode = segmentTemplate.cloneNode(true);
+      segNode.removeAttribute('id');
+      const aNode = qs('a', segNode);
+      aNode.setAttribute('href', `https://youtube.com/watch?v=${id}`);
+      aNode.innerText = `+${count - vidSegments.length} more`;
+      segsContainer.append(segNode);
+    }
+
+    return vidContainer;
   });
 
-  requestAnimationFrame(() => {
-    resultsContainer.scrollLeft = resultsContainer.scrollWidth;
+  // Keep the visible cards in place when older ones are added on the left
+  const fromRight = resultsContainer.scrollWidth - resultsContainer.scrollLeft;
+  resultsContainer.prepend(...cards);
+  if (append) {
+    resultsContainer.scrollLeft = resultsContainer.scrollWidth - fromRight;
     updateResultsScroll();
-  });
+  } else {
+    requestAnimationFrame(() => {
+      resultsContainer.scrollLeft = resultsContainer.scrollWidth;
+      updateResultsScroll();
+    });
+  }
+  return true;
+}
 
-  // Chart - aggregate by video upload date with fixed x-axis range
+// Chart - mentions per upload day (from /histogram) with fixed x-axis range
+function renderChart(histogram) {
+  const { word, days, range } = histogram;
+  histogramDays = days;
   if (chart) { chart.destroy(); hoverDateX = null; }
 
-  // Compute global date range from all videos
-  const allDates = Object.values(meta).map(m => new Date(m.upload_date).getTime());
-  const globalMin = new Date(Math.min(...allDates));
-  const globalMax = new Date(Math.max(...allDates));
+  // Global date range of all videos
+  const globalMin = dayToDate(range[0]);
+  const globalMax = dayToDate(range[1]);
   // Add a small buffer so edge bars aren't clipped
-  globalMin.setDate(globalMin.getDate() - 7);
-  globalMax.setDate(globalMax.getDate() + 7);
+  globalMin.setUTCDate(globalMin.getUTCDate() - 7);
+  globalMax.setUTCDate(globalMax.getUTCDate() + 7);
   chartGlobalMin = globalMin;
   chartGlobalMax = globalMax;
 
-  // Aggregate mentions by upload date
-  const chartData = {};
-  Object.entries(segments).forEach(([id, vidSegments]) => {
-    const { upload_date } = meta[id];
-    const date = new Date(upload_date);
-    const key = date.toISOString().slice(0, 10); // YYYY-MM-DD
-    if (!chartData[key]) {
-      chartData[key] = { count: 0, date, ids: [] };
-    }
-    chartData[key].count += vidSegments.length;
-    chartData[key].ids.push(id);
-  });
-
-  // Build {x, y} data sorted by date
-  const sortedEntries = Object.entries(chartData).sort((a, b) => {
-    return a[1].date.getTime() - b[1].date.getTime();
-  });
-
-  const data = sortedEntries.map(([, { count, date }]) => ({ x: date, y: count }));
-  chartVideoIds = sortedEntries.map(([, { ids }]) => ids);
+  const data = days.map(([day, count]) => ({ x: dayToDate(day), y: count }));
+  chartDays = days.map(([day]) => day);
 
   const colors = getChartColors();
   chart = new Chart(ctx, {
@@ -273,7 +358,7 @@ function handleResponse(res) {
     plugins: [hoverDatePlugin],
     data: {
       datasets: [{
-        label: `Mentions of '${word}'`,
+        label: `${countUnit(2, word)} with '${word}' per upload day`,
         data,
         backgroundColor: colors.bar,
         hoverBackgroundColor: colors.barHover,
@@ -297,27 +382,21 @@ function handleResponse(res) {
       onClick: (event, elements) => {
         if (elements.length > 0) {
           const dataIndex = elements[0].index;
-          const videoIds = chartVideoIds[dataIndex];
-          if (videoIds && videoIds.length > 0) {
-            const firstId = videoIds[0];
-            const target = qs(`.video-container[data-video-id="${firstId}"]`);
-            if (target) {
-              // Scroll the horizontal container to show the card
-              const containerRect = resultsContainer.getBoundingClientRect();
-              const targetRect = target.getBoundingClientRect();
-              const scrollOffset = targetRect.left - containerRect.left - (containerRect.width / 2 - targetRect.width / 2);
-              resultsContainer.scrollBy({ left: scrollOffset, behavior: 'smooth' });
-              // Also scroll the page to the results area
-              qs('#results-wrapper').scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-              videoIds.forEach(id => {
-                const card = qs(`.video-container[data-video-id="${id}"]`);
-                if (card) {
-                  card.classList.add('highlight');
-                  setTimeout(() => card.classList.remove('highlight'), 2500);
-                }
-              });
-            }
-          }
+          loadUntilDay(chartDays[dataIndex]).then(cards => {
+            if (cards.length === 0) return;
+            const target = cards[0];
+            // Scroll the horizontal container to show the card
+            const containerRect = resultsContainer.getBoundingClientRect();
+            const targetRect = target.getBoundingClientRect();
+            const scrollOffset = targetRect.left - containerRect.left - (containerRect.width / 2 - targetRect.width / 2);
+            resultsContainer.scrollBy({ left: scrollOffset, behavior: 'smooth' });
+            // Also scroll the page to the results area
+            qs('#results-wrapper').scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+            cards.forEach(card => {
+              card.classList.add('highlight');
+              setTimeout(() => card.classList.remove('highlight'), 2500);
+            });
+          });
         }
       },
       plugins: {
@@ -326,7 +405,7 @@ function handleResponse(res) {
           zoom: {
             drag: { enabled: true, backgroundColor: 'rgba(90, 103, 216, 0.15)', borderColor: 'rgba(90, 103, 216, 0.4)', borderWidth: 1 },
             mode: 'x',
-            onZoomComplete: () => { updateRangeButtons(); filterVideosByChartRange(); }
+            onZoomComplete: () => { updateRangeButtons(); filterResultsByChartRange(); }
           },
           limits: {
             x: { min: globalMin.getTime(), max: globalMax.getTime() }
@@ -340,7 +419,7 @@ function handleResponse(res) {
           cornerRadius: 8,
           displayColors: false,
           callbacks: {
-            label: (item) => `${item.raw.y} mention${item.raw.y !== 1 ? 's' : ''} — click to jump`
+            label: (item) => `${item.raw.y} ${countUnit(item.raw.y, word)} — click to jump`
           }
         }
       },
@@ -364,7 +443,7 @@ function handleResponse(res) {
             font: { size: 10 },
             callback(value) {
               const d = new Date(value);
-              return d.toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
+              return d.toLocaleDateString('en-US', { month: 'short', year: 'numeric', timeZone: 'UTC' });
             }
           },
           afterBuildTicks(axis) {
@@ -374,10 +453,10 @@ function handleResponse(res) {
             const ticks = [{ value: min }];
             // Add Jan 1 of each year, skip if too close to min/max
             const minBuffer = range * 0.08;
-            const startYear = new Date(min).getFullYear() + 1;
-            const endYear = new Date(max).getFullYear();
+            const startYear = new Date(min).getUTCFullYear() + 1;
+            const endYear = new Date(max).getUTCFullYear();
             for (let y = startYear; y <= endYear; y++) {
-              const jan1 = new Date(y, 0, 1).getTime();
+              const jan1 = Date.UTC(y, 0, 1);
               if (jan1 - min > minBuffer && max - jan1 > minBuffer) {
                 ticks.push({ value: jan1 });
               }
@@ -438,6 +517,12 @@ function formatDate(date) {
   return formatter.format(date);
 }
 
+// Upload dates are days, sent as UTC midnight.
+const dayFormatter = new Intl.DateTimeFormat(undefined, { timeZone: 'UTC' });
+function formatDay(date) {
+  return dayFormatter.format(new Date(date));
+}
+
 function dateToDay(date) {
   date.setHours(0);
   date.setMinutes(0);
@@ -445,6 +530,16 @@ function dateToDay(date) {
   return date;
 }
 
+// YYYYMMDD <-> the UTC midnight upload dates are sent as
+function dayToDate(day) {
+  return new Date(Date.UTC(Math.floor(day / 10000), Math.floor(day / 100) % 100 - 1, day % 100));
+}
+
+function timeToDay(time) {
+  const iso = new Date(time).toISOString();
+  return Number(iso.slice(0, 4) + iso.slice(5, 7) + iso.slice(8, 10));
+}
+
 function getDays(start, end) {
   dateToDay(start);
   dateToDay(end);
@@ -475,8 +570,15 @@ function doSearch(term) {
   spinner.classList.add('active');
   qs('#info-message').innerText = '';
   input.value = term;
-  sendRequest(term).then(res => {
-    handleResponse(res);
+  chartRange = null;
+  const request = ++resultsRequest;
+  loadingMore = false;
+  Promise.all([sendRequest(term), sendHistogramRequest(term)]).then(([res, histogram]) => {
+    if (request !== resultsRequest) return;
+    if (handleResponse(res)) {
+      renderChart(JSON.parse(histogram));
+      updateStats();
+    }
   }).catch(err => {
     console.error('Search error:', err);
     spinner.classList.remove('active');
@@ -491,6 +593,34 @@ input.addEventListener('keyup', e => {
   }
 });
 
+// Complete the word being typed; earlier words of a phrase are kept
+const completionList = qs('#completions');
+let completeRequest = 0;
+input.addEventListener('input', () => {
+  const value = input.value;
+  const last = /\S+$/.exec(value);
+  const request = ++completeRequest;
+  if (!last) {
+    completionList.replaceChildren();
+    return;
+  }
+  const head = value.slice(0, last.index);
+  sendCompleteRequest(last[0]).then(res => {
+    if (request !== completeRequest) return;
+    const options = JSON.parse(res).words.map(word => {
+      const option = document.createElement('option');
+      option.value = head + word;
+      return option;
+    });
+    completionList.replaceChildren(...options);
+  }).catch(err => console.error('Autocomplete error:', err));
+});
+
+// Search again with or without the near-spellings
+fuzzyToggle.addEventListener('change', () => {
+  if (currentWord) doSearch(currentWord);
+});
+
 // URL param support
 function getQueryParam() {
   const params = new URLSearchParams(window.location.search);
@@ -592,16 +722,16 @@ function setChartRange(range) {
   rangeBtns.forEach(b => b.classList.toggle('active', b.dataset.range === range));
   if (range === 'all') {
     chart.resetZoom();
-    filterVideosByChartRange();
+    filterResultsByChartRange();
     return;
   }
   const max = new Date(chartGlobalMax);
   const min = new Date(chartGlobalMax);
-  if (range === '3m') min.setMonth(min.getMonth() - 3);
-  else if (range === '6m') min.setMonth(min.getMonth() - 6);
-  else if (range === '1y') min.setFullYear(min.getFullYear() - 1);
+  if (range === '3m') min.setUTCMonth(min.getUTCMonth() - 3);
+  else if (range === '6m') min.setUTCMonth(min.getUTCMonth() - 6);
+  else if (range === '1y') min.setUTCFullYear(min.getUTCFullYear() - 1);
   chart.zoomScale('x', { min: min.getTime(), max: max.getTime() });
-  filterVideosByChartRange();
+  filterResultsByChartRange();
 }
 
 rangeBtns.forEach(btn => {
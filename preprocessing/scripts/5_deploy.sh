@@ -1,5 +1,20 @@
 #!/bin/bash
 set -e
 
-# Production
-scp data/squeex.db lightsail:/home/ec2-user/github/SqueexVodSearch/app/data/squeex.db
+# Production: send the delta package of this refresh and apply it there
+# (scripts/delta.py apply checks the base version and swaps the new file
+# in, the server reopens it). Without a package, or when production is not
+# at its base version, send the whole database and swap it in.
+REMOTE=lightsail
+REMOTE_DIR=/home/ec2-user/github/SqueexVodSearch
+
+if [ -f data/deltas/latest ]; then
+  package=data/deltas/$(cat data/deltas/latest)
+  scp "$package" $REMOTE:/tmp/
+  if ssh $REMOTE "cd $REMOTE_DIR/preprocessing && python3 scripts/delta.py apply /tmp/$(basename $package)"; then
+    exit 0
+  fi
+fi
+
+scp data/squeex.db $REMOTE:$REMOTE_DIR/app/data/squeex.db.new
+ssh $REMOTE "cd $REMOTE_DIR/preprocessing && python3 scripts/delta.py install ../app/data/squeex.db.new && rm ../app/data/squeex.db.new"
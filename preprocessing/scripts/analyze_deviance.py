@@ -4,77 +4,51 @@ standard English. Uses log-ratio of observed frequency vs expected
 frequency from a general English word frequency list.
 
 Downloads a public word frequency list (based on Google's Trillion Word
-Corpus) for the English baseline — no nltk required.
+Corpus) for the English baseline — no nltk required. --freq-file reads a
+local copy instead, so the script can run offline.
 
 Outputs the top N words ranked by "deviance":
     deviance = log2( squeex_freq / english_freq )
 
+Term counts are read from the SQLite database (app/data/squeex.db): the
+word_map posting lists are streamed in rowid order, which is the order
+the words were added to the corpus, and counted per word into NumPy
+arrays. Bigrams are counted one transcript at a time from videos.full_text.
+
+With --stats the counts come from the term_stats.py sidecar instead,
+which keeps per-word totals up to date as videos are added, so nothing
+is recounted.
+
 Usage:
     python3 preprocessing/scripts/analyze_deviance.py
+    python3 preprocessing/scripts/analyze_deviance.py --db data/squeex.db --freq-file count_1w.txt
+    python3 preprocessing/scripts/analyze_deviance.py --stats preprocessing/data/term_stats.db
 """
 
 import json
-import math
-import urllib.request
 import os
+import sqlite3
+import argparse
+import urllib.request
 from collections import Counter
 
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-REPO_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
-
-# ---------------------------------------------------------------------------
-# 1. Load Squeex word_map from the final data
-# ---------------------------------------------------------------------------
-DATA_PATH = os.path.join(REPO_ROOT, 'app', 'data', 'squeex.json')
-
-with open(DATA_PATH) as f:
-    data = json.load(f)
+import numpy as np
 
-word_map = data['word_map']
+import term_stats
+import transcripts
 
-# Count total mentions per word (sum of segment appearances across all videos)
-squeex_counts = Counter()
-for word, vids in word_map.items():
-    for vid, seg_indexes in vids.items():
-        squeex_counts[word] += len(seg_indexes)
-
-squeex_total = sum(squeex_counts.values())
-print(f"Squeex corpus: {len(squeex_counts)} unique words, {squeex_total} total mentions")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
 
-# ---------------------------------------------------------------------------
-# 2. Build English frequency baseline
-#    Source: https://norvig.com/ngrams/count_1w.txt (Peter Norvig / Google)
-# ---------------------------------------------------------------------------
+DB_PATH = os.path.join(REPO_ROOT, 'app', 'data', 'squeex.db')
+OUT_PATH = os.path.join(REPO_ROOT, 'suggestions.json')
 FREQ_CACHE = os.path.join(SCRIPT_DIR, 'english_freq_cache.txt')
 FREQ_URL = 'https://norvig.com/ngrams/count_1w.txt'
 
-if not os.path.exists(FREQ_CACHE):
-    print(f"Downloading English word frequencies from {FREQ_URL} ...")
-    urllib.request.urlretrieve(FREQ_URL, FREQ_CACHE)
-    print("Done.")
-
-english_counts = Counter()
-with open(FREQ_CACHE) as f:
-    for line in f:
-        parts = line.strip().split('\t')
-        if len(parts) == 2:
-            word, count = parts[0].lower(), int(parts[1])
-            english_counts[word] = count
-
-english_total = sum(english_counts.values())
-print(f"English corpus (Norvig/Google): {len(english_counts)} unique words, {english_total} total words")
+BATCH_SIZE = 100000
 
-# ---------------------------------------------------------------------------
-# 3. Compute deviance for each word
-#
-#    deviance = log2( squeex_freq / english_freq )
-#
-#    For words not in English corpus, use a smoothed frequency so they
-#    rank high but don't cause division by zero.
-# ---------------------------------------------------------------------------
 MIN_SQUEEX_MENTIONS = 10
 MIN_WORD_LENGTH = 4
-SMOOTHED_ENGLISH_FREQ = 0.5 / english_total
 
 # Words to skip — subtitle artifacts, misspellings, fragments
 BLOCKLIST = {
@@ -86,66 +60,7 @@ BLOCKLIST = {
     'uhuh', 'yaho', 'asmin', 'ellm', 'grber', 'hased', 'pbus',
 }
 
-results = []
-for word, count in squeex_counts.items():
-    if count < MIN_SQUEEX_MENTIONS:
-        continue
-    if len(word) < MIN_WORD_LENGTH:
-        continue
-    if not word.isalpha():
-        continue
-    if word in BLOCKLIST:
-        continue
-
-    squeex_freq = count / squeex_total
-    if word in english_counts:
-        english_freq = english_counts[word] / english_total
-    else:
-        english_freq = SMOOTHED_ENGLISH_FREQ
-
-    deviance = math.log2(squeex_freq / english_freq)
-    results.append((word, deviance, count, squeex_freq, english_freq))
-
-results.sort(key=lambda x: x[1], reverse=True)
-
-# ---------------------------------------------------------------------------
-# 4. Output
-# ---------------------------------------------------------------------------
-print(f"\n{'RANK':<6} {'WORD':<20} {'DEVIANCE':>10} {'SQUEEX #':>10} {'SQUEEX %':>10} {'ENGLISH %':>10}")
-print("-" * 70)
-for i, (word, dev, count, sf, ef) in enumerate(results[:80]):
-    print(f"{i+1:<6} {word:<20} {dev:>10.2f} {count:>10} {sf*100:>9.4f}% {ef*100:>9.6f}%")
-
-# ---------------------------------------------------------------------------
-# 5. Phrase analysis (bigrams from full text data)
-# ---------------------------------------------------------------------------
-import re
-from datetime import datetime
-
-FULL_PATH = os.path.join(REPO_ROOT, 'app', 'data', 'squeex_full.json')
-meta = data['meta']
-
-bigram_counts = Counter()
-try:
-    with open(FULL_PATH) as f:
-        full_data = json.load(f)
-
-    for vid, vid_data in full_data.items():
-        text = vid_data.get('text', '')
-        words = re.findall(r'[a-z]+', text.lower())
-        for i in range(len(words) - 1):
-            a, b = words[i], words[i + 1]
-            if len(a) < 3 or len(b) < 3:
-                continue
-            bigram_counts[f"{a} {b}"] += 1
-except Exception as e:
-    print(f"Skipping phrase analysis: {e}")
-    full_data = {}
-
-# Filter bigrams: keep only those where at least one word is "deviant"
-# (i.e., appears in our top results), making phrases Squeex-specific
 MIN_BIGRAM_COUNT = 20
-deviant_words = set(w for w, *_ in results[:200])
 
 # Also skip phrases where both words are very common English
 COMMON_WORDS = {
@@ -160,130 +75,289 @@ COMMON_WORDS = {
     'think', 'said', 'way', 'come', 'take', 'make', 'look', 'see',
 }
 
-# Score bigrams: boost if either word is deviant (Squeex-specific)
-scored_phrases = []
-for bg, c in bigram_counts.most_common(5000):
-    if c < MIN_BIGRAM_COUNT:
-        continue
-    words = bg.split()
-    if any(w in BLOCKLIST for w in words):
-        continue
-    if all(w in COMMON_WORDS for w in words):
-        continue
-    # Skip truncated contractions (don, didn, wasn, etc.)
-    if any(w in {'don', 'didn', 'wasn', 'isn', 'won', 'doesn', 'couldn', 'wouldn', 'shouldn', 'hasn', 'aren', 'weren', 'ain', 'let'} for w in words):
-        continue
-    # Skip if any word is too short or both words are the same
-    if any(len(w) < 3 for w in words):
-        continue
-    if words[0] == words[1]:
-        continue
-    # Score: heavily favor phrases with Squeex-specific words
-    # A word is "specific" if it's not in the top 5000 English words
-    specific = sum(1 for w in words if english_counts.get(w, 0) < english_total * 0.00001)
-    if specific == 0:
-        continue  # Skip if both words are common English
-    score = c * (100 ** specific)
-    scored_phrases.append((bg, c, score))
-
-scored_phrases.sort(key=lambda x: x[2], reverse=True)
-
-# Deduplicate similar phrases (match on first 2 chars of each word)
-seen_phrase_keys = set()
-top_phrases = []
-for bg, c, _ in scored_phrases:
-    key = tuple(sorted(w[:2] for w in bg.split()))
-    if key in seen_phrase_keys:
-        continue
-    seen_phrase_keys.add(key)
-    top_phrases.append((bg, c))
-    if len(top_phrases) >= 30:
-        break
-
-if top_phrases:
-    print(f"\nTop phrases:")
-    for i, (phrase, count) in enumerate(top_phrases[:15]):
-        print(f"  {i+1}. '{phrase}' ({count})")
+# Truncated contractions (don, didn, wasn, etc.)
+CONTRACTIONS = {'don', 'didn', 'wasn', 'isn', 'won', 'doesn', 'couldn', 'wouldn', 'shouldn', 'hasn', 'aren', 'weren', 'ain', 'let'}
+
 
 # ---------------------------------------------------------------------------
-# 6. Trending analysis — words more common in recent VODs vs older ones
+# 1. Load Squeex term counts from the database
 # ---------------------------------------------------------------------------
-# Split videos into recent half and older half by upload date
-vid_dates = {}
-for vid, m in meta.items():
-    try:
-        d = m['upload_date']
-        if isinstance(d, int):
-            ds = str(d)
-            vid_dates[vid] = datetime(int(ds[:4]), int(ds[4:6]), int(ds[6:8]))
-        else:
-            vid_dates[vid] = datetime.fromisoformat(str(d))
-    except:
-        pass
-
-if vid_dates:
-    sorted_vids = sorted(vid_dates.items(), key=lambda x: x[1])
-    midpoint = len(sorted_vids) // 2
-    old_vids = set(v for v, _ in sorted_vids[:midpoint])
-    new_vids = set(v for v, _ in sorted_vids[midpoint:])
-
-    old_counts = Counter()
-    new_counts = Counter()
-    for word, vids in word_map.items():
-        for vid, seg_indexes in vids.items():
-            if vid in old_vids:
-                old_counts[word] += len(seg_indexes)
-            elif vid in new_vids:
-                new_counts[word] += len(seg_indexes)
-
-    old_total = max(sum(old_counts.values()), 1)
-    new_total = max(sum(new_counts.values()), 1)
+def load_halves(conn):
+    """{ vid: 1 (older half) or 2 (recent half) } by upload date."""
+    return term_stats.split_halves(conn.execute('SELECT vid, upload_date FROM videos ORDER BY rowid').fetchall())
+
+
+def grow(counts, size):
+    if len(counts) < size:
+        counts = np.concatenate([counts, np.zeros(size - len(counts))])
+    return counts
+
+
+def load_term_counts(conn, halves):
+    """
+    Mentions per word (segments it appears in, summed over videos), in
+    total and within the old / new halves. Returns (words, total, old,
+    new) with the words in corpus order and int64 count arrays.
+    """
+    row = conn.execute("SELECT value FROM info WHERE key = 'postings'").fetchone()
+    if row is None or row[0] != 'varint':
+        raise SystemExit('word_map postings are not varint encoded, rebuild the database with build_db.py')
+
+    word_ids = {}
+    total = old = new = np.zeros(0)
+    cur = conn.execute('SELECT word, vid, segment_indexes FROM word_map ORDER BY rowid')
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        ids = np.fromiter((word_ids.setdefault(word, len(word_ids)) for word, _, _ in rows), np.int64, len(rows))
+        groups = np.fromiter((halves.get(vid, 0) for _, vid, _ in rows), np.int8, len(rows))
+
+        # A posting list holds one varint per segment; every varint ends
+        # with a byte below 0x80.
+        blobs = [ blob for _, _, blob in rows ]
+        lengths = np.fromiter(map(len, blobs), np.int64, len(blobs))
+        ends = np.frombuffer(b''.join(blobs), np.uint8) < 0x80
+        counts = np.add.reduceat(ends, np.cumsum(lengths) - lengths, dtype=np.int64)
+
+        n = len(word_ids)
+        total = grow(total, n) + np.bincount(ids, weights=counts, minlength=n)
+        old = grow(old, n) + np.bincount(ids[groups == 1], weights=counts[groups == 1], minlength=n)
+        new = grow(new, n) + np.bincount(ids[groups == 2], weights=counts[groups == 2], minlength=n)
+
+    words = list(word_ids)
+    return words, total.astype(np.int64), old.astype(np.int64), new.astype(np.int64)
+
+
+def load_stats(stats_path):
+    """
+    The same counts from the term_stats.py sidecar, plus whether any video
+    has an upload date and the 5000 most common bigrams.
+    """
+    conn = sqlite3.connect(f'file:{stats_path}?mode=ro', uri=True)
+    rows = conn.execute('SELECT word, total, old, new FROM words ORDER BY pos').fetchall()
+    words = [ word for word, *_ in rows ]
+    total, old, new = (np.array([ row[i] for row in rows ], np.int64) for i in (1, 2, 3))
+    dated = conn.execute('SELECT 1 FROM videos WHERE half != 0 LIMIT 1').fetchone() is not None
+    top_bigrams = conn.execute('SELECT bigram, total FROM bigrams ORDER BY total DESC, bigram LIMIT 5000').fetchall()
+    conn.close()
+    return words, total, old, new, dated, top_bigrams
 
-    trending = []
-    for word in set(old_counts.keys()) | set(new_counts.keys()):
-        if len(word) < MIN_WORD_LENGTH or not word.isalpha() or word in BLOCKLIST:
+
+# ---------------------------------------------------------------------------
+# 2. Build English frequency baseline
+#    Source: https://norvig.com/ngrams/count_1w.txt (Peter Norvig / Google)
+# ---------------------------------------------------------------------------
+def load_english_counts(freq_file=None):
+    if freq_file is None:
+        freq_file = FREQ_CACHE
+        if not os.path.exists(FREQ_CACHE):
+            print(f"Downloading English word frequencies from {FREQ_URL} ...")
+            urllib.request.urlretrieve(FREQ_URL, FREQ_CACHE)
+            print("Done.")
+
+    english_counts = {}
+    with open(freq_file) as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) == 2:
+                word, count = parts[0].lower(), int(parts[1])
+                english_counts[word] = count
+    return english_counts
+
+
+# ---------------------------------------------------------------------------
+# 3. Compute deviance for each word
+#
+#    deviance = log2( squeex_freq / english_freq )
+#
+#    For words not in English corpus, use a smoothed frequency so they
+#    rank high but don't cause division by zero.
+# ---------------------------------------------------------------------------
+def eligible_words(words):
+    """Words long enough, alphabetic and not blocklisted."""
+    return np.fromiter((len(w) >= MIN_WORD_LENGTH and w.isalpha() and w not in BLOCKLIST for w in words),
+                       bool, len(words))
+
+
+def deviance_ranking(words, counts, eligible, english_counts, english_total):
+    """(word, deviance, count, squeex_freq, english_freq) by deviance, highest first."""
+    squeex_total = counts.sum()
+    smoothed = 0.5 / english_total
+
+    in_english = np.fromiter((w in english_counts for w in words), bool, len(words))
+    english = np.fromiter((english_counts.get(w, 0) for w in words), np.float64, len(words))
+
+    keep = np.flatnonzero(eligible & (counts >= MIN_SQUEEX_MENTIONS))
+    squeex_freq = counts[keep] / squeex_total
+    english_freq = np.where(in_english[keep], english[keep] / english_total, smoothed)
+    deviance = np.log2(squeex_freq / english_freq)
+
+    # Stable, so ties keep corpus order.
+    order = np.argsort(-deviance, kind='stable')
+    return [ (words[keep[i]], float(deviance[i]), int(counts[keep[i]]), float(squeex_freq[i]), float(english_freq[i]))
+             for i in order ]
+
+
+# ---------------------------------------------------------------------------
+# 5. Phrase analysis (bigrams from full text data)
+# ---------------------------------------------------------------------------
+def count_bigrams(conn):
+    """Adjacent word pairs (both 3+ letters), one transcript at a time."""
+    bigram_counts = Counter()
+    reader = transcripts.Reader(conn, cache_size=0)
+    for (text,) in conn.execute('SELECT full_text FROM videos ORDER BY rowid'):
+        bigram_counts.update(term_stats.transcript_pairs(reader.decode(text)))
+    return bigram_counts
+
+
+def top_phrases(top_bigrams, english_counts, english_total):
+    """top_bigrams: the 5000 most common (bigram, count), ties by bigram."""
+    # Score bigrams: boost if either word is deviant (Squeex-specific)
+    scored_phrases = []
+    for bg, c in top_bigrams:
+        if c < MIN_BIGRAM_COUNT:
             continue
-        old_freq = old_counts.get(word, 0) / old_total
-        new_freq = new_counts.get(word, 0) / new_total
-        # Must appear enough in recent VODs and be meaningfully more frequent
-        if new_counts.get(word, 0) < 10:
+        words = bg.split()
+        if any(w in BLOCKLIST for w in words):
             continue
-        if old_freq == 0:
-            ratio = 50.0  # cap for new words
-        else:
-            ratio = new_freq / old_freq
-        if ratio > 1.5:
-            trending.append((word, ratio, new_counts.get(word, 0), old_counts.get(word, 0)))
-
-    trending.sort(key=lambda x: x[1], reverse=True)
+        if all(w in COMMON_WORDS for w in words):
+            continue
+        if any(w in CONTRACTIONS for w in words):
+            continue
+        # Skip if any word is too short or both words are the same
+        if any(len(w) < 3 for w in words):
+            continue
+        if words[0] == words[1]:
+            continue
+        # Score: heavily favor phrases with Squeex-specific words
+        # A word is "specific" if it's not in the top 5000 English words
+        specific = sum(1 for w in words if english_counts.get(w, 0) < english_total * 0.00001)
+        if specific == 0:
+            continue  # Skip if both words are common English
+        score = c * (100 ** specific)
+        scored_phrases.append((bg, c, score))
+
+    scored_phrases.sort(key=lambda x: x[2], reverse=True)
+
+    # Deduplicate similar phrases (match on first 2 chars of each word)
+    seen_phrase_keys = set()
+    phrases = []
+    for bg, c, _ in scored_phrases:
+        key = tuple(sorted(w[:2] for w in bg.split()))
+        if key in seen_phrase_keys:
+            continue
+        seen_phrase_keys.add(key)
+        phrases.append((bg, c))
+        if len(phrases) >= 30:
+            break
+    return phrases
 
-    print(f"\nTrending words (recent vs older VODs):")
-    for i, (word, ratio, nc, oc) in enumerate(trending[:15]):
-        print(f"  {i+1}. '{word}' {ratio:.1f}x more frequent (new:{nc}, old:{oc})")
 
 # ---------------------------------------------------------------------------
-# 7. Generate suggestions.json for the static site
+# 6. Trending analysis — words more common in recent VODs vs older ones
 # ---------------------------------------------------------------------------
-top_words = [w for w, *_ in results]
-pills = top_words[:8]
-random_words = [w for w in top_words[8:] if w not in pills][:30]
-
-# Trending and phrases — larger lists
-trending_words = [w for w, *_ in trending[:30]] if vid_dates else []
-phrase_suggestions = [p for p, _ in top_phrases[:15]] if top_phrases else []
-
-suggestions = {
-    'pills': pills,
-    'random': random_words,
-    'trending': [w for w in trending_words if w not in pills and w not in random_words][:20],
-    'phrases': phrase_suggestions,
-}
+def trending_words(words, old, new, eligible):
+    """(word, ratio, new count, old count) for words rising in recent VODs, highest ratio first."""
+    old_total = max(int(old.sum()), 1)
+    new_total = max(int(new.sum()), 1)
+
+    # Every word seen in either half, in corpus order, so ties keep it. The
+    # dict based version visited a set of them, whose order (and so its
+    # ties) changed with the hash seed from one run to the next.
+    order = np.flatnonzero((old > 0) | (new > 0))
+
+    old_c, new_c = old[order], new[order]
+    old_freq = old_c / old_total
+    new_freq = new_c / new_total
+    # Must appear enough in recent VODs and be meaningfully more frequent
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(old_freq == 0, 50.0, new_freq / old_freq)  # cap for new words
+    keep = np.flatnonzero(eligible[order] & (new_c >= 10) & (ratio > 1.5))
+    keep = keep[np.argsort(-ratio[keep], kind='stable')]
+    return [ (words[order[i]], float(ratio[i]), int(new_c[i]), int(old_c[i])) for i in keep ]
+
+
+def main(args):
+    if args.stats:
+        words, squeex_counts, old_counts, new_counts, dated, top_bigrams = load_stats(args.stats)
+    else:
+        conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+        halves = load_halves(conn)
+        words, squeex_counts, old_counts, new_counts = load_term_counts(conn, halves)
+        dated = bool(halves)
+
+    squeex_total = int(squeex_counts.sum())
+    print(f"Squeex corpus: {len(words)} unique words, {squeex_total} total mentions")
+
+    english_counts = load_english_counts(args.freq_file)
+    english_total = sum(english_counts.values())
+    print(f"English corpus (Norvig/Google): {len(english_counts)} unique words, {english_total} total words")
+
+    eligible = eligible_words(words)
+    results = deviance_ranking(words, squeex_counts, eligible, english_counts, english_total)
+
+    # -----------------------------------------------------------------------
+    # 4. Output
+    # -----------------------------------------------------------------------
+    print(f"\n{'RANK':<6} {'WORD':<20} {'DEVIANCE':>10} {'SQUEEX #':>10} {'SQUEEX %':>10} {'ENGLISH %':>10}")
+    print("-" * 70)
+    for i, (word, dev, count, sf, ef) in enumerate(results[:80]):
+        print(f"{i+1:<6} {word:<20} {dev:>10.2f} {count:>10} {sf*100:>9.4f}% {ef*100:>9.6f}%")
+
+    if not args.stats:
+        try:
+            top_bigrams = term_stats.ranked_bigrams(count_bigrams(conn))[:5000]
+        except Exception as e:
+            print(f"Skipping phrase analysis: {e}")
+            top_bigrams = []
+        conn.close()
+    phrases = top_phrases(top_bigrams, english_counts, english_total)
+
+    if phrases:
+        print(f"\nTop phrases:")
+        for i, (phrase, count) in enumerate(phrases[:15]):
+            print(f"  {i+1}. '{phrase}' ({count})")
 
-out_path = os.path.join(REPO_ROOT, 'suggestions.json')
-with open(out_path, 'w') as f:
-    json.dump(suggestions, f, indent=2)
-print(f"\nWrote {out_path}")
-print(f"  pills:    {suggestions['pills']}")
-print(f"  random:   {suggestions['random']}")
-print(f"  trending: {suggestions['trending']}")
-print(f"  phrases:  {suggestions['phrases']}")
+    trending = []
+    if dated:
+        trending = trending_words(words, old_counts, new_counts, eligible)
+
+        print(f"\nTrending words (recent vs older VODs):")
+        for i, (word, ratio, nc, oc) in enumerate(trending[:15]):
+            print(f"  {i+1}. '{word}' {ratio:.1f}x more frequent (new:{nc}, old:{oc})")
+
+    # -----------------------------------------------------------------------
+    # 7. Generate suggestions.json for the static site
+    # -----------------------------------------------------------------------
+    top_words = [w for w, *_ in results]
+    pills = top_words[:8]
+    random_words = [w for w in top_words[8:] if w not in pills][:30]
+
+    # Trending and phrases — larger lists
+    trending_list = [w for w, *_ in trending[:30]]
+    phrase_suggestions = [p for p, _ in phrases[:15]]
+
+    suggestions = {
+        'pills': pills,
+        'random': random_words,
+        'trending': [w for w in trending_list if w not in pills and w not in random_words][:20],
+        'phrases': phrase_suggestions,
+    }
+
+    with open(args.out, 'w') as f:
+        json.dump(suggestions, f, indent=2)
+    print(f"\nWrote {args.out}")
+    print(f"  pills:    {suggestions['pills']}")
+    print(f"  random:   {suggestions['random']}")
+    print(f"  trending: {suggestions['trending']}")
+    print(f"  phrases:  {suggestions['phrases']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rank unusually frequent words and phrases for suggestions.json.')
+    parser.add_argument('--db', default=DB_PATH, help=f'database to read (default: {DB_PATH})')
+    parser.add_argument('--stats', help='read the counts from a term_stats.py sidecar (e.g. preprocessing/data/term_stats.db) instead of --db')
+    parser.add_argument('--freq-file', help='local English word frequency list (word<TAB>count per line) instead of the download')
+    parser.add_argument('--out', default=OUT_PATH, help=f'output file (default: {OUT_PATH})')
+    main(parser.parse_args())
@@ -0,0 +1,232 @@
+import os
+import re
+import sys
+import json
+import bisect
+import time
+import random
+import argparse
+import tempfile
+
+import parse
+import synth
+
+"""
+Checks and times the streaming vtt reader in parse.py.
+
+Golden files: --record writes the parse of every vtt under --vtt to
+--golden, --golden compares the current parser against them. Record them
+with the parser you trust (e.g. before a change), then check after.
+
+Benchmark: writes long synthetic auto captions (see synth.py), parses
+them and reports MB/s. If webvtt-py is installed the output is also
+compared with the previous webvtt based parser.
+
+Cues: --cues parses synthetic files of each caption style with and
+without --normalize and reports segments, postings (segment indexes in
+the word maps), full_text size and how much earlier the lines both keep
+start.
+
+Usage:
+    python3 scripts/bench_parse.py --vtt data/vtt --record golden/
+    python3 scripts/bench_parse.py --vtt data/vtt --golden golden/
+    python3 scripts/bench_parse.py [--hours 6] [--files 4]
+    python3 scripts/bench_parse.py --cues [--hours 6] [--files 4]
+"""
+
+# Longer than any cue, shorter than the gap to an unrelated line of the same text.
+MAX_SHIFT = 30
+
+
+def webvtt_parse(vtt_filename, dates):
+    """The webvtt-py based parser that parse.parse_vtt replaced, for comparison."""
+    import webvtt
+
+    vid = parse.get_vid(vtt_filename)
+    upload_date = dates[vid]
+
+    segments = []
+    word_map = {}
+    full_text = ''
+    idx_to_time = {}
+    seen_starts = set()
+    for caption in webvtt.read(vtt_filename):
+
+        start = get_sec(caption.start)
+        text = re.sub(r'\[.*?\]', '', caption.text).strip().lower()
+
+        if '\n' in text: continue
+        if text == '': continue
+        if start in seen_starts: continue
+        if len(segments) > 0 and text == segments[-1][1]: continue
+
+        seen_starts.add(start)
+        segments.append([ start, text ])
+
+        idx = len(segments) - 1
+        words = text.split()
+        for word in words:
+            if word in parse.sw: continue
+            if word in word_map:
+                word_map[word].add(idx)
+            else:
+                word_map[word] = { idx }
+
+        full_text += ' ' + text
+        idx_to_time[len(full_text)] = get_sec(caption.end)
+
+    for word, idxs in word_map.items():
+        word_map[word] = list(idxs)
+
+    return {
+        'id': vid,
+        'segments': segments,
+        'word_map': word_map,
+        'full_text': full_text,
+        'idx_to_time': idx_to_time,
+        'upload_date': upload_date
+    }
+
+
+def get_sec(time_str):
+    h, m, s = re.sub(r'\..*$', '', time_str).split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def parse_all(parse_fn, files, dates):
+    start = time.perf_counter()
+    outputs = [ parse_fn(f, dates) for f in files ]
+    return outputs, time.perf_counter() - start
+
+
+def to_json(data):
+    return json.dumps(data) + '\n'
+
+
+def golden_path(golden_dir, vtt_filename):
+    return parse.get_output_path(vtt_filename, golden_dir)
+
+
+def record(files, dates, golden_dir):
+    os.makedirs(golden_dir, exist_ok=True)
+    for vtt_filename in files:
+        with open(golden_path(golden_dir, vtt_filename), 'w') as f:
+            f.write(to_json(parse.parse_vtt(vtt_filename, dates)))
+    print(f'Recorded {len(files)} golden files in {golden_dir}')
+
+
+def check_golden(files, dates, golden_dir):
+    failures = 0
+    for vtt_filename in files:
+        with open(golden_path(golden_dir, vtt_filename)) as f:
+            expected = f.read()
+        if to_json(parse.parse_vtt(vtt_filename, dates)) != expected:
+            failures += 1
+            print(f'  DIFFERS {vtt_filename}')
+    print(f'Golden files: {len(files) - failures}/{len(files)} identical')
+    return failures
+
+
+def write_synth(tmp, hours, count, rng, style='youtube'):
+    files = []
+    dates = {}
+    for i in range(count):
+        vid = f'synth{i:06d}'
+        path = os.path.join(tmp, f'Synthetic {i} [{vid}].en.vtt')
+        synth.write_vtt(path, hours, rng, style=style)
+        files.append(path)
+        dates[vid] = 20240101
+    return files, dates
+
+
+def bench(hours, count, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        files, dates = write_synth(tmp, hours, count, rng)
+        size = sum(os.path.getsize(f) for f in files) / 1e6
+        print(f'{count} synthetic files, {hours}h each, {size:.1f} MB')
+
+        outputs, seconds = parse_all(parse.parse_vtt, files, dates)
+        segments = sum(len(o['segments']) for o in outputs)
+        print(f'  streaming: {seconds:6.2f}s  {size / seconds:6.1f} MB/s  ({segments} segments)')
+
+        try:
+            import webvtt
+        except ImportError:
+            print('  webvtt-py not installed, skipping the comparison')
+            return 0
+        expected, seconds = parse_all(webvtt_parse, files, dates)
+        print(f'  webvtt:    {seconds:6.2f}s  {size / seconds:6.1f} MB/s')
+        differ = [ f for f, a, b in zip(files, outputs, expected) if to_json(a) != to_json(b) ]
+        print(f'  output identical for {len(files) - len(differ)}/{len(files)} files')
+        return len(differ)
+
+
+def cue_stats(outputs):
+    return {
+        'segments': sum(len(o['segments']) for o in outputs),
+        'postings': sum(len(idxs) for o in outputs for idxs in o['word_map'].values()),
+        'text_mb': sum(len(o['full_text']) for o in outputs) / 1e6,
+    }
+
+
+def start_shift(raw, normalized):
+    """
+    Mean seconds by which normalized starts precede raw ones, pairing each
+    raw segment with the last normalized one of the same text that starts
+    at most MAX_SHIFT seconds before.
+    """
+    shifts = []
+    for a, b in zip(raw, normalized):
+        starts = {}
+        for start, text in b['segments']:
+            starts.setdefault(text, []).append(start)
+        for start, text in a['segments']:
+            i = bisect.bisect_right(starts.get(text, []), start)
+            if i and start - starts[text][i - 1] <= MAX_SHIFT:
+                shifts.append(start - starts[text][i - 1])
+    return sum(shifts) / len(shifts) if shifts else 0, len(shifts)
+
+
+def compare_cues(hours, count, seed):
+    for style in synth.STYLES:
+        rng = random.Random(seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            files, dates = write_synth(tmp, hours, count, rng, style)
+            raw = [ parse.parse_vtt(f, dates) for f in files ]
+            normalized = [ parse.parse_vtt(f, dates, normalize=True) for f in files ]
+        before, after = cue_stats(raw), cue_stats(normalized)
+        print(f'{style}: {count} files, {hours}h each')
+        print(f'  segments  {before["segments"]:10,} -> {after["segments"]:10,}')
+        print(f'  postings  {before["postings"]:10,} -> {after["postings"]:10,}')
+        print(f'  full_text {before["text_mb"]:10.2f} -> {after["text_mb"]:10.2f} MB')
+        shift, paired = start_shift(raw, normalized)
+        print(f'  starts    {shift:.2f}s earlier on average ({paired:,} segments paired)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Golden-file check and throughput of the vtt parser.')
+    parser.add_argument('--vtt', help='directory (or glob) of vtt files for --record / --golden')
+    parser.add_argument('--dates', default=parse.DATES_PATH, help=f'upload dates file (default: {parse.DATES_PATH})')
+    parser.add_argument('--record', metavar='DIR', help='write golden outputs for --vtt to DIR')
+    parser.add_argument('--golden', metavar='DIR', help='compare the parse of --vtt with the golden outputs in DIR')
+    parser.add_argument('--hours', type=float, default=6, help='length of each synthetic file (default: 6)')
+    parser.add_argument('--files', type=int, default=4, help='number of synthetic files (default: 4)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cues', action='store_true', help='compare parse.py with and without --normalize')
+    args = parser.parse_args()
+
+    if args.record or args.golden:
+        if not args.vtt:
+            parser.error('--record and --golden need --vtt')
+        files = parse.find_vtt_files([ args.vtt ])
+        dates = parse.load_dates(args.dates)
+        if args.record:
+            record(files, dates, args.record)
+            sys.exit(0)
+        sys.exit(1 if check_golden(files, dates, args.golden) else 0)
+
+    if args.cues:
+        compare_cues(args.hours, args.files, args.seed)
+        sys.exit(0)
+    sys.exit(1 if bench(args.hours, args.files, args.seed) else 0)
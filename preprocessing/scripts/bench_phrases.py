@@ -0,0 +1,76 @@
+import re
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+from positional import PositionalIndex
+from transcripts import Reader
+
+"""
+Benchmarks phrase queries through the positional index (positional.py)
+against the regex scan over every transcript that getPhrase falls back to,
+for 2-, 3- and 5-word phrases sampled from the database.
+
+Usage:
+    python3 scripts/bench_phrases.py [--db data/squeex.db] [--queries 50]
+"""
+
+
+def regex_scan(conn, phrase):
+    """{vid: number of matches}, scanning full_text like getPhrase."""
+    regex = re.compile(re.escape(phrase), re.IGNORECASE)
+    results = {}
+    reader = Reader(conn, cache_size=0)
+    for vid, text in conn.execute('SELECT vid, full_text FROM videos'):
+        n = sum(1 for _ in regex.finditer(reader.decode(text) or ''))
+        if n:
+            results[vid] = n
+    return results
+
+
+def sample_phrases(conn, words, n, rng):
+    reader = Reader(conn, cache_size=0)
+    texts = [ reader.decode(text) for (text,) in conn.execute('SELECT full_text FROM videos') ]
+    texts = [ text for text in texts if text ]
+    phrases = []
+    while len(phrases) < n:
+        tokens = rng.choice(texts).split()
+        if len(tokens) < words: continue
+        i = rng.randrange(len(tokens) - words + 1)
+        phrases.append(' '.join(tokens[i:i + words]))
+    return phrases
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [ fn(q) for q in queries ]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Positional index vs regex scan for phrase queries.')
+    parser.add_argument('--db', default='data/squeex.db')
+    parser.add_argument('--queries', type=int, default=50, help='phrases per length')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'positions'").fetchone():
+        print(f'{args.db} has no positions table, rebuild it with build_db.py.')
+        sys.exit(1)
+    index = PositionalIndex(conn)
+    rng = random.Random(args.seed)
+
+    print(f'{"words":>5} {"regex ms":>10} {"index ms":>10} {"speedup":>8} {"videos (regex/index)":>22}')
+    for words in (2, 3, 5):
+        phrases = sample_phrases(conn, words, args.queries, rng)
+        scan_s, scan_results = timed(lambda p: regex_scan(conn, p), phrases)
+        index_s, index_results = timed(index.match_positions, phrases)
+        scan_vids = sum(len(r) for r in scan_results)
+        index_vids = sum(len(r) for r in index_results)
+        print(f'{words:>5} {scan_s * 1000:>10.2f} {index_s * 1000:>10.2f} {scan_s / index_s:>7.1f}x '
+              f'{scan_vids:>11}/{index_vids:<10}')
+
+    print('The regex scan also counts matches inside longer words, so it can find more videos.')
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+import synth
+from pipeline import measure
+
+"""
+Times every stage of the nightly refresh on a synthetic corpus (see
+synth.py), in a scratch copy of the repo so nothing in data/ or app/data
+is touched:
+
+    parse, final, merge_first,        the first build of an archive
+    build_db, term_stats, analyze,
+    materialize
+    parse_new, final_changed, merge,  a refresh that adds --new videos:
+    build_db_incremental,             parse and build only those, merge
+    term_stats_update, analyze_update into the archive, upsert the DB
+    materialize_update                and the term statistics
+
+For each stage it records wall time, CPU time (user + sys, workers
+included), peak RSS of the largest process and the size of its outputs.
+Results are written as JSON; with a baseline (a previous results file)
+stages that got slower, bigger or hungrier by more than --threshold are
+flagged and the exit status is 1.
+
+Usage:
+    python3 scripts/bench_pipeline.py --videos 40 --hours 3 --save-baseline
+    python3 scripts/bench_pipeline.py --videos 40 --hours 3   # compares with the baseline
+    python3 scripts/bench_pipeline.py --normalize-cues --out data/bench/normalized.json --baseline data/bench/results.json
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = 'data/bench/results.json'
+BASELINE_PATH = 'data/bench/baseline.json'
+
+# Differences below these are noise, whatever the ratio.
+MIN_SECONDS = 0.1
+MIN_RSS_MB = 5
+MIN_BYTES = 4096
+
+
+def make_workspace(work_dir, args):
+    """
+    A repo skeleton (preprocessing/scripts, preprocessing/data, app/data)
+    with the synthetic corpus. Returns the vtt paths held back for the
+    refresh stages.
+    """
+    scripts = os.path.join(work_dir, 'preprocessing', 'scripts')
+    data = os.path.join(work_dir, 'preprocessing', 'data')
+    shutil.copytree(SCRIPT_DIR, scripts, ignore=shutil.ignore_patterns('__pycache__', 'english_freq_cache.txt'))
+    os.makedirs(os.path.join(work_dir, 'app', 'data'))
+
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    written = synth.generate(corpus_dir, args.videos + args.new, args.hours, args.seed, style=args.style)
+    shutil.move(os.path.join(corpus_dir, 'vtt'), os.path.join(data, 'vtt'))
+    shutil.copy(os.path.join(corpus_dir, 'dates.txt'), os.path.join(data, 'dates.txt'))
+
+    held_back = os.path.join(corpus_dir, 'new')
+    os.makedirs(held_back)
+    new_files = []
+    for _, path in written[args.videos:]:
+        path = os.path.join(data, 'vtt', os.path.basename(path))
+        new_files.append(shutil.move(path, os.path.join(held_back, os.path.basename(path))))
+    return new_files
+
+
+def file_size(path):
+    if os.path.isdir(path):
+        return sum(file_size(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def run_stage(name, cmd, cwd, outputs, log_dir):
+    """Run one stage to completion and measure it."""
+    log_path = os.path.join(log_dir, f'{name}.log')
+    with open(log_path, 'w') as log:
+        code, wall, cpu, rss_mb = measure(cmd, cwd, log)
+
+    if code != 0:
+        with open(log_path) as log:
+            tail = log.read()[-2000:]
+        raise RuntimeError(f'stage {name} failed ({code}), {log_path}:\n{tail}')
+
+    result = {
+        'wall_s': round(wall, 3),
+        'cpu_s': round(cpu, 3),
+        'peak_rss_mb': round(rss_mb, 1),
+        'outputs': { path: file_size(os.path.join(cwd, path)) for path in outputs },
+    }
+    result['output_bytes'] = sum(result['outputs'].values())
+    print(f'  {name:<22} {wall:8.2f}s  cpu {result["cpu_s"]:8.2f}s  '
+          f'rss {rss_mb:7.1f} MB  out {result["output_bytes"] / 1e6:8.2f} MB')
+    return result
+
+
+def run(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='squeex-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    cwd = os.path.join(work_dir, 'preprocessing')
+    app_data = os.path.join(work_dir, 'app', 'data')
+    log_dir = os.path.join(work_dir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+
+    print(f'Generating {args.videos} + {args.new} videos of ~{args.hours}h in {work_dir}')
+    new_files = make_workspace(work_dir, args)
+    vtt_bytes = file_size(os.path.join(cwd, 'data', 'vtt')) + sum(map(file_size, new_files))
+
+    py = sys.executable
+    workers = [ '--workers', str(args.workers) ] if args.workers else []
+    normalize = [ '--normalize' ] if args.normalize_cues else []
+    stages = {}
+
+    def stage(name, script, *script_args, outputs=()):
+        cmd = [ py, os.path.join('scripts', script), *script_args ]
+        stages[name] = run_stage(name, cmd, cwd, outputs, log_dir)
+
+    def publish():
+        """What pipeline.py's publish_db stage puts in the server directory."""
+        shutil.copy(os.path.join(cwd, 'data', 'squeex.db'), os.path.join(app_data, 'squeex.db'))
+
+    stage('parse', 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed', *workers, *normalize, outputs=[ 'data/parsed' ])
+    stage('final', 'final.py', '--stream', outputs=[ 'data/final.json', 'data/full.json' ])
+    stage('merge_first', 'merge.py', outputs=[ 'data/changeset.json' ])
+    stage('build_db', 'build_db.py', outputs=[ 'data/squeex.db' ])
+    publish()
+    stage('term_stats', 'term_stats.py', outputs=[ 'data/term_stats.db' ])
+    analyze = ('analyze_deviance.py', '--stats', 'data/term_stats.db', '--freq-file', '../corpus/freq.txt')
+    stage('analyze', *analyze, outputs=[ '../suggestions.json' ])
+    stage('materialize', 'materialize.py', outputs=[ 'data/squeex.db' ])
+
+    if new_files:
+        for path in new_files:
+            shutil.move(path, os.path.join(cwd, 'data', 'vtt', os.path.basename(path)))
+        stage('parse_new', 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed', *workers, *normalize, outputs=[ 'data/parsed' ])
+        stage('final_changed', 'final.py', '--changed', '--stream', outputs=[ 'data/final.json', 'data/full.json' ])
+        stage('merge', 'merge.py', outputs=[ 'data/changeset.json' ])
+        stage('build_db_incremental', 'build_db.py', '--incremental', outputs=[ 'data/squeex.db' ])
+        stage('term_stats_update', 'term_stats.py', '--update', outputs=[ 'data/term_stats.db' ])
+        stage('analyze_update', *analyze, outputs=[ '../suggestions.json' ])
+        stage('materialize_update', 'materialize.py', outputs=[ 'data/squeex.db' ])
+
+    if not args.keep and not args.work_dir:
+        shutil.rmtree(work_dir)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'config': { 'videos': args.videos, 'new': args.new, 'hours': args.hours, 'seed': args.seed, 'workers': args.workers,
+                    'style': args.style, 'normalize_cues': args.normalize_cues },
+        'host': { 'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count() },
+        'corpus': { 'vtt_bytes': vtt_bytes },
+        'stages': stages,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print stage-by-stage changes against the baseline. Returns the regressions."""
+    if results['config'] != baseline['config']:
+        print(f'Warning: baseline config {baseline["config"]} differs from {results["config"]}')
+
+    checks = (
+        ('wall_s', 'wall', MIN_SECONDS),
+        ('peak_rss_mb', 'rss', MIN_RSS_MB),
+        ('output_bytes', 'size', MIN_BYTES),
+    )
+    regressions = []
+    print(f'\nAgainst baseline from {baseline["created"]} (threshold +{threshold:.0%}):')
+    for name, current in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            print(f'  {name:<22} not in baseline')
+            continue
+        notes = []
+        for key, label, min_delta in checks:
+            before, after = base[key], current[key]
+            change = (after - before) / before if before else 0
+            flag = after - before > min_delta and change > threshold
+            if flag:
+                regressions.append((name, label, before, after))
+            notes.append(f'{label} {change:+6.1%}' + (' REGRESSION' if flag else ''))
+        print(f'  {name:<22} ' + '  '.join(notes))
+    return regressions
+
+
+def save(results, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on a synthetic corpus.')
+    parser.add_argument('--videos', type=int, default=40, help='videos in the initial archive (default: 40)')
+    parser.add_argument('--new', type=int, default=4, help='videos added by the refresh stages (default: 4, 0 to skip them)')
+    parser.add_argument('--hours', type=float, default=3, help='average video length (default: 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='parse.py workers (default: cpu count)')
+    parser.add_argument('--style', choices=synth.STYLES, default='youtube', help='caption style (default: youtube)')
+    parser.add_argument('--normalize-cues', action='store_true', help='parse with parse.py --normalize')
+    parser.add_argument('--work-dir', help='build the scratch repo here and keep it (default: a temp dir)')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary scratch repo')
+    parser.add_argument('--out', default=RESULTS_PATH, help=f'results file (default: {RESULTS_PATH})')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help=f'results to compare against (default: {BASELINE_PATH})')
+    parser.add_argument('--save-baseline', action='store_true', help='also store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative increase flagged as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    results = run(args)
+    save(results, args.out)
+    print(f'Wrote {args.out}')
+
+    if args.save_baseline:
+        save(results, args.baseline)
+        print(f'Saved baseline {args.baseline}')
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --save-baseline to store one.')
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'\n{len(regressions)} regressions:')
+        for name, label, before, after in regressions:
+            print(f'  {name} {label}: {before} -> {after}')
+        sys.exit(1)
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+
+import postings
+
+"""
+Compares the varint posting-list codec (postings.py) with the JSON arrays
+it replaced, on a synthetic archive: total size, and decode speed in
+Python and in node. Also round-trips random lists through both the
+Python and the node (app/lib/postings.js) implementations.
+
+Usage:
+    python3 scripts/bench_postings.py [--videos 1800] [--words 20000]
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+POSTINGS_JS = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..', 'app', 'lib', 'postings.js'))
+
+NODE_SCRIPT = r'''
+const { decodePostings, encodePostings } = require(process.argv[1]);
+const input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+
+// Round trip: decode what python encoded, and encode for python to decode.
+const decoded = input.cases.map(hex => decodePostings(Buffer.from(hex, 'hex')));
+const encoded = input.lists.map(list => encodePostings(list).toString('hex'));
+
+// Decode speed over the synthetic archive.
+const blobs = input.archive.map(hex => Buffer.from(hex, 'hex'));
+const jsons = input.archive_json;
+const time = (fn) => { const start = process.hrtime.bigint(); fn(); return Number(process.hrtime.bigint() - start) / 1e9; };
+let n = 0;
+const varintSeconds = time(() => { for (const b of blobs) n += decodePostings(b).length; });
+const jsonSeconds = time(() => { for (const j of jsons) n += JSON.parse(j).length; });
+
+console.log(JSON.stringify({ decoded, encoded, varintSeconds, jsonSeconds }));
+'''
+
+
+def synthetic_archive(videos, words, seed=0):
+    """
+    (word, vid) posting lists with a Zipf-like spread: a few words appear
+    in most videos many times, most words appear a handful of times.
+    """
+    rng = random.Random(seed)
+    lists = []
+    for rank in range(1, words + 1):
+        vids = max(1, int(videos / rank ** 0.8))
+        per_video = max(1, int(2000 / rank ** 0.9))
+        for _ in range(vids):
+            n = min(3000, max(1, int(rng.expovariate(1 / per_video))))
+            segments = rng.randint(n, 6000)
+            lists.append(sorted(rng.sample(range(segments), n)))
+    return lists
+
+
+def random_lists(n, seed=1):
+    rng = random.Random(seed)
+    cases = [ [], [0], [127], [128], [2 ** 31], [2 ** 40 + 5] ]
+    for _ in range(n):
+        size = rng.randint(0, 50)
+        cases.append(sorted(set(rng.randrange(0, rng.choice([100, 10000, 2 ** 35])) for _ in range(size))))
+    return cases
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Varint vs JSON posting lists.')
+    parser.add_argument('--videos', type=int, default=1800)
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--no-node', action='store_true', help='skip the node round trip and timing')
+    args = parser.parse_args()
+
+    print(f'Generating synthetic archive ({args.videos} videos, {args.words} words)...')
+    lists = synthetic_archive(args.videos, args.words)
+    as_json = [ json.dumps(l) for l in lists ]
+    as_varint = [ postings.encode(l) for l in lists ]
+
+    json_bytes = sum(len(j) for j in as_json)
+    varint_bytes = sum(len(b) for b in as_varint)
+    indexes = sum(len(l) for l in lists)
+    print(f'{len(lists)} posting lists, {indexes} segment indexes')
+    print(f'  json:   {json_bytes / 1e6:8.1f} MB ({json_bytes / indexes:.2f} bytes/index)')
+    print(f'  varint: {varint_bytes / 1e6:8.1f} MB ({varint_bytes / indexes:.2f} bytes/index, '
+          f'{json_bytes / varint_bytes:.1f}x smaller)')
+
+    assert all(postings.decode(b) == l for b, l in zip(as_varint, lists))
+    assert all(postings.count(b) == len(l) for b, l in zip(as_varint, lists))
+
+    json_s = timed(lambda: [ json.loads(j) for j in as_json ])
+    varint_s = timed(lambda: [ postings.decode(b) for b in as_varint ])
+    count_s = timed(lambda: [ postings.count(b) for b in as_varint ])
+    print('python decode:')
+    print(f'  json.loads:       {json_s:6.2f}s ({indexes / json_s / 1e6:.1f}M indexes/s)')
+    print(f'  postings.decode:  {varint_s:6.2f}s ({indexes / varint_s / 1e6:.1f}M indexes/s)')
+    print(f'  postings.count:   {count_s:6.2f}s')
+
+    if args.no_node:
+        sys.exit(0)
+
+    cases = random_lists(500)
+    payload = {
+        'cases': [ postings.encode(l).hex() for l in cases ],
+        'lists': cases,
+        'archive': [ b.hex() for b in as_varint ],
+        'archive_json': as_json,
+    }
+    result = subprocess.run(['node', '-e', NODE_SCRIPT, POSTINGS_JS], input=json.dumps(payload),
+                            capture_output=True, text=True, check=True)
+    node = json.loads(result.stdout)
+
+    node_decoded_ok = node['decoded'] == cases
+    python_decoded_ok = [ postings.decode(bytes.fromhex(h)) for h in node['encoded'] ] == cases
+    same_bytes = node['encoded'] == payload['cases']
+    print(f'round trip python -> node: {"ok" if node_decoded_ok else "MISMATCH"}')
+    print(f'round trip node -> python: {"ok" if python_decoded_ok else "MISMATCH"}'
+          f'{"" if same_bytes else " (encodings differ)"}')
+    print('node decode:')
+    print(f'  JSON.parse:       {node["jsonSeconds"]:6.2f}s ({indexes / node["jsonSeconds"] / 1e6:.1f}M indexes/s)')
+    print(f'  decodePostings:   {node["varintSeconds"]:6.2f}s ({indexes / node["varintSeconds"] / 1e6:.1f}M indexes/s)')
+    if not (node_decoded_ok and python_decoded_ok and same_bytes):
+        sys.exit(1)
@@ -0,0 +1,106 @@
+from bisect import bisect_left, bisect_right
+
+import postings
+
+"""
+Cue boundaries of a transcript as two parallel sorted arrays.
+
+parse.py records idx_to_time: for every cue, the character offset in
+full_text where the cue's text ends, mapped to the cue's end time. Phrase
+search snaps a match to the nearest boundary at or before its start and at
+or after its end. Stored as sorted arrays, both lookups are a bisection
+instead of a walk over one character at a time.
+
+Packed form (videos.boundaries):
+    varint n
+    n offsets, as gaps from the previous offset (varints)
+    n times, as zigzag-encoded differences from the previous time (varints)
+
+app/lib/boundaries.js reads the same format. tests/test_boundaries.py
+compares the bisection with the walk it replaced and with the server's.
+"""
+
+
+def from_idx_to_time(idx_to_time):
+    items = sorted((int(offset), time) for offset, time in idx_to_time.items())
+    return [ o for o, _ in items ], [ t for _, t in items ]
+
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+def pack(offsets, times):
+    out = bytearray()
+    postings.write_varint(out, len(offsets))
+    prev = 0
+    for offset in offsets:
+        postings.write_varint(out, offset - prev)
+        prev = offset
+    prev = 0
+    for time in times:
+        postings.write_varint(out, zigzag(time - prev))
+        prev = time
+    return bytes(out)
+
+
+def unpack(blob):
+    n, pos = postings.read_varint(blob, 0)
+    offsets = []
+    prev = 0
+    for _ in range(n):
+        gap, pos = postings.read_varint(blob, pos)
+        prev += gap
+        offsets.append(prev)
+    times = []
+    prev = 0
+    for _ in range(n):
+        delta, pos = postings.read_varint(blob, pos)
+        prev += unzigzag(delta)
+        times.append(prev)
+    return offsets, times
+
+
+def start_boundary(offsets, index):
+    """Last boundary at or before index, or 0."""
+    i = bisect_right(offsets, index)
+    return offsets[i - 1] if i else 0
+
+
+def end_boundary(offsets, end, text_length):
+    """First boundary at or after end, capped at the end of the text."""
+    if end >= text_length:
+        return end
+    i = bisect_left(offsets, end)
+    return offsets[i] if i < len(offsets) else text_length
+
+
+def time_at(offsets, times, offset):
+    i = bisect_left(offsets, offset)
+    if i < len(offsets) and offsets[i] == offset:
+        return times[i]
+    return None
+
+
+def snippet(full_text, offsets, times, index, length):
+    """[startTime, text] of a phrase match, like getPhrase in app/lib/get.js."""
+    start = start_boundary(offsets, index)
+    end = end_boundary(offsets, index + length, len(full_text))
+    return [ time_at(offsets, times, start) or 0, full_text[start:end].strip() ]
+
+
+def walk_snippet(full_text, idx_to_time, index, length):
+    """The original one-character-at-a-time walk, for rows without boundaries."""
+    dec = 0
+    while index - dec > 0 and (index - dec) not in idx_to_time:
+        dec += 1
+    inc = length
+    while index + inc < len(full_text) and (index + inc) not in idx_to_time:
+        inc += 1
+    start = index - dec
+    return [ idx_to_time.get(start) or 0, full_text[start:index + inc].strip() ]
+
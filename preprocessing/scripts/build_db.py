@@ -1,91 +1,582 @@
 import json
 import sqlite3
 import os
-from datetime import datetime
+import sys
+import time
+import uuid
+import argparse
+from itertools import islice
+
+import corpus
+import postings
+import boundaries
+import positional
+import fuzzy
+import transcripts
+import squeex_index
 
 """
-Reads merged JSON files (data/final.json + data/full.json) and creates
-a SQLite database (data/squeex.db) for the Express API server.
+Reads the JSON files final.py writes (data/final.json + data/full.json)
+and creates a SQLite database (data/squeex.db) for the Express API server.
+The database is the corpus: a full build needs final.py's output of every
+parsed file.
+
+The full build bulk-loads into a fresh file with journaling and syncing
+off, creates indexes after the load, runs ANALYZE/VACUUM and then swaps
+the file into place.
+
+--incremental instead upserts only the videos in data/changeset.json
+(written by merge.py) into the existing database, in one transaction,
+reading them from the output of final.py --changed.
+
+word_map.segment_indexes holds each posting list as a delta-encoded
+varint BLOB (see postings.py); info.postings records the format.
+word_map.mentions is its length, the segments the word appears in.
+
+word_daily(word, day, count, videos) sums word_map.mentions per upload
+day (videos.upload_date, YYYYMMDD), so the server can draw a word's
+timeline without reading its segments.
+
+word_totals(word, mentions, videos) sums word_map per word. fuzzy(key,
+word) holds the symmetric-deletion keys of the words worth expanding a
+search to (see fuzzy.py), for ?fuzzy=1.
+
+completions(prefix, words) holds, for every prefix of up to
+COMPLETION_PREFIX characters, the COMPLETIONS most mentioned words
+(word_totals) starting with it, as a JSON array, for the autocomplete
+endpoint (/complete/:prefix). Longer prefixes have few words, the server
+reads those from word_totals by range. info.completions records the
+parameters.
+
+videos.segments, videos.full_text and videos.idx_to_time are compressed
+per video with a preset dictionary trained on a sample of the transcripts
+(see transcripts.py), stored in dictionaries(name, data); --incremental
+reuses it. info.compression records the format. Servers without
+app/lib/transcripts.js cannot read them, so deploy the app first.
+
+videos.boundaries packs idx_to_time as parallel sorted offset/time arrays
+(see boundaries.py) so phrase search can bisect to cue boundaries.
+videos.idx_to_time keeps the JSON object for older servers.
+
+info.build identifies the full build the database comes from. A full
+build numbers the rows (word_map rowids among them) afresh, --incremental
+keeps them and info.build with them; term_stats.py checks it before
+updating its counts.
+
+segments holds one row per segment, keyed by (vid, idx), so word search
+can join word_map straight to the matched segments. videos.segments keeps
+the same data as JSON for older servers (see migrate_segments.py).
+
+positions and videos.token_starts are a positional index over every token
+(stopwords included) for the phrase query module, see positional.py.
+
+videos_fts is an FTS5 trigram index over videos.full_text (contentless,
+since full_text is compressed, and keyed by the videos rowid). Phrase
+search uses it to find the candidate videos for a substring before
+running the exact match. It is built after VACUUM, since VACUUM may
+renumber rowids.
+
+results holds precomputed query results and is written by materialize.py
+after the build; the server only uses it while info.resultsUpdatedAt
+matches info.updatedAt.
+
+--index PATH also writes the memory-mapped index file of the finished
+database (see squeex_index.py).
+
+Usage:
+    python3 scripts/build_db.py
+    python3 scripts/build_db.py --incremental
+    python3 scripts/build_db.py --index data/squeex.idx
 """
 
 DB_PATH = 'data/squeex.db'
 FINAL_PATH = 'data/final.json'
 FULL_PATH = 'data/full.json'
 
-if __name__ == '__main__':
-    print('Loading merged JSON...')
-    with open(FINAL_PATH, 'r') as f:
-        final = json.load(f)
-    with open(FULL_PATH, 'r') as f:
-        full = json.load(f)
+BATCH_SIZE = 10000
+POSTINGS_FORMAT = 'varint'
+# Bumped whenever the tables change; --incremental needs a matching DB.
+SCHEMA_VERSION = 7
+# Videos the compression dictionary is trained on, evenly spaced.
+TRAIN_VIDEOS = 256
 
-    segments = final['segments']
-    word_map = final['word_map']
-    meta = final['meta']
-    updatedAt = final['updatedAt']
+COMPLETION_PREFIX = 5
+COMPLETIONS = 10
+COMPLETION_MIN_MENTIONS = 2
+# Sorts after every character, so [prefix, prefix + LAST_CHAR) is the range
+# of words starting with prefix.
+LAST_CHAR = chr(0x10ffff)
 
-    # Remove old DB if it exists
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
 
-    print('Creating SQLite database...')
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def batched(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Loader:
+    """Inserts rows with batched executemany and tracks rows/s per table."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.stats = {}
+
+    def insert(self, table, sql, rows):
+        start = time.time()
+        count = 0
+        for batch in batched(rows):
+            self.conn.executemany(sql, batch)
+            count += len(batch)
+        self.add_stat(table, count, time.time() - start)
+        return count
+
+    def add_stat(self, table, count, elapsed):
+        old_count, old_elapsed = self.stats.get(table, (0, 0.0))
+        self.stats[table] = (old_count + count, old_elapsed + elapsed)
+
+    def report(self):
+        for table, (count, elapsed) in self.stats.items():
+            rate = count / elapsed if elapsed > 0 else 0
+            print(f'  {table:<12} {count:>10} rows in {elapsed:6.1f}s ({rate:,.0f} rows/s)')
+
 
+def create_schema(c):
     c.execute('''CREATE TABLE videos (
         vid TEXT PRIMARY KEY,
         title TEXT,
         upload_date INTEGER,
-        segments TEXT,
-        full_text TEXT,
-        idx_to_time TEXT
+        segments BLOB,
+        full_text BLOB,
+        idx_to_time BLOB,
+        boundaries BLOB,
+        token_starts BLOB
     )''')
 
     c.execute('''CREATE TABLE word_map (
         word TEXT,
         vid TEXT,
-        segment_indexes TEXT,
+        segment_indexes BLOB,
+        mentions INTEGER,
         PRIMARY KEY (word, vid)
     )''')
-    c.execute('CREATE INDEX idx_word ON word_map(word)')
+
+    c.execute('''CREATE TABLE word_daily (
+        word TEXT,
+        day INTEGER,
+        count INTEGER,
+        videos INTEGER,
+        PRIMARY KEY (word, day)
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE word_totals (
+        word TEXT PRIMARY KEY,
+        mentions INTEGER,
+        videos INTEGER
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE fuzzy (
+        key TEXT,
+        word TEXT,
+        PRIMARY KEY (key, word)
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE completions (
+        prefix TEXT PRIMARY KEY,
+        words TEXT
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE segments (
+        vid TEXT,
+        idx INTEGER,
+        start INTEGER,
+        text TEXT,
+        PRIMARY KEY (vid, idx)
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE positions (
+        word TEXT,
+        vid TEXT,
+        positions BLOB,
+        PRIMARY KEY (word, vid)
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE dictionaries (
+        name TEXT PRIMARY KEY,
+        data BLOB
+    )''')
 
     c.execute('''CREATE TABLE info (
         key TEXT PRIMARY KEY,
         value TEXT
     )''')
 
-    # Insert videos
-    print(f'Inserting {len(meta)} videos...')
-    for vid, m in meta.items():
-        vid_segments = segments.get(vid, [])
-        vid_full = full.get(vid, {})
-        full_text = vid_full.get('text', '')
-        idx_to_time = vid_full.get('idx_to_time', {})
-
-        c.execute('INSERT INTO videos VALUES (?, ?, ?, ?, ?, ?)', (
-            vid,
-            m['title'],
-            m['upload_date'],
-            json.dumps(vid_segments),
-            full_text,
-            json.dumps(idx_to_time)
-        ))
-
-    # Insert word_map
-    word_count = 0
-    print(f'Inserting word map ({len(word_map)} words)...')
+
+def create_indexes(c):
+    c.execute('CREATE INDEX IF NOT EXISTS idx_word ON word_map(word)')
+    # Date-range search: the videos uploaded between two days.
+    c.execute('CREATE INDEX IF NOT EXISTS idx_videos_upload_date ON videos(upload_date, vid)')
+
+
+def has_table(c, name):
+    return c.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def create_fts(c):
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+        full_text,
+        content = '',
+        tokenize = 'trigram'
+    )''')
+    reader = transcripts.Reader(c.connection, cache_size=0)
+    for rowid, text in c.connection.execute('SELECT rowid, full_text FROM videos ORDER BY rowid'):
+        c.execute('INSERT INTO videos_fts(rowid, full_text) VALUES (?, ?)', (rowid, reader.decode(text)))
+
+
+def fts_delete(c, vids):
+    """Remove videos from videos_fts. Must run before their rows change."""
+    reader = transcripts.Reader(c.connection, cache_size=0)
+    for vid in vids:
+        row = c.execute('SELECT rowid, full_text FROM videos WHERE vid = ?', (vid,)).fetchone()
+        if row is not None:
+            c.execute("INSERT INTO videos_fts(videos_fts, rowid, full_text) VALUES ('delete', ?, ?)",
+                      (row[0], reader.decode(row[1])))
+
+
+def fts_insert(c, vids):
+    reader = transcripts.Reader(c.connection, cache_size=0)
+    for vid in vids:
+        row = c.execute('SELECT rowid, full_text FROM videos WHERE vid = ?', (vid,)).fetchone()
+        if row is not None:
+            c.execute('INSERT INTO videos_fts(rowid, full_text) VALUES (?, ?)', (row[0], reader.decode(row[1])))
+
+
+def transcript_values(vid, segments, full):
+    """videos.segments, full_text and idx_to_time of a video, as text."""
+    vid_full = full.get(vid, {})
+    return json.dumps(segments.get(vid, [])), vid_full.get('text', ''), json.dumps(vid_full.get('idx_to_time', {}))
+
+
+def train_dictionary(vids, segments, full):
+    step = max(len(vids) // TRAIN_VIDEOS, 1)
+    return transcripts.train([ value.encode('utf-8') for vid in vids[::step]
+                               for value in transcript_values(vid, segments, full) ])
+
+
+def video_row(vid, m, segments, full, dictionary):
+    segments_json, full_text, idx_to_time_json = transcript_values(vid, segments, full)
+    return (
+        vid,
+        m['title'],
+        m['upload_date'],
+        transcripts.compress(segments_json, dictionary),
+        transcripts.compress(full_text, dictionary),
+        transcripts.compress(idx_to_time_json, dictionary),
+        boundaries.pack(*boundaries.from_idx_to_time(full.get(vid, {}).get('idx_to_time', {}))),
+        positional.pack_token_starts(segments.get(vid, []))
+    )
+
+
+def segment_rows(vid, segments):
+    for idx, (start, text) in enumerate(segments.get(vid, [])):
+        yield (vid, idx, start, text)
+
+
+def word_rows(word_map):
     for word, vids in word_map.items():
         for vid, indexes in vids.items():
-            c.execute('INSERT INTO word_map VALUES (?, ?, ?)', (
-                word, vid, json.dumps(indexes)
-            ))
-            word_count += 1
+            yield (word, vid, postings.encode(indexes), len(indexes))
+
+
+def video_word_rows(vid, segments, word_map):
+    """word_map rows of a single video, found through its segment words."""
+    for word in corpus.video_words(segments):
+        indexes = word_map.get(word, {}).get(vid)
+        if indexes is not None:
+            yield (word, vid, postings.encode(indexes), len(indexes))
+
+
+def fill_word_daily(c):
+    c.execute('''INSERT INTO word_daily
+        SELECT w.word, v.upload_date, SUM(w.mentions), COUNT(*)
+        FROM word_map w JOIN videos v ON v.vid = w.vid
+        GROUP BY w.word, v.upload_date''')
+
+
+def fill_word_totals(c):
+    """word_totals and the tables built from it, fuzzy and completions."""
+    c.execute('INSERT INTO word_totals SELECT word, SUM(mentions), COUNT(*) FROM word_map GROUP BY word')
+    c.executemany('INSERT INTO fuzzy VALUES (?, ?)',
+                  (row for word, mentions in c.execute('SELECT word, mentions FROM word_totals').fetchall()
+                   for row in fuzzy.rows(word, mentions)))
+
+    top = {}
+    for word, in c.execute('SELECT word FROM word_totals WHERE mentions >= ? ORDER BY mentions DESC, word',
+                           (COMPLETION_MIN_MENTIONS,)).fetchall():
+        for n in range(1, min(len(word), COMPLETION_PREFIX) + 1):
+            words = top.setdefault(word[:n], [])
+            if len(words) < COMPLETIONS:
+                words.append(word)
+    c.executemany('INSERT INTO completions VALUES (?, ?)',
+                  ((prefix, json.dumps(words, ensure_ascii=False)) for prefix, words in top.items()))
+
+
+def completions(c, prefix):
+    """The most mentioned words starting with prefix, like getCompletions in app/lib/get.js."""
+    return [ word for word, in c.execute('''SELECT word FROM word_totals
+        WHERE word >= ? AND word < ? AND mentions >= ? ORDER BY mentions DESC, word LIMIT ?''',
+        (prefix, prefix + LAST_CHAR, COMPLETION_MIN_MENTIONS, COMPLETIONS)) ]
+
+
+def update_word_totals(c, words):
+    """Recount word_totals, fuzzy and completions for words, after their word_map rows changed."""
+    prefixes = { word[:n] for word in words for n in range(1, min(len(word), COMPLETION_PREFIX) + 1) }
+    for word in words:
+        c.executemany('DELETE FROM fuzzy WHERE key = ? AND word = ?', ((key, word) for key in fuzzy.deletes(word)))
+        c.execute('DELETE FROM word_totals WHERE word = ?', (word,))
+        c.execute('''INSERT INTO word_totals SELECT word, SUM(mentions), COUNT(*) FROM word_map
+            WHERE word = ? GROUP BY word''', (word,))
+        row = c.execute('SELECT mentions FROM word_totals WHERE word = ?', (word,)).fetchone()
+        if row is not None:
+            c.executemany('INSERT INTO fuzzy VALUES (?, ?)', fuzzy.rows(word, row[0]))
+    for prefix in prefixes:
+        words = completions(c, prefix)
+        if words:
+            c.execute('INSERT OR REPLACE INTO completions VALUES (?, ?)', (prefix, json.dumps(words, ensure_ascii=False)))
+        else:
+            c.execute('DELETE FROM completions WHERE prefix = ?', (prefix,))
+
+
+def load_json():
+    print('Loading final.py output...')
+    with open(FINAL_PATH, 'r') as f:
+        final = json.load(f)
+    with open(FULL_PATH, 'r') as f:
+        full = json.load(f)
+    return final, full
+
+
+def build(db_path):
+    final, full = load_json()
+    segments = final['segments']
+    word_map = final['word_map']
+    meta = final['meta']
+    updatedAt = final['updatedAt']
+
+    # Build next to the old DB and swap it in at the end.
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    print('Creating SQLite database...')
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode = OFF')
+    c.execute('PRAGMA synchronous = OFF')
+    c.execute('PRAGMA locking_mode = EXCLUSIVE')
+    c.execute('PRAGMA temp_store = MEMORY')
+    c.execute('PRAGMA cache_size = -262144')
+
+    loader = Loader(conn)
+    start = time.time()
+    c.execute('BEGIN')
+    create_schema(c)
+
+    print('Training the transcript dictionary...')
+    train_start = time.time()
+    dictionary = train_dictionary(list(meta), segments, full)
+    c.execute('INSERT INTO dictionaries VALUES (?, ?)', (transcripts.DICTIONARY, dictionary))
+    print(f'  {len(dictionary)} bytes in {time.time() - train_start:.1f}s')
+
+    print(f'Inserting {len(meta)} videos...')
+    loader.insert('videos', 'INSERT INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                  (video_row(vid, m, segments, full, dictionary) for vid, m in meta.items()))
+
+    print('Inserting segments...')
+    loader.insert('segments', 'INSERT INTO segments VALUES (?, ?, ?, ?)',
+                  (row for vid in meta for row in segment_rows(vid, segments)))
+
+    print('Inserting positions...')
+    loader.insert('positions', 'INSERT INTO positions VALUES (?, ?, ?)',
+                  (row for vid in meta for row in positional.position_rows(vid, segments.get(vid, []))))
+
+    print(f'Inserting word map ({len(word_map)} words)...')
+    word_count = loader.insert('word_map', 'INSERT INTO word_map VALUES (?, ?, ?, ?)', word_rows(word_map))
+
+    print('Counting words per day...')
+    daily_start = time.time()
+    fill_word_daily(c)
+    loader.add_stat('word_daily', c.execute('SELECT COUNT(*) FROM word_daily').fetchone()[0], time.time() - daily_start)
+
+    print('Counting words, their fuzzy keys and completions...')
+    totals_start = time.time()
+    fill_word_totals(c)
+    loader.add_stat('fuzzy', c.execute('SELECT COUNT(*) FROM fuzzy').fetchone()[0], time.time() - totals_start)
 
-    # Insert info
     c.execute('INSERT INTO info VALUES (?, ?)', ('updatedAt', updatedAt))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('postings', POSTINGS_FORMAT))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('schema', str(SCHEMA_VERSION)))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('compression', transcripts.FORMAT))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('build', uuid.uuid4().hex))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('completions', json.dumps({
+        'prefix': COMPLETION_PREFIX, 'count': COMPLETIONS, 'minMentions': COMPLETION_MIN_MENTIONS })))
+    c.execute('COMMIT')
+
+    print('Creating indexes...')
+    index_start = time.time()
+    create_indexes(c)
+    c.execute('ANALYZE')
+    print(f'  indexes + ANALYZE in {time.time() - index_start:.1f}s')
+
+    vacuum_start = time.time()
+    c.execute('PRAGMA journal_mode = DELETE')
+    c.execute('VACUUM')
+    print(f'  VACUUM in {time.time() - vacuum_start:.1f}s')
 
-    conn.commit()
+    fts_start = time.time()
+    c.execute('BEGIN')
+    create_fts(c)
+    c.execute('COMMIT')
+    print(f'  videos_fts in {time.time() - fts_start:.1f}s')
     conn.close()
+    os.replace(tmp_path, db_path)
+
+    print(f'Loaded in {time.time() - start:.1f}s:')
+    loader.report()
+
+    size_mb = os.path.getsize(db_path) / (1024 * 1024)
+    print(f'Done. {db_path} created ({size_mb:.1f} MB, {len(meta)} videos, {word_count} word-vid entries)')
+
+
+def incremental(db_path, changeset_path, force=False):
+    if not os.path.exists(db_path):
+        print(f'{db_path} not found, run a full build first.')
+        sys.exit(1)
+    changeset = corpus.load_changeset(changeset_path)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    c = conn.cursor()
+    c.execute('PRAGMA cache_size = -262144')
+    current = c.execute("SELECT value FROM info WHERE key = 'updatedAt'").fetchone()[0]
+    if current == changeset['updatedAt']:
+        print(f'{db_path} is already at {current}, nothing to do.')
+        return
+    row = c.execute("SELECT value FROM info WHERE key = 'schema'").fetchone()
+    if row is None or row[0] != str(SCHEMA_VERSION):
+        print(f'{db_path} has an older schema, run a full build.')
+        sys.exit(1)
+    if current != changeset['base'] and not force:
+        print(f'{db_path} is at {current}, but the changeset is based on {changeset["base"]}. '
+              'Run a full build, or pass --force.')
+        sys.exit(1)
+
+    final, full = load_json()
+    segments = final['segments']
+    word_map = final['word_map']
+    meta = final['meta']
+
+    changed = corpus.changed_vids(changeset)
+    reader = transcripts.Reader(conn, cache_size=0)
+    loader = Loader(conn)
+    start = time.time()
+    fts = has_table(c, 'videos_fts')
+    has_segments = has_table(c, 'segments')
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        if fts:
+            fts_delete(c, changed + changeset['deleted'])
+
+        # Drop the old postings of every video being replaced or deleted,
+        # and take them out of word_daily.
+        delete_start = time.time()
+        deleted_rows = 0
+        daily_keys = set()
+        for vid in changed + changeset['deleted']:
+            row = c.execute('SELECT segments, upload_date FROM videos WHERE vid = ?', (vid,)).fetchone()
+            if row is None: continue
+            old_words = corpus.video_words(json.loads(reader.decode(row[0])))
+            day = row[1]
+            old_counts = []
+            for w in old_words:
+                found = c.execute('SELECT mentions FROM word_map WHERE word = ? AND vid = ?', (w, vid)).fetchone()
+                if found is not None:
+                    old_counts.append((found[0], w, day))
+                    daily_keys.add((w, day))
+            c.executemany('UPDATE word_daily SET count = count - ?, videos = videos - 1 WHERE word = ? AND day = ?', old_counts)
+            c.executemany('DELETE FROM word_map WHERE word = ? AND vid = ?', ((w, vid) for w in old_words))
+            deleted_rows += c.rowcount if c.rowcount > 0 else 0
+            c.executemany('DELETE FROM positions WHERE word = ? AND vid = ?', ((w, vid) for w in old_words))
+            deleted_rows += c.rowcount if c.rowcount > 0 else 0
+        c.executemany('DELETE FROM word_daily WHERE word = ? AND day = ? AND videos = 0', daily_keys)
+        c.executemany('DELETE FROM videos WHERE vid = ?', ((vid,) for vid in changeset['deleted']))
+        if has_segments:
+            c.executemany('DELETE FROM segments WHERE vid = ?', ((vid,) for vid in changed + changeset['deleted']))
+        loader.add_stat('deletes', deleted_rows + len(changeset['deleted']), time.time() - delete_start)
+
+        loader.insert('videos', '''INSERT INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(vid) DO UPDATE SET
+                title = excluded.title,
+                upload_date = excluded.upload_date,
+                segments = excluded.segments,
+                full_text = excluded.full_text,
+                idx_to_time = excluded.idx_to_time,
+                boundaries = excluded.boundaries,
+                token_starts = excluded.token_starts''',
+            (video_row(vid, meta[vid], segments, full, reader.dictionary) for vid in changed))
+
+        if has_segments:
+            loader.insert('segments', 'INSERT INTO segments VALUES (?, ?, ?, ?)',
+                (row for vid in changed for row in segment_rows(vid, segments)))
+
+        loader.insert('positions', 'INSERT INTO positions VALUES (?, ?, ?)',
+            (row for vid in changed for row in positional.position_rows(vid, segments.get(vid, []))))
+
+        # In word_map order, so new words get rowids in the order they were
+        # added to the corpus, as in a full build (analyze_deviance.py
+        # relies on it).
+        word_order = { word: i for i, word in enumerate(word_map) }
+        rows = [ row for vid in changed for row in video_word_rows(vid, segments.get(vid, []), word_map) ]
+        rows.sort(key=lambda row: word_order[row[0]])
+        loader.insert('word_map', 'INSERT INTO word_map VALUES (?, ?, ?, ?)', rows)
+        loader.insert('word_daily', '''INSERT INTO word_daily VALUES (?, ?, ?, 1)
+            ON CONFLICT(word, day) DO UPDATE SET count = count + excluded.count, videos = videos + 1''',
+            ((word, meta[vid]['upload_date'], mentions) for word, vid, _, mentions in rows))
+
+        totals_start = time.time()
+        words = { word for word, _ in daily_keys } | { row[0] for row in rows }
+        update_word_totals(c, words)
+        loader.add_stat('word_totals', len(words), time.time() - totals_start)
+
+        if fts:
+            fts_insert(c, changed)
+
+        c.execute("INSERT OR REPLACE INTO info VALUES ('updatedAt', ?)", (changeset['updatedAt'],))
+        c.execute('COMMIT')
+    except BaseException:
+        c.execute('ROLLBACK')
+        raise
+    c.execute('PRAGMA optimize')
+    conn.close()
+
+    print(f'Updated {db_path} from {current} to {changeset["updatedAt"]} in {time.time() - start:.1f}s '
+          f'({len(changeset["added"])} added, {len(changeset["replaced"])} replaced, {len(changeset["deleted"])} deleted):')
+    loader.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the SQLite database for the API server.')
+    parser.add_argument('--db', default=DB_PATH, help=f'database path (default: {DB_PATH})')
+    parser.add_argument('--incremental', action='store_true', help='upsert only the videos in the changeset into an existing database')
+    parser.add_argument('--changeset', default=corpus.CHANGESET_PATH, help=f'--incremental changeset (default: {corpus.CHANGESET_PATH})')
+    parser.add_argument('--force', action='store_true', help='--incremental: apply even if the database is not at the changeset base')
+    parser.add_argument('--index', metavar='PATH', help=f'also write the index file, e.g. {squeex_index.INDEX_PATH}')
+    args = parser.parse_args()
 
-    size_mb = os.path.getsize(DB_PATH) / (1024 * 1024)
-    print(f'Done. {DB_PATH} created ({size_mb:.1f} MB, {len(meta)} videos, {word_count} word-vid entries)')
+    if args.incremental:
+        incremental(args.db, args.changeset, args.force)
+    else:
+        build(args.db)
+    if args.index:
+        squeex_index.write(args.db, args.index)
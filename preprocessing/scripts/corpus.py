@@ -0,0 +1,57 @@
+import os
+import json
+
+"""
+Helpers shared by the stages that read and write the merged corpus
+(data/final.json, data/full.json, data/squeex.db).
+
+A changeset (data/changeset.json) describes what a merge changed:
+{
+    base: updatedAt of the corpus the merge started from (or null),
+    updatedAt: updatedAt of the merged corpus,
+    added: [ vid ],
+    replaced: [ vid ],
+    deleted: [ vid ]
+}
+"""
+
+CHANGESET_PATH = 'data/changeset.json'
+
+
+def video_words(segments):
+    """
+    Every token in a video's segments. A superset of the video's word_map
+    keys (parse.py indexes the same tokens, minus stopwords), so it can be
+    used to find the posting lists a video appears in.
+    """
+    words = set()
+    for _, text in segments:
+        words.update(text.split())
+    return words
+
+
+def new_changeset(base, updated_at):
+    return {
+        'base': base,
+        'updatedAt': updated_at,
+        'added': [],
+        'replaced': [],
+        'deleted': [],
+    }
+
+
+def load_changeset(path=CHANGESET_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_changeset(changeset, path=CHANGESET_PATH):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(changeset, f, indent=1)
+    os.replace(tmp, path)
+
+
+def changed_vids(changeset):
+    """Videos whose rows have to be (re)written."""
+    return changeset['added'] + changeset['replaced']
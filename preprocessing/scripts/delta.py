@@ -0,0 +1,390 @@
+import os
+import re
+import sys
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+
+import corpus
+import transcripts
+from build_db import SCHEMA_VERSION, has_table, fts_delete, fts_insert, update_word_totals
+from search import Search, is_phrase, sample_queries
+
+"""
+Delta packages: the rows a refresh changed in squeex.db, to deploy instead
+of the whole file.
+
+    build    compares the published database (--base, ../app/data/squeex.db)
+             with the new one (--db, data/squeex.db) through the merge
+             changeset and writes data/deltas/<version>.delta.gz, a gzipped
+             SQLite file with
+                 delta_info(key, value)   format, base and updatedAt versions
+                 removed(vid)             replaced and deleted videos
+                 videos, segments,        the new rows of added and replaced
+                 positions, word_map      videos, with their rowids
+                 daily_keys(word, day)    word_daily keys the change touches
+                 word_daily               their new rows
+                 info, results            the new tables, whole
+             data/deltas/latest names the newest package. Without a usable
+             base (none, another schema, version or transcript dictionary,
+             see transcripts.py) there is no package and the database has
+             to be installed whole.
+    apply    checks that the database is at the package's base version,
+             applies the package to a copy in one transaction and swaps the
+             copy in with a rename, so readers see the old or the new file
+             and never a partial one. The server reopens the file when its
+             inode changes (app/lib/get.js). word_totals, fuzzy and
+             completions are recounted for the words of daily_keys, as
+             build_db.py does.
+    install  the same swap for a whole database.
+    verify   compares two databases: every table by primary key, and the
+             search results (search.py) of the suggested queries and a
+             sample of words and phrases. A full build and base + delta
+             must match. Transcript columns are compared decompressed,
+             since a full build trains its own dictionary, and
+             info.build, which names the full build, is left out.
+
+Rows keep their rowids, so base + delta is the database the incremental
+build wrote, down to the FTS index and the order of phrase results.
+
+Usage:
+    python3 scripts/delta.py build
+    python3 scripts/delta.py apply data/deltas/latest --db ../app/data/squeex.db
+    python3 scripts/delta.py install data/squeex.db --db ../app/data/squeex.db
+    python3 scripts/delta.py verify data/squeex.db ../app/data/squeex.db
+"""
+
+DB_PATH = 'data/squeex.db'
+BASE_PATH = '../app/data/squeex.db'
+DELTAS_DIR = 'data/deltas'
+LATEST = 'latest'
+FORMAT = '1'
+
+# Tables compared by verify, with the columns they are ordered by.
+VERIFY_TABLES = {
+    'videos': 'vid',
+    'segments': 'vid, idx',
+    'positions': 'word, vid',
+    'word_map': 'word, vid',
+    'word_daily': 'word, day',
+    'word_totals': 'word',
+    'fuzzy': 'key, word',
+    'completions': 'prefix',
+    'info': 'key',
+    'results': 'query',
+}
+# Rows verify leaves out: they differ between any two full builds.
+VERIFY_EXCLUDE = { 'info': "key != 'build'" }
+SAMPLE_QUERIES = 300
+
+
+def info(conn, key, schema='main'):
+    row = conn.execute(f'SELECT value FROM {schema}.info WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def version_tag(updated_at):
+    return re.sub(r'\D', '', updated_at)
+
+
+def dictionary_digest(conn, schema='main'):
+    return hashlib.sha256(transcripts.load_dictionary(conn, schema) or b'').hexdigest()[:16]
+
+
+def word_keys(conn, vid, schema):
+    """(word, vid) of a video's word_map and positions rows, found through its segment words."""
+    segments = transcripts.Reader(conn, cache_size=0, schema=schema).segments(vid)
+    if segments is None:
+        return []
+    return [ (word, vid) for word in corpus.video_words(segments) ]
+
+
+def daily_keys(conn, vid, schema):
+    """word_daily keys a video counts in."""
+    row = conn.execute(f'SELECT upload_date FROM {schema}.videos WHERE vid = ?', (vid,)).fetchone()
+    if row is None:
+        return set()
+    return { (word, row[0]) for word, _ in word_keys(conn, vid, schema)
+             if conn.execute(f'SELECT 1 FROM {schema}.word_map WHERE word = ? AND vid = ?', (word, vid)).fetchone() }
+
+
+def build(base_path, db_path, changeset_path, out_dir):
+    """Write the package from base_path to db_path. Returns its path, or None."""
+    start = time.time()
+    latest = os.path.join(out_dir, LATEST)
+    os.makedirs(out_dir, exist_ok=True)
+    if os.path.exists(latest):
+        os.remove(latest)
+
+    changeset = corpus.load_changeset(changeset_path)
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    target = info(conn, 'updatedAt')
+    if not os.path.exists(base_path):
+        print(f'{base_path} not found, install {db_path} whole.')
+        return None
+    conn.execute('ATTACH ? AS b', (f'file:{base_path}?mode=ro',))
+    base = info(conn, 'updatedAt', 'b')
+    if base == target:
+        print(f'{base_path} is already at {target}, nothing to package.')
+        return None
+    if info(conn, 'schema', 'b') != str(SCHEMA_VERSION) or info(conn, 'schema') != str(SCHEMA_VERSION):
+        print(f'{base_path} or {db_path} is not at schema {SCHEMA_VERSION}, install {db_path} whole.')
+        return None
+    dictionary = dictionary_digest(conn)
+    if dictionary_digest(conn, 'b') != dictionary:
+        print(f'{base_path} and {db_path} compress transcripts with different dictionaries, install {db_path} whole.')
+        return None
+    if (changeset['base'], changeset['updatedAt']) != (base, target):
+        print(f'The changeset goes from {changeset["base"]} to {changeset["updatedAt"]}, '
+              f'the databases from {base} to {target}: install {db_path} whole.')
+        return None
+    conn.close()
+
+    changed = corpus.changed_vids(changeset)
+    removed = changeset['replaced'] + changeset['deleted']
+    path = os.path.join(out_dir, f'{version_tag(target)}.delta')
+    if os.path.exists(path):
+        os.remove(path)
+
+    p = sqlite3.connect(path, isolation_level=None)
+    p.execute('ATTACH ? AS t', (f'file:{db_path}?mode=ro',))
+    p.execute('ATTACH ? AS b', (f'file:{base_path}?mode=ro',))
+    p.execute('BEGIN')
+    p.execute('CREATE TABLE delta_info (key TEXT PRIMARY KEY, value TEXT)')
+    p.executemany('INSERT INTO delta_info VALUES (?, ?)', [
+        ('format', FORMAT), ('base', base), ('updatedAt', target), ('schema', str(SCHEMA_VERSION)), ('dictionary', dictionary),
+        ('added', len(changeset['added'])), ('replaced', len(changeset['replaced'])), ('deleted', len(changeset['deleted'])),
+    ])
+    p.execute('CREATE TABLE removed (vid TEXT PRIMARY KEY)')
+    p.executemany('INSERT INTO removed VALUES (?)', ((vid,) for vid in removed))
+    p.execute('CREATE TEMP TABLE changed (vid TEXT PRIMARY KEY)')
+    p.executemany('INSERT INTO temp.changed VALUES (?)', ((vid,) for vid in changed))
+
+    p.execute('CREATE TABLE videos AS SELECT rowid AS _rowid, * FROM t.videos WHERE vid IN temp.changed ORDER BY rowid')
+    p.execute('CREATE TABLE segments AS SELECT * FROM t.segments WHERE vid IN temp.changed')
+    p.execute('CREATE TEMP TABLE keys (word TEXT, vid TEXT)')
+    p.executemany('INSERT INTO temp.keys VALUES (?, ?)', (key for vid in changed for key in word_keys(p, vid, 't')))
+    p.execute('''CREATE TABLE word_map AS SELECT w.rowid AS _rowid, w.* FROM temp.keys k
+        JOIN t.word_map w ON w.word = k.word AND w.vid = k.vid ORDER BY w.rowid''')
+    p.execute('''CREATE TABLE positions AS SELECT x.* FROM temp.keys k
+        JOIN t.positions x ON x.word = k.word AND x.vid = k.vid''')
+
+    keys = set()
+    for vid in removed:
+        keys |= daily_keys(p, vid, 'b')
+    for vid in changed:
+        keys |= daily_keys(p, vid, 't')
+    p.execute('CREATE TABLE daily_keys (word TEXT, day INTEGER, PRIMARY KEY (word, day))')
+    p.executemany('INSERT INTO daily_keys VALUES (?, ?)', keys)
+    p.execute('''CREATE TABLE word_daily AS SELECT d.* FROM daily_keys k
+        JOIN t.word_daily d ON d.word = k.word AND d.day = k.day''')
+
+    p.execute('CREATE TABLE info AS SELECT * FROM t.info')
+    if p.execute("SELECT 1 FROM t.sqlite_master WHERE name = 'results'").fetchone():
+        p.execute('CREATE TABLE results AS SELECT * FROM t.results')
+        p.execute("INSERT INTO delta_info SELECT 'results_sql', sql FROM t.sqlite_master WHERE name = 'results'")
+    p.execute('COMMIT')
+    p.execute('DETACH t')
+    p.execute('DETACH b')
+    p.execute('VACUUM')
+    p.close()
+
+    with open(path, 'rb') as f, gzip.open(path + '.gz', 'wb', compresslevel=6) as out:
+        shutil.copyfileobj(f, out)
+    os.remove(path)
+    path += '.gz'
+    with open(latest, 'w') as f:
+        f.write(os.path.basename(path) + '\n')
+
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    full_mb = os.path.getsize(db_path) / (1024 * 1024)
+    print(f'Wrote {path} in {time.time() - start:.1f}s: {base} -> {target}, '
+          f'{len(changeset["added"])} added, {len(changeset["replaced"])} replaced, {len(changeset["deleted"])} deleted, '
+          f'{size_mb:.2f} MB ({full_mb:.1f} MB whole)')
+    return path
+
+
+def resolve(package):
+    """A package path, or the one a `latest` file names."""
+    if os.path.basename(package) == LATEST:
+        with open(package) as f:
+            return os.path.join(os.path.dirname(package), f.read().strip())
+    return package
+
+
+def swap_in(tmp_path, db_path):
+    """Make tmp_path the database at db_path with one rename."""
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, db_path)
+
+
+def apply(package, db_path):
+    start = time.time()
+    package = resolve(package)
+    unpacked = db_path + '.delta'
+    with gzip.open(package, 'rb') as f, open(unpacked, 'wb') as out:
+        shutil.copyfileobj(f, out)
+
+    tmp_path = db_path + '.tmp'
+    try:
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        conn.execute('ATTACH ? AS d', (f'file:{unpacked}?mode=ro',))
+        delta = dict(conn.execute('SELECT key, value FROM d.delta_info'))
+        current = info(conn, 'updatedAt')
+        if delta['format'] != FORMAT or delta['schema'] != info(conn, 'schema'):
+            print(f'{package} is format {delta["format"]}, schema {delta["schema"]}; {db_path} needs a whole install.')
+            return 1
+        if current == delta['updatedAt']:
+            print(f'{db_path} is already at {current}.')
+            return 0
+        if current != delta['base']:
+            print(f'{db_path} is at {current}, but {package} applies to {delta["base"]}.')
+            return 1
+        if delta['dictionary'] != dictionary_digest(conn):
+            print(f'{package} was compressed with another transcript dictionary; {db_path} needs a whole install.')
+            return 1
+        conn.execute('DETACH d')
+
+        # A consistent copy, even while the server reads the database.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        copy = sqlite3.connect(tmp_path, isolation_level=None)
+        conn.backup(copy)
+        conn.close()
+
+        c = copy.cursor()
+        c.execute('ATTACH ? AS d', (f'file:{unpacked}?mode=ro',))
+        removed = [ vid for vid, in c.execute('SELECT vid FROM d.removed') ]
+        changed = [ vid for vid, in c.execute('SELECT vid FROM d.videos ORDER BY _rowid') ]
+        fts = has_table(c, 'videos_fts')
+        c.execute('BEGIN IMMEDIATE')
+        if fts:
+            fts_delete(c, removed)
+        keys = [ key for vid in removed for key in word_keys(c, vid, 'main') ]
+        c.executemany('DELETE FROM word_map WHERE word = ? AND vid = ?', keys)
+        c.executemany('DELETE FROM positions WHERE word = ? AND vid = ?', keys)
+        c.execute('DELETE FROM segments WHERE vid IN (SELECT vid FROM d.removed)')
+        c.execute('DELETE FROM videos WHERE vid IN (SELECT vid FROM d.removed)')
+
+        columns = [ row[1] for row in c.execute('PRAGMA table_info(videos)') ]
+        c.execute(f'INSERT INTO videos (rowid, {", ".join(columns)}) SELECT _rowid, {", ".join(columns)} FROM d.videos ORDER BY _rowid')
+        c.execute('INSERT INTO segments SELECT * FROM d.segments')
+        c.execute('INSERT INTO positions SELECT * FROM d.positions')
+        columns = [ row[1] for row in c.execute('PRAGMA table_info(word_map)') ]
+        c.execute(f'INSERT INTO word_map (rowid, {", ".join(columns)}) SELECT _rowid, {", ".join(columns)} FROM d.word_map ORDER BY _rowid')
+        c.execute('DELETE FROM word_daily WHERE (word, day) IN (SELECT word, day FROM d.daily_keys)')
+        c.execute('INSERT INTO word_daily SELECT * FROM d.word_daily')
+        update_word_totals(c, [ word for word, in c.execute('SELECT DISTINCT word FROM d.daily_keys').fetchall() ])
+
+        c.execute('DROP TABLE IF EXISTS main.results')
+        if 'results_sql' in delta:
+            c.execute(delta['results_sql'])
+            c.execute('INSERT INTO main.results SELECT * FROM d.results')
+        c.execute('DELETE FROM info')
+        c.execute('INSERT INTO info SELECT * FROM d.info')
+        if fts:
+            fts_insert(c, changed)
+        c.execute('COMMIT')
+        c.execute('DETACH d')
+        c.execute('PRAGMA optimize')
+        copy.close()
+        swap_in(tmp_path, db_path)
+    finally:
+        os.remove(unpacked)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    print(f'Applied {package} to {db_path} in {time.time() - start:.1f}s: {delta["base"]} -> {delta["updatedAt"]}, '
+          f'{delta["added"]} added, {delta["replaced"]} replaced, {delta["deleted"]} deleted')
+    return 0
+
+
+def install(src_path, db_path):
+    start = time.time()
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    src = sqlite3.connect(f'file:{src_path}?mode=ro', uri=True)
+    dst = sqlite3.connect(tmp_path)
+    src.backup(dst)
+    updated_at = info(dst, 'updatedAt')
+    src.close()
+    dst.close()
+    swap_in(tmp_path, db_path)
+    print(f'Installed {src_path} as {db_path} ({updated_at}) in {time.time() - start:.1f}s')
+    return 0
+
+
+def table_digest(conn, table, order):
+    if not has_table(conn, table):
+        return None
+    h = hashlib.sha256()
+    count = 0
+    reader = transcripts.Reader(conn, cache_size=0)
+    where = f' WHERE {VERIFY_EXCLUDE[table]}' if table in VERIFY_EXCLUDE else ''
+    rows = conn.execute(f'SELECT * FROM {table}{where} ORDER BY {order}')
+    compressed = [ table == 'videos' and d[0] in transcripts.COLUMNS for d in rows.description ]
+    for row in rows:
+        row = tuple(reader.decode(value) if decode else value for value, decode in zip(row, compressed))
+        h.update(repr(row).encode())
+        count += 1
+    return count, h.hexdigest()[:16]
+
+
+def verify(a_path, b_path, n):
+    """Returns the number of differences between the two databases."""
+    a = sqlite3.connect(f'file:{a_path}?mode=ro', uri=True)
+    b = sqlite3.connect(f'file:{b_path}?mode=ro', uri=True)
+    differences = 0
+    for table, order in VERIFY_TABLES.items():
+        digests = table_digest(a, table, order), table_digest(b, table, order)
+        same = digests[0] == digests[1]
+        differences += not same
+        print(f'  {table:<12} {"same" if same else "DIFFERENT"} {digests[0]} {"" if same else digests[1]}')
+
+    search_a, search_b = Search(a), Search(b)
+    queries = sample_queries(a, n)
+    mismatched = [ q for q in queries if search_a.query(q) != search_b.query(q) ]
+    for q in mismatched[:20]:
+        print(f'  MISMATCH {"phrase" if is_phrase(q) else "word"} {q!r}')
+    differences += len(mismatched)
+    print(f'{len(queries) - len(mismatched)}/{len(queries)} queries give the same results')
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build, apply and verify delta packages of squeex.db.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help='package the changes from the published database to the new one')
+    p.add_argument('--base', default=BASE_PATH, help=f'published database (default: {BASE_PATH})')
+    p.add_argument('--db', default=DB_PATH, help=f'new database (default: {DB_PATH})')
+    p.add_argument('--changeset', default=corpus.CHANGESET_PATH, help=f'merge changeset (default: {corpus.CHANGESET_PATH})')
+    p.add_argument('--out', default=DELTAS_DIR, help=f'package directory (default: {DELTAS_DIR})')
+
+    p = sub.add_parser('apply', help='apply a package to a database at its base version')
+    p.add_argument('package', help=f'package, or a `{LATEST}` file naming one')
+    p.add_argument('--db', default=BASE_PATH, help=f'database to update (default: {BASE_PATH})')
+
+    p = sub.add_parser('install', help='replace a database whole, with the same atomic swap')
+    p.add_argument('source')
+    p.add_argument('--db', default=BASE_PATH, help=f'database to replace (default: {BASE_PATH})')
+
+    p = sub.add_parser('verify', help='compare the tables and search results of two databases')
+    p.add_argument('a')
+    p.add_argument('b')
+    p.add_argument('--queries', type=int, default=SAMPLE_QUERIES, help=f'sampled words and phrases (default: {SAMPLE_QUERIES} each)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build(args.base, args.db, args.changeset, args.out)
+    elif args.command == 'apply':
+        sys.exit(apply(args.package, args.db))
+    elif args.command == 'install':
+        sys.exit(install(args.source, args.db))
+    else:
+        sys.exit(1 if verify(args.a, args.b, args.queries) else 0)
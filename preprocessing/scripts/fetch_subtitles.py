@@ -0,0 +1,172 @@
+import os
+import re
+import time
+import shlex
+import random
+import shutil
+import sqlite3
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+"""
+Downloads the auto-generated subtitles of the videos in data/urls.txt that
+are neither in the published database nor in data/vtt yet, and records
+their upload dates in data/dates.txt.
+
+Known videos are read once from the database (../app/data/squeex.db) and
+the vtt filenames indexed once, both into sets. Each new video takes one
+yt-dlp call that prints `id:upload_date` and writes the subtitles into a
+scratch directory, moved into data/vtt when it succeeds. Calls run in a
+pool of --jobs workers; a failed call is retried --retries times with
+exponential backoff, except for videos YouTube reports as unavailable
+(private, removed, members only), which are skipped. Videos that still
+fail are listed and left for the next run.
+
+--yt-dlp sets the command (default: $YT_DLP or yt-dlp), e.g. a fake
+executable for trying this without network access. It is called as
+    <yt-dlp> --no-simulate --print '%(id)s:%(upload_date)s'
+             --write-auto-subs --skip-download -o <template> -P <dir> <url>
+
+Usage:
+    python3 scripts/fetch_subtitles.py
+    python3 scripts/fetch_subtitles.py --jobs 8 --retries 5
+    python3 scripts/fetch_subtitles.py --yt-dlp ./fake-yt-dlp --db /dev/null
+"""
+
+URLS_PATH = 'data/urls.txt'
+VTT_PATH = 'data/vtt'
+DATES_PATH = 'data/dates.txt'
+DB_PATH = '../app/data/squeex.db'
+
+OUTPUT_TEMPLATE = '%(title)s [%(id)s].%(ext)s'
+PRINT_TEMPLATE = '%(id)s:%(upload_date)s'
+
+JOBS = 4
+RETRIES = 3
+BACKOFF = 2.0
+
+VTT_VID = re.compile(r'\[([^\[\]]*)\]\.[^.]+\.vtt$')
+DATE_LINE = re.compile(r'^(\S+):(\d{8})$')
+UNAVAILABLE = re.compile(r'Private video|Video unavailable|members-only|This live event|has been removed')
+
+
+def url_vid(url):
+    return url.split('v=', 1)[1].split('&', 1)[0] if 'v=' in url else url.rstrip('/').rsplit('/', 1)[-1]
+
+
+def read_urls(path):
+    with open(path) as f:
+        return [ line.strip() for line in f if line.strip() ]
+
+
+def known_vids(db_path):
+    """Video IDs in the published database, empty if there is none."""
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+        print(f'{db_path} not found, every video counts as new.')
+        return set()
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    vids = { vid for vid, in conn.execute('SELECT vid FROM videos') }
+    conn.close()
+    return vids
+
+
+def vtt_vids(vtt_dir):
+    vids = set()
+    if os.path.isdir(vtt_dir):
+        for name in os.listdir(vtt_dir):
+            m = VTT_VID.search(name)
+            if m:
+                vids.add(m.group(1))
+    return vids
+
+
+def fetch(cmd, url, vid, vtt_dir, retries, backoff):
+    """
+    Fetch one video. Returns (vid, 'ok', 'id:date' line), (vid, 'unavailable',
+    message) or (vid, 'failed', message) after the last retry.
+    """
+    scratch = os.path.join(vtt_dir, f'.fetch-{vid}')
+    args = [ *cmd, '--no-simulate', '--print', PRINT_TEMPLATE, '--write-auto-subs', '--skip-download',
+             '-o', OUTPUT_TEMPLATE, '-P', scratch, url ]
+    for attempt in range(retries + 1):
+        shutil.rmtree(scratch, ignore_errors=True)
+        proc = subprocess.run(args, capture_output=True, text=True)
+        dates = [ line for line in proc.stdout.splitlines() if DATE_LINE.match(line.strip()) ]
+        subtitles = [ name for name in os.listdir(scratch) if name.endswith('.vtt') ] if os.path.isdir(scratch) else []
+        if proc.returncode == 0 and dates and subtitles:
+            for name in subtitles:
+                os.replace(os.path.join(scratch, name), os.path.join(vtt_dir, name))
+            shutil.rmtree(scratch, ignore_errors=True)
+            return vid, 'ok', dates[-1].strip()
+
+        error = (proc.stderr.strip().splitlines() or [ f'exit {proc.returncode}, no subtitles' ])[-1]
+        if UNAVAILABLE.search(proc.stderr):
+            shutil.rmtree(scratch, ignore_errors=True)
+            return vid, 'unavailable', error
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt * (1 + random.random() / 2))
+    shutil.rmtree(scratch, ignore_errors=True)
+    return vid, 'failed', error
+
+
+def write_dates(path, lines):
+    """Add the lines to dates.txt, sorted and without duplicates."""
+    existing = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = { line.strip() for line in f if line.strip() }
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.writelines(f'{line}\n' for line in sorted(existing | set(lines)))
+    os.replace(tmp, path)
+
+
+def run(args):
+    start = time.time()
+    urls = read_urls(args.urls)
+    known = known_vids(args.db)
+    local = vtt_vids(args.vtt)
+    todo = {}
+    for url in urls:
+        vid = url_vid(url)
+        if vid not in known and vid not in local:
+            todo.setdefault(vid, url)
+    print(f'{len(urls)} urls: {len(known)} videos in {args.db}, {len(local)} in {args.vtt}, {len(todo)} to fetch')
+    if not todo:
+        return
+
+    os.makedirs(args.vtt, exist_ok=True)
+    cmd = shlex.split(args.yt_dlp)
+    dates = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [ pool.submit(fetch, cmd, url, vid, args.vtt, args.retries, args.backoff) for vid, url in todo.items() ]
+        for future in as_completed(futures):
+            vid, status, detail = future.result()
+            print(f'  {vid} {status} {detail}')
+            if status == 'ok':
+                dates.append(detail)
+            elif status == 'failed':
+                failed.append(vid)
+
+    write_dates(args.dates, dates)
+    print(f'Fetched {len(dates)}, unavailable {len(todo) - len(dates) - len(failed)}, failed {len(failed)} '
+          f'in {time.time() - start:.1f}s')
+    if failed:
+        print(f'Not fetched, tried again on the next run: {" ".join(failed)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the subtitles of new videos.')
+    parser.add_argument('--urls', default=URLS_PATH, help=f'video urls, one per line (default: {URLS_PATH})')
+    parser.add_argument('--db', default=DB_PATH, help=f'database with the known videos (default: {DB_PATH})')
+    parser.add_argument('--vtt', default=VTT_PATH, help=f'subtitle directory (default: {VTT_PATH})')
+    parser.add_argument('--dates', default=DATES_PATH, help=f'upload dates file (default: {DATES_PATH})')
+    parser.add_argument('--jobs', type=int, default=JOBS, help=f'videos fetched at the same time (default: {JOBS})')
+    parser.add_argument('--retries', type=int, default=RETRIES, help=f'retries of a failed fetch (default: {RETRIES})')
+    parser.add_argument('--backoff', type=float, default=BACKOFF, help=f'seconds before the first retry, doubling after (default: {BACKOFF})')
+    parser.add_argument('--yt-dlp', default=os.environ.get('YT_DLP', 'yt-dlp'), help='yt-dlp command (default: $YT_DLP or yt-dlp)')
+    args = parser.parse_args()
+
+    run(args)
@@ -2,8 +2,13 @@ import sys
 import os
 import json
 import re
+import heapq
+import argparse
+import tempfile
 from datetime import datetime
 
+import manifest
+
 '''
 Notes: create a single json object that stores all relevant data
 
@@ -38,69 +43,271 @@ Extended:
 	}
 }
 
+Usage:
+	python3 scripts/final.py            # every parsed file, for a full build_db.py
+	python3 scripts/final.py --changed  # only videos not yet built (see data/manifest.json), for merge.py
+	python3 scripts/final.py --stream --memory-mb 256
+
+--stream writes segments and full text one video at a time and builds the
+word map with sorted runs spilled to disk plus a k-way merge, so peak memory
+stays around --memory-mb instead of growing with the archive. The output is
+byte-for-byte the same as the in-memory build.
+
 '''
 
-if __name__ == '__main__':
+FINAL_PATH = 'data/final.json'
+FULL_PATH = 'data/full.json'
 
-	path = 'data/parsed'
-	files = os.listdir(path)
+def select_files(path, m, changed=False):
+	"""
+	Parsed files to include, leaving out the videos merge.py deleted. With
+	changed=True, only files whose manifest entry differs from what the
+	last final build recorded. Returns the filenames and the manifest
+	entries by filename.
+	"""
+	if changed and not m['files']:
+		print('The manifest has no files, building every parsed file', file=sys.stderr)
+		changed = False
+
+	entries = {}
+	for entry in m['files'].values():
+		entries[os.path.normpath(entry['output'])] = entry
 
+	deleted = set(m['deleted'])
+	files = []
+	by_filename = {}
+	orphans = []
+	for filename in os.listdir(path):
+		if not 'json' in filename: continue
+		entry = entries.get(os.path.normpath(os.path.join(path, filename)))
+		if entry is None:
+			orphans.append(filename)
+			if changed: continue
+		elif entry['vid'] in deleted:
+			continue
+		elif changed and m['final'].get(entry['vid']) == manifest.build_key(entry):
+			continue
+		files.append(filename)
+		by_filename[filename] = entry
+
+	if orphans and m['files']:
+		print(f'{len(orphans)} parsed files have no source vtt in the manifest' + (' (skipped)' if changed else '') + ':', file=sys.stderr)
+		for filename in orphans:
+			print(f'  {filename}', file=sys.stderr)
+	return files, by_filename
+
+def load_parsed(path, filename):
+	filepath = os.path.join(path, filename)
+	with open(filepath, 'r') as file:
+		try:
+			return json.load(file)
+		except Exception as e:
+			print(e)
+			print(filename)
+			sys.exit(1)
+
+def get_title(filename):
+	return re.sub(r' \[.*$', '', filename)
+
+def build_in_memory(path, files, updated_at):
 	final_segments = {}
 	final_word_map = {}
 	full_text_obj = {}
 	meta = {}
 	for filename in files:
-		if not 'json' in filename: continue
-		filepath = os.path.join(path, filename)
-
-		with open(filepath, 'r') as file:
-			try:
-				data = json.load(file)
-			except Exception as e:
-				print(e)
-				print(filename)
-				sys.exit(1)
-
-			vid = data['id']
-			segments = data['segments']
-			word_map = data['word_map']
-			full_text = data['full_text']
-			idx_to_time = data['idx_to_time']
-			upload_date = data['upload_date']
-			title = re.sub(r' \[.*$', '', filename)
-
-			final_segments[vid] = segments
-			meta[vid] = {
-				'upload_date': upload_date,
-				'title': title
-			}
-
-			for word in word_map:
-				if word in final_word_map:
-					final_word_map[word][vid] = word_map[word]
-				else:
-					final_word_map[word] = {
-						vid: word_map[word]
-					}
-
-			full_text_obj[vid] = {
-				'text': full_text,
-				'idx_to_time': idx_to_time
-			}
+		data = load_parsed(path, filename)
+
+		vid = data['id']
+		segments = data['segments']
+		word_map = data['word_map']
+		full_text = data['full_text']
+		idx_to_time = data['idx_to_time']
+		upload_date = data['upload_date']
+		title = get_title(filename)
+
+		final_segments[vid] = segments
+		meta[vid] = {
+			'upload_date': upload_date,
+			'title': title
+		}
+
+		for word in word_map:
+			if word in final_word_map:
+				final_word_map[word][vid] = word_map[word]
+			else:
+				final_word_map[word] = {
+					vid: word_map[word]
+				}
+
+		full_text_obj[vid] = {
+			'text': full_text,
+			'idx_to_time': idx_to_time
+		}
 
 	output = {
 		'segments': final_segments,
 		'word_map': final_word_map,
 		'meta': meta,
-		'updatedAt': str(datetime.now())
+		'updatedAt': updated_at
 	}
 
-	# print(json.dumps(output, indent=2))
-	# print(json.dumps(final_segments, indent=2))
-
-
-	with open('data/final.json', 'w') as f:
+	with open(FINAL_PATH, 'w') as f:
 		json.dump(output, f)
 
-	with open('data/full.json', 'w') as f:
+	with open(FULL_PATH, 'w') as f:
 		json.dump(full_text_obj, f)
+
+
+class RunWriter:
+	"""
+	Buffers sortable text records and spills them to disk as sorted runs
+	once the buffer passes the memory budget. Records are tab separated
+	lines; the last field may contain anything but a newline.
+	"""
+
+	# Rough per-record overhead of the tuple, ints and str objects.
+	OVERHEAD = 200
+
+	def __init__(self, tmp_dir, name, budget, key):
+		self.tmp_dir = tmp_dir
+		self.name = name
+		self.budget = budget
+		self.key = key
+		self.buffer = []
+		self.size = 0
+		self.runs = []
+
+	def add(self, record, size):
+		self.buffer.append(record)
+		self.size += size + self.OVERHEAD
+		if self.size >= self.budget:
+			self.spill()
+
+	def spill(self):
+		self.buffer.sort(key=self.key)
+		run_path = os.path.join(self.tmp_dir, f'{self.name}-{len(self.runs)}.run')
+		with open(run_path, 'w', encoding='utf-8') as f:
+			for record in self.buffer:
+				f.write('\t'.join(map(str, record)) + '\n')
+		self.runs.append(run_path)
+		self.buffer = []
+		self.size = 0
+
+	def merged(self, parse):
+		"""All records in key order. The last buffer is merged from memory."""
+		self.buffer.sort(key=self.key)
+		files = [ open(run_path, encoding='utf-8') for run_path in self.runs ]
+		try:
+			streams = [ (parse(line) for line in f) for f in files ]
+			streams.append(iter(self.buffer))
+			yield from heapq.merge(*streams, key=self.key)
+		finally:
+			for f in files:
+				f.close()
+			for run_path in self.runs:
+				os.remove(run_path)
+			self.buffer = []
+
+
+def parse_posting_record(line):
+	word, file_idx, pos, chunk = line.rstrip('\n').split('\t', 3)
+	return (word, int(file_idx), int(pos), chunk)
+
+def parse_entry_record(line):
+	file_idx, pos, entry = line.rstrip('\n').split('\t', 2)
+	return (int(file_idx), int(pos), entry)
+
+def build_streaming(path, files, updated_at, memory_mb=256, tmp_dir=None):
+	"""
+	Same output as build_in_memory, without holding the archive in memory.
+
+	The word map key order is the order words are first seen (file order,
+	then position in that file's word_map), and each word's videos are in
+	file order. Phase 1 sorts (word, file, pos, "vid": [...]) records by word
+	and joins each word's videos into one entry; phase 2 sorts the entries
+	back into first-seen order.
+	"""
+	budget = int(memory_mb * 1024 * 1024)
+	meta = {}
+	dumps = json.dumps
+
+	with tempfile.TemporaryDirectory(dir=tmp_dir, prefix='final-') as tmp:
+		postings = RunWriter(tmp, 'postings', budget // 2, key=lambda r: (r[0], r[1]))
+
+		with open(FINAL_PATH, 'w') as final_file, open(FULL_PATH, 'w') as full_file:
+			final_file.write('{"segments": {')
+			full_file.write('{')
+
+			for file_idx, filename in enumerate(files):
+				data = load_parsed(path, filename)
+				vid = data['id']
+				if vid in meta:
+					print(f'Duplicate video id {vid} in {filename}; use the in-memory build.')
+					sys.exit(1)
+
+				sep = ', ' if file_idx else ''
+				final_file.write(f'{sep}{dumps(vid)}: {dumps(data["segments"])}')
+				full_file.write(f'{sep}{dumps(vid)}: ' + dumps({
+					'text': data['full_text'],
+					'idx_to_time': data['idx_to_time']
+				}))
+				meta[vid] = {
+					'upload_date': data['upload_date'],
+					'title': get_title(filename)
+				}
+
+				vid_key = dumps(vid)
+				for pos, (word, idxs) in enumerate(data['word_map'].items()):
+					chunk = f'{vid_key}: {dumps(idxs)}'
+					postings.add((word, file_idx, pos, chunk), len(word) + len(chunk))
+				del data
+
+			full_file.write('}')
+
+			# Phase 1: group each word's videos.
+			entries = RunWriter(tmp, 'entries', budget // 2, key=lambda r: (r[0], r[1]))
+			word, first, chunks = None, None, []
+			for record in postings.merged(parse_posting_record):
+				if record[0] != word:
+					if word is not None:
+						entry = dumps(word) + ': {' + ', '.join(chunks) + '}'
+						entries.add((first[0], first[1], entry), len(entry))
+					word, first, chunks = record[0], (record[1], record[2]), []
+				chunks.append(record[3])
+			if word is not None:
+				entry = dumps(word) + ': {' + ', '.join(chunks) + '}'
+				entries.add((first[0], first[1], entry), len(entry))
+			chunks = None
+
+			# Phase 2: write entries in first-seen order.
+			final_file.write('}, "word_map": {')
+			for n, (_, _, entry) in enumerate(entries.merged(parse_entry_record)):
+				final_file.write((', ' if n else '') + entry)
+			final_file.write('}, "meta": ' + dumps(meta) + ', "updatedAt": ' + dumps(updated_at) + '}')
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Combine parsed videos into data/final.json and data/full.json.')
+	parser.add_argument('--changed', action='store_true', help='only include videos that are new or changed since the last build')
+	parser.add_argument('--manifest', default=manifest.MANIFEST_PATH)
+	parser.add_argument('--stream', action='store_true', help='bounded-memory build (same output)')
+	parser.add_argument('--memory-mb', type=float, default=256, help='--stream memory budget for the word map (default: 256)')
+	parser.add_argument('--tmp-dir', default=None, help='--stream directory for sorted runs (default: system temp)')
+	args = parser.parse_args()
+
+	path = 'data/parsed'
+	m = manifest.load(args.manifest)
+	files, entries = select_files(path, m, args.changed)
+	print(f'Building from {len(files)} parsed files', file=sys.stderr)
+
+	updated_at = str(datetime.now())
+	if args.stream:
+		build_streaming(path, files, updated_at, args.memory_mb, args.tmp_dir)
+	else:
+		build_in_memory(path, files, updated_at)
+
+	# Record what was built; merge.py moves it to m['final'] once the
+	# changeset is written, so --changed only skips it after that.
+	m['pending'] = { entry['vid']: manifest.build_key(entry) for entry in entries.values() if entry is not None }
+	if m['files']:
+		manifest.save(m, args.manifest)
@@ -0,0 +1,154 @@
+import re
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+"""
+Near-spellings of a word in the vocabulary, by symmetric deletion.
+
+Auto-captions misspell the channel's words (squex, squix, valerant...), so
+a search can be expanded to the words within a small edit distance of the
+query. Scanning the vocabulary with an edit distance per request is too
+slow; instead build_db.py stores, for every eligible word, the strings left
+after deleting up to MAX_EDITS characters from its first PREFIX characters
+(fuzzy(key, word)). Two words within MAX_EDITS edits share such a string,
+so a lookup generates the query's deletions, reads the words under those
+keys and keeps those whose real distance (optimal string alignment:
+insertions, deletions, substitutions and swaps of adjacent letters) is
+within the query's limit.
+
+Eligible words are lowercase ASCII letters, MIN_LENGTH or longer, with
+MIN_MENTIONS mentions (word_totals): one-off noise is left out and the
+table stays small. Expansions are ranked by distance, then by mentions,
+and capped at MAX_EXPANSIONS, so the lookup reads at most a bounded number
+of keys and candidates whatever the query. Past MAX_CANDIDATES, the most
+mentioned candidates are kept (then by word), so the expansions do not
+depend on the order SQLite reads the keys in.
+
+app/lib/fuzzy.js does the same lookup for the server (?fuzzy=1).
+
+Usage:
+    python3 scripts/fuzzy.py squeex valorant      # expansions of the words
+    python3 scripts/fuzzy.py --check              # against a full scan
+"""
+
+DB_PATH = 'data/squeex.db'
+
+PREFIX = 7
+MAX_EDITS = 2
+MIN_LENGTH = 4
+MAX_LENGTH = 32
+MIN_MENTIONS = 2
+MAX_CANDIDATES = 2000
+MAX_EXPANSIONS = 10
+
+WORD = re.compile(r'[a-z]+')
+
+
+def eligible(word, mentions):
+    return MIN_LENGTH <= len(word) <= MAX_LENGTH and mentions >= MIN_MENTIONS and WORD.fullmatch(word) is not None
+
+
+def can_expand(word):
+    return MIN_LENGTH <= len(word) <= MAX_LENGTH and WORD.fullmatch(word) is not None
+
+
+def max_distance(word):
+    """Edits allowed for a query: one for short words, where two match too much."""
+    return 1 if len(word) <= 5 else MAX_EDITS
+
+
+def deletes(word):
+    """The fuzzy keys of a word: its prefix with up to MAX_EDITS characters deleted, sorted."""
+    keys = { word[:PREFIX] }
+    edge = keys
+    for _ in range(MAX_EDITS):
+        edge = { key[:i] + key[i + 1:] for key in edge for i in range(len(key)) }
+        keys |= edge
+    return sorted(keys)
+
+
+def distance(a, b):
+    """Optimal string alignment distance."""
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [ i ] + [ 0 ] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        prev2, prev = prev, row
+    return prev[-1]
+
+
+def rank(word, candidates):
+    """The best [ (word, mentions) ] within the word's limit, closest and most mentioned first."""
+    limit = max_distance(word)
+    scored = []
+    for candidate, mentions in candidates:
+        if candidate == word or abs(len(candidate) - len(word)) > limit: continue
+        d = distance(word, candidate)
+        if d <= limit:
+            scored.append((d, -mentions, candidate))
+    scored.sort()
+    return [ (candidate, -mentions) for _, mentions, candidate in scored[:MAX_EXPANSIONS] ]
+
+
+def rows(word, mentions):
+    """fuzzy rows of a word_totals row."""
+    return [ (key, word) for key in deletes(word) ] if eligible(word, mentions) else []
+
+
+def expand(conn, word):
+    """[ (word, mentions) ] near-spellings of word, like expand in app/lib/get.js."""
+    word = word.lower()
+    if not can_expand(word):
+        return []
+    keys = deletes(word)
+    candidates = conn.execute(f'''SELECT DISTINCT f.word, t.mentions
+        FROM fuzzy f JOIN word_totals t ON t.word = f.word
+        WHERE f.key IN ({", ".join("?" * len(keys))})
+        ORDER BY t.mentions DESC, f.word LIMIT ?''', (*keys, MAX_CANDIDATES)).fetchall()
+    return rank(word, candidates)
+
+
+def check(conn, n, seed=0):
+    """Lookups of sampled words against ranking every eligible word; exits 1 on a difference."""
+    vocabulary = [ (word, mentions) for word, mentions in conn.execute('SELECT word, mentions FROM word_totals')
+                   if eligible(word, mentions) ]
+    rng = random.Random(seed)
+    words = rng.sample([ word for word, _ in vocabulary ], min(n, len(vocabulary)))
+    lookup_time = scan_time = 0
+    differ = 0
+    for word in words:
+        start = time.perf_counter()
+        found = expand(conn, word)
+        lookup_time += time.perf_counter() - start
+        start = time.perf_counter()
+        expected = rank(word, vocabulary)
+        scan_time += time.perf_counter() - start
+        if found != expected:
+            differ += 1
+            print(f'  {word}: {found} != {expected}')
+    print(f'{len(words)} words of {len(vocabulary)}: lookup {lookup_time / len(words) * 1000:.2f} ms, '
+          f'scan {scan_time / len(words) * 1000:.2f} ms per word, {differ} differ')
+    return differ
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Near-spellings of words in squeex.db.')
+    parser.add_argument('words', nargs='*')
+    parser.add_argument('--db', default=DB_PATH, help=f'database (default: {DB_PATH})')
+    parser.add_argument('--check', action='store_true', help='compare lookups with a full scan')
+    parser.add_argument('--queries', type=int, default=200, help='--check: sampled words (default: 200)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    if args.check:
+        sys.exit(1 if check(conn, args.queries) else 0)
+    for word in args.words:
+        print(word, ' '.join(f'{w}({m})' for w, m in expand(conn, word)))
@@ -0,0 +1,161 @@
+import os
+import json
+import hashlib
+
+"""
+Content-hash manifest for the parse stage (data/manifest.json).
+
+Records, for every vtt file, the sha256 of its contents, the parser
+fingerprint it was parsed with and the parsed output path, so parse.py can
+skip unchanged inputs and final.py can pick out videos it hasn't built yet.
+
+Format:
+{
+    parser: <fingerprint of the parser source + stopword list + flags>,
+    files: {
+        [vtt basename]: { sha256, size, mtime, parser, upload_date, vid, output }
+    },
+    final: {
+        [vid]: <sha256>:<parser> of the parsed output last merged into the corpus
+    },
+    pending: {
+        [vid]: <sha256>:<parser> built by final.py, moved to final by merge.py
+    },
+    deleted: [ vid removed from the corpus with merge.py --delete ]
+}
+
+final.py records what it built under pending; merge.py promotes it once it
+has written the changeset, so a failed merge leaves those videos to be
+picked up again by the next final.py --changed. final.py leaves the
+deleted videos out; remove one from the list to bring it back.
+"""
+
+MANIFEST_PATH = 'data/manifest.json'
+PARSE_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parse.py')
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parser_fingerprint(stopwords, source_paths=(PARSE_SOURCE,), flags=()):
+    """Changes whenever the parser source, the stopword list or the flags that change its output change."""
+    h = hashlib.sha256()
+    for path in source_paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    h.update('\n'.join(stopwords).encode('utf-8'))
+    if flags:
+        h.update(('\0' + '\n'.join(flags)).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def load(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return { 'parser': None, 'files': {}, 'final': {}, 'pending': {}, 'deleted': [] }
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest.setdefault('files', {})
+    manifest.setdefault('final', {})
+    manifest.setdefault('pending', {})
+    manifest.setdefault('deleted', [])
+    return manifest
+
+
+def save(manifest, path=MANIFEST_PATH):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def content_hash(entry, vtt_path):
+    """sha256 of vtt_path, reusing the manifest value when size and mtime match."""
+    st = os.stat(vtt_path)
+    if entry and entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime_ns:
+        return entry['sha256'], st
+    return file_sha256(vtt_path), st
+
+
+def plan(manifest, jobs, fingerprint, dates, get_vid, force=False):
+    """
+    Split (vtt, output) jobs into those that need parsing and those that are
+    up to date. Returns (todo, skipped, entries) where entries holds the new
+    manifest entry for every job in todo, keyed by vtt basename.
+    """
+    files = manifest['files']
+    todo, skipped, entries = [], [], {}
+    for vtt_path, output_path in jobs:
+        name = os.path.basename(vtt_path)
+        old = files.get(name)
+        sha, st = content_hash(old, vtt_path)
+        vid = get_vid(vtt_path)
+        entry = {
+            'sha256': sha,
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'parser': fingerprint,
+            'upload_date': dates.get(vid),
+            'vid': vid,
+            'output': output_path,
+        }
+        up_to_date = (
+            not force and old is not None
+            and old.get('sha256') == sha
+            and old.get('parser') == fingerprint
+            and old.get('upload_date') == entry['upload_date']
+            and old.get('output') == output_path
+            and os.path.exists(output_path)
+        )
+        if up_to_date:
+            # Refresh size/mtime so the next run can skip the hash.
+            files[name] = entry
+            skipped.append(vtt_path)
+        else:
+            todo.append((vtt_path, output_path))
+            entries[name] = entry
+    return todo, skipped, entries
+
+
+def find_orphans(manifest, out_dir, vtt_names=None):
+    """
+    Parsed outputs in out_dir that no longer have a source vtt: either not
+    produced by any manifest entry, or produced by one whose vtt is gone.
+    """
+    files = manifest['files']
+    if vtt_names is not None:
+        live = { e['output'] for name, e in files.items() if name in vtt_names }
+    else:
+        live = { e['output'] for e in files.values() }
+    live = { os.path.normpath(p) for p in live }
+    orphans = []
+    for filename in sorted(os.listdir(out_dir)):
+        if not filename.endswith('.json'): continue
+        path = os.path.normpath(os.path.join(out_dir, filename))
+        if path not in live:
+            orphans.append(path)
+    return orphans
+
+
+def build_key(entry):
+    return f"{entry['sha256']}:{entry['parser']}"
+
+
+def promote_pending(path=MANIFEST_PATH, deleted=()):
+    """
+    Move the keys final.py recorded under pending to final, and add the
+    deleted vids to deleted. Returns how many keys were moved.
+    """
+    if not os.path.exists(path) and not deleted:
+        return 0
+    manifest = load(path)
+    pending = manifest['pending']
+    manifest['final'].update(pending)
+    manifest['pending'] = {}
+    manifest['deleted'] = sorted(set(manifest['deleted']) | set(deleted))
+    save(manifest, path)
+    return len(pending)
@@ -0,0 +1,193 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+from search import Search, segments_json
+
+"""
+Precomputes the search results of the queries visitors run most into
+squeex.db, so the server answers them without searching:
+
+    results(query, segments, num_results, num_videos)
+
+query is the normalized query (normalize_query, the same as
+normalizeQuery in app/lib/get.js), segments the JSON of the API payload's
+segments exactly as the server would send it (see search.py).
+info.resultsUpdatedAt records the updatedAt the results were computed at;
+the server ignores the table when it differs from info.updatedAt, e.g.
+after build_db.py --incremental and before this runs again.
+
+The queries are every term in suggestions.json (pills, random, trending,
+phrases), the --top most frequent queries in the server's request logs
+(--log, the lines logResults in app/routes/index.js prints) and any in
+--queries files (one per line). The table is rewritten on every run.
+
+--check recomputes every stored result and compares; with --url it asks
+the running server instead.
+
+Usage:
+    python3 scripts/materialize.py
+    python3 scripts/materialize.py --log ~/squeex.log --top 500
+    python3 scripts/materialize.py --check [--url http://localhost:3003]
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
+
+DB_PATH = 'data/squeex.db'
+SUGGESTIONS_PATH = os.path.join(REPO_ROOT, 'suggestions.json')
+SUGGESTION_KEYS = ('pills', 'random', 'trending', 'phrases')
+TOP_QUERIES = 200
+
+# `${timestamp} | ${time}ms | ${query padded to 50} | ${n} results | ${n} videos |`
+LOG_LINE = re.compile(r'^.*? \| +\d+ms \| (.*) \| +\d+ results \| +\d+ videos \|$')
+
+
+def normalize_query(query):
+    """
+    Queries with the same results share a key: search ignores case, for
+    non-ASCII queries only as far as JavaScript does, so those are kept as is.
+    """
+    return query.lower() if query.isascii() else query
+
+
+def suggested_queries(path):
+    with open(path) as f:
+        suggestions = json.load(f)
+    return [ term for key in SUGGESTION_KEYS for term in suggestions.get(key, []) ]
+
+
+def logged_queries(paths, top):
+    """The `top` most frequent normalized queries in the request logs."""
+    counts = Counter()
+    for path in paths:
+        with open(path, errors='replace') as f:
+            for line in f:
+                m = LOG_LINE.match(line.rstrip('\n'))
+                if m:
+                    query = m.group(1).rstrip(' ')
+                    if query:
+                        counts[normalize_query(query)] += 1
+    return [ query for query, _ in counts.most_common(top) ]
+
+
+def listed_queries(paths):
+    queries = []
+    for path in paths:
+        with open(path) as f:
+            queries += [ line.rstrip('\n') for line in f if line.strip() ]
+    return queries
+
+
+def collect_queries(args):
+    """{ normalized query: source } in the order they are materialized."""
+    sources = {}
+    if os.path.exists(args.suggestions):
+        for query in suggested_queries(args.suggestions):
+            sources.setdefault(normalize_query(query), 'suggestions')
+    else:
+        print(f'{args.suggestions} not found, no suggested queries.')
+    for query in logged_queries(args.log, args.top):
+        sources.setdefault(query, 'logs')
+    for query in listed_queries(args.queries):
+        sources.setdefault(normalize_query(query), 'queries')
+    return sources
+
+
+def count_results(segments):
+    return sum(len(matches) for matches in segments.values()), len(segments)
+
+
+def db_updated_at(conn):
+    return conn.execute("SELECT value FROM info WHERE key = 'updatedAt'").fetchone()[0]
+
+
+def materialize(db_path, sources):
+    start = time.time()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    search = Search(conn)
+    updated_at = db_updated_at(conn)
+
+    rows = []
+    for query in sources:
+        segments = search.query(query)
+        rows.append((query, segments_json(segments), *count_results(segments)))
+    search_time = time.time() - start
+
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('DROP TABLE IF EXISTS results')
+    c.execute('''CREATE TABLE results (
+        query TEXT PRIMARY KEY,
+        segments TEXT,
+        num_results INTEGER,
+        num_videos INTEGER
+    )''')
+    c.executemany('INSERT INTO results VALUES (?, ?, ?, ?)', rows)
+    c.execute("INSERT OR REPLACE INTO info VALUES ('resultsUpdatedAt', ?)", (updated_at,))
+    c.execute('COMMIT')
+    conn.close()
+
+    size_mb = sum(len(row[1]) for row in rows) / (1024 * 1024)
+    by_source = Counter(sources.values())
+    print(f'Materialized {len(rows)} queries ({", ".join(f"{n} from {s}" for s, n in by_source.items())}) '
+          f'in {time.time() - start:.1f}s ({search_time:.1f}s searching), {size_mb:.1f} MB of results at {updated_at}')
+
+
+def fetch_segments(url, query):
+    with urllib.request.urlopen(f'{url.rstrip("/")}/{urllib.parse.quote(query, safe="")}') as response:
+        payload = json.load(response)
+    return payload.get('segments', {}), payload.get('updatedAt')
+
+
+def check(db_path, url=None):
+    """Compare every stored result with a fresh search. Returns the number of mismatches."""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    updated_at = db_updated_at(conn)
+    row = conn.execute("SELECT value FROM info WHERE key = 'resultsUpdatedAt'").fetchone()
+    if row is None:
+        print(f'{db_path} has no precomputed results, run materialize.py first.')
+        return 1
+    if row[0] != updated_at:
+        print(f'Precomputed results are from {row[0]}, the database is at {updated_at}: the server will not use them.')
+        return 1
+
+    search = Search(conn)
+    rows = conn.execute('SELECT query, segments, num_results, num_videos FROM results').fetchall()
+    mismatches = 0
+    for query, stored, num_results, num_videos in rows:
+        if url:
+            segments, server_updated_at = fetch_segments(url, query)
+            ok = json.loads(stored) == segments and server_updated_at == updated_at
+        else:
+            segments = search.query(query)
+            ok = segments_json(segments) == stored and count_results(segments) == (num_results, num_videos)
+        if not ok:
+            mismatches += 1
+            print(f'  MISMATCH {query!r}')
+    conn.close()
+    print(f'{len(rows) - mismatches}/{len(rows)} precomputed results match {url or "a fresh search"}')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the results of suggested and frequent queries.')
+    parser.add_argument('--db', default=DB_PATH, help=f'database to search and write to (default: {DB_PATH})')
+    parser.add_argument('--suggestions', default=SUGGESTIONS_PATH, help='suggestions.json written by analyze_deviance.py')
+    parser.add_argument('--log', action='append', default=[], help='server request log to take frequent queries from (repeatable)')
+    parser.add_argument('--top', type=int, default=TOP_QUERIES, help=f'most frequent logged queries to include (default: {TOP_QUERIES})')
+    parser.add_argument('--queries', action='append', default=[], help='file with more queries, one per line (repeatable)')
+    parser.add_argument('--check', action='store_true', help='compare the stored results with a fresh search')
+    parser.add_argument('--url', help='--check: compare with the server at this URL instead')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check(args.db, args.url) else 0)
+    materialize(args.db, collect_queries(args))
@@ -1,88 +1,113 @@
 import json
 import os
 import sys
+import sqlite3
+import argparse
+
+import corpus
+import manifest
 
 """
-Merges newly generated data (data/final.json, data/full.json) with
-existing server data (../app/data/squeex.json, ../app/data/squeex_full.json).
+Merges newly generated data (data/final.json, the videos final.py
+--changed built) into the corpus, the database (data/squeex.db).
 
 New data takes precedence for overlapping video IDs.
-Result is written back to data/final.json and data/full.json.
+
+The merge works out the changeset and leaves applying it to build_db.py
+--incremental: videos in the new data are added, or replaced when the
+database has them, and videos passed with --delete are removed. Only the
+new data is read and only its videos are looked up in the database, so a
+merge costs what the changeset does, not what the corpus does.
+
+The changeset is written to data/changeset.json for the later stages
+(build_db.py --incremental reads the new videos from data/final.json and
+data/full.json). The videos final.py built are then marked as merged in
+data/manifest.json, and the deleted ones recorded there, so that final.py
+leaves them out from then on, full builds included.
+
+Without a database every new video is added, and the database needs a
+full build.
+
+Usage:
+    python3 scripts/merge.py
+    python3 scripts/merge.py --delete <vid> [<vid> ...]
+    python3 scripts/merge.py --delete-file data/deleted_ids.txt
 """
 
-EXISTING_FINAL = '../app/data/squeex.json'
-EXISTING_FULL = '../app/data/squeex_full.json'
+DB_PATH = 'data/squeex.db'
 NEW_FINAL = 'data/final.json'
-NEW_FULL = 'data/full.json'
 
-if __name__ == '__main__':
-    if not os.path.exists(EXISTING_FINAL):
-        print(f'{EXISTING_FINAL} not found, skipping merge.')
-        sys.exit(0)
 
-    print('Loading existing server data...')
-    with open(EXISTING_FINAL, 'r') as f:
-        existing = json.load(f)
-    with open(EXISTING_FULL, 'r') as f:
-        existing_full = json.load(f)
+def has_video(conn, vid):
+    return conn is not None and conn.execute('SELECT 1 FROM videos WHERE vid = ?', (vid,)).fetchone() is not None
 
-    print('Loading new data...')
-    with open(NEW_FINAL, 'r') as f:
-        new = json.load(f)
-    with open(NEW_FULL, 'r') as f:
-        new_full = json.load(f)
 
-    # Start with existing data as the base, then overlay new data.
-    # New data takes precedence for overlapping video IDs.
+def plan_changeset(conn, new, deleted):
+    """
+    The changeset that merges `new` (final.json of the changed videos) and
+    removes the `deleted` video IDs, against the database conn (None when
+    there is none yet).
+    """
+    base = None
+    if conn is not None:
+        base = conn.execute("SELECT value FROM info WHERE key = 'updatedAt'").fetchone()[0]
 
-    # Segments: merge by video ID
-    merged_segments = {**existing['segments'], **new['segments']}
+    changeset = corpus.new_changeset(base, new['updatedAt'])
+    for vid in new['meta']:
+        if has_video(conn, vid):
+            changeset['replaced'].append(vid)
+        else:
+            changeset['added'].append(vid)
+    changeset['deleted'] = [ vid for vid in deleted if has_video(conn, vid) ]
+    return changeset
 
-    # Meta: merge by video ID
-    merged_meta = {**existing['meta'], **new['meta']}
 
-    # Full text: merge by video ID
-    merged_full = {**existing_full, **new_full}
+def read_deleted(args):
+    deleted = list(args.delete)
+    if args.delete_file:
+        with open(args.delete_file) as f:
+            deleted += [ line.strip() for line in f if line.strip() ]
+    return deleted
 
-    # Word map: merge per word, per video ID
-    merged_word_map = {}
-    for word, vids in existing['word_map'].items():
-        merged_word_map[word] = dict(vids)
-    for word, vids in new['word_map'].items():
-        if word in merged_word_map:
-            merged_word_map[word].update(vids)
-        else:
-            merged_word_map[word] = dict(vids)
-
-    # Remove any word_map entries for video IDs not in merged_segments.
-    # This cleans up stale references.
-    for word in list(merged_word_map.keys()):
-        merged_word_map[word] = {
-            vid: idxs for vid, idxs in merged_word_map[word].items()
-            if vid in merged_segments
-        }
-        if not merged_word_map[word]:
-            del merged_word_map[word]
-
-    existing_only = len(existing['meta']) - len(set(existing['meta']) & set(new['meta']))
-    new_only = len(new['meta']) - len(set(existing['meta']) & set(new['meta']))
-    overlap = len(set(existing['meta']) & set(new['meta']))
-    print(f'Existing: {len(existing["meta"])} videos')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge new videos into the existing corpus.')
+    parser.add_argument('--delete', nargs='*', default=[], metavar='VID', help='video IDs to remove from the corpus')
+    parser.add_argument('--delete-file', help='file with one video ID to remove per line')
+    parser.add_argument('--db', default=DB_PATH, help=f'database the changeset applies to (default: {DB_PATH})')
+    parser.add_argument('--changeset', default=corpus.CHANGESET_PATH, help=f'where to write the changeset (default: {corpus.CHANGESET_PATH})')
+    parser.add_argument('--manifest', default=manifest.MANIFEST_PATH, help=f'parse manifest to mark the merged videos in (default: {manifest.MANIFEST_PATH})')
+    args = parser.parse_args()
+
+    print('Loading new data...')
+    with open(NEW_FINAL, 'r') as f:
+        new = json.load(f)
+
+    deleted = read_deleted(args)
+    conflicts = set(deleted) & set(new['meta'])
+    if conflicts:
+        print(f'Cannot both add and delete: {", ".join(sorted(conflicts))}')
+        sys.exit(1)
+
+    conn = None
+    if os.path.exists(args.db):
+        conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    else:
+        print(f'{args.db} not found, adding every video (build_db.py has to do a full build).')
+    changeset = plan_changeset(conn, new, deleted)
+    if conn is not None:
+        conn.close()
+
+    print(f'Base: {changeset["base"]}')
     print(f'New: {len(new["meta"])} videos')
-    print(f'Overlap: {overlap} videos')
-    print(f'Merged: {len(merged_meta)} videos')
-
-    output = {
-        'segments': merged_segments,
-        'word_map': merged_word_map,
-        'meta': merged_meta,
-        'updatedAt': new['updatedAt']
-    }
-
-    print('Writing merged data...')
-    with open(NEW_FINAL, 'w') as f:
-        json.dump(output, f)
-    with open(NEW_FULL, 'w') as f:
-        json.dump(merged_full, f)
+    print(f'Added: {len(changeset["added"])} {" ".join(changeset["added"])}')
+    print(f'Replaced: {len(changeset["replaced"])} {" ".join(changeset["replaced"])}')
+    print(f'Deleted: {len(changeset["deleted"])} {" ".join(changeset["deleted"])}')
+    missing = sorted(set(deleted) - set(changeset['deleted']))
+    if missing:
+        print(f'Not in corpus, only recorded as deleted: {" ".join(missing)}')
+
+    corpus.save_changeset(changeset, args.changeset)
+    manifest.promote_pending(args.manifest, deleted)
 
     print('Merge complete.')
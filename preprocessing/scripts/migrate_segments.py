@@ -0,0 +1,51 @@
+import json
+import sqlite3
+import sys
+import time
+
+"""
+Adds the normalized segments(vid, idx, start, text) table to an existing
+database built before build_db.py wrote it. The videos.segments JSON
+column is left as it is, so servers that still read it keep working
+during the rollout; servers that find the table use it for word search.
+
+Safe to re-run: videos that already have segment rows are skipped.
+
+Usage:
+    python3 scripts/migrate_segments.py [data/squeex.db]
+"""
+
+DB_PATH = 'data/squeex.db'
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    c = conn.cursor()
+    start = time.time()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute('''CREATE TABLE IF NOT EXISTS segments (
+            vid TEXT,
+            idx INTEGER,
+            start INTEGER,
+            text TEXT,
+            PRIMARY KEY (vid, idx)
+        ) WITHOUT ROWID''')
+
+        done = { vid for (vid,) in c.execute('SELECT DISTINCT vid FROM segments') }
+        todo = [ vid for (vid,) in c.execute('SELECT vid FROM videos') if vid not in done ]
+        rows = 0
+        for vid in todo:
+            (segments,) = c.execute('SELECT segments FROM videos WHERE vid = ?', (vid,)).fetchone()
+            batch = [ (vid, idx, s, text) for idx, (s, text) in enumerate(json.loads(segments or '[]')) ]
+            c.executemany('INSERT INTO segments VALUES (?, ?, ?, ?)', batch)
+            rows += len(batch)
+        c.execute('COMMIT')
+    except BaseException:
+        c.execute('ROLLBACK')
+        raise
+    c.execute('ANALYZE segments')
+    conn.close()
+
+    print(f'Migrated {len(todo)} videos ({len(done)} already done), {rows} segment rows in {time.time() - start:.1f}s')
@@ -1,12 +1,19 @@
 import sys
-import webvtt
+import os
+import glob
+import time
+import argparse
 import re
 import json
+from multiprocessing import Pool
+
+import manifest
 
 import nltk
 # nltk.download('stopwords')
 from nltk.corpus import stopwords
 sw = stopwords.words('english')
+sw_set = frozenset(sw)
 
 '''
 Notes
@@ -31,91 +38,357 @@ output:
 
 segment object:
     [start time, text]
-'''
 
-def get_sec(time_str):
-    """Get seconds from time."""
-    h, m, s = re.sub(r'\..*$', '', time_str).split(':')
-    return int(h) * 3600 + int(m) * 60 + int(s)
+usage:
+    python3 scripts/parse.py data/vtt/<file>.en.vtt > data/parsed/<file>.en.json
 
-if __name__ == '__main__':
+    # Batch mode: one process pool for a whole directory (or glob) of vtt files.
+    # Files whose content, upload date and parser are unchanged since the last
+    # run (see data/manifest.json) are skipped; --force reparses everything.
+    python3 scripts/parse.py --batch data/vtt --out data/parsed --workers 8
 
-    if len(sys.argv) < 2:
-        print('Expected 1 command line paramter (vtt file path). Exiting...')
-        sys.exit(1)
+    # Rebuild the spoken lines from the rolling cues (see normalized_segments).
+    python3 scripts/parse.py --batch data/vtt --out data/parsed --normalize
+'''
+
+DATES_PATH = 'data/dates.txt'
+PARSED_PATH = 'data/parsed'
 
-    # Get all upload dates by video id.
+def get_sec(time_str):
+    """Get seconds from an [hh:]mm:ss.ttt timestamp."""
+    fields = time_str[:-4].split(':')
+    if time_str[-4:-3] != '.' or not 2 <= len(fields) <= 3 or len(fields[0]) > 2:
+        raise ValueError(f'Invalid timestamp {time_str!r}')
+    if len(fields) == 2:
+        fields.insert(0, '0')
+    h, m, s = map(int, fields)
+    if m > 59 or s > 59:
+        raise ValueError(f'Invalid timestamp {time_str!r}')
+    return h * 3600 + m * 60 + s
+
+def load_dates(path=DATES_PATH):
+    """Get all upload dates by video id."""
     dates = {}
-    with open('data/dates.txt') as dates_file:
+    with open(path) as dates_file:
         for line in dates_file.readlines():
             vid, date = line.strip().split(':')
             dates[vid] = int(date)
+    return dates
 
-    # Get video ID from filename.
+def get_vid(vtt_filename):
+    """Get video ID from filename."""
     p = re.compile(r'\[([^\[]*?)\]\.en\.vtt')
-    vtt_filename = sys.argv[1]
-    vid = p.search(vtt_filename).group(1)
-    upload_date = dates[vid]
+    return p.search(vtt_filename).group(1)
 
-    # Parse vtt file
-    segments = []
-    word_map = {}
-    full_text = ''
-    idx_to_time = {}
+def get_output_path(vtt_filename, out_dir=PARSED_PATH):
+    """data/vtt/<name>.en.vtt -> <out_dir>/<name>.en.json"""
+    return os.path.join(out_dir, os.path.basename(vtt_filename).replace('en.vtt', 'en.json', 1))
+
+# Same cue rules as webvtt-py, which this reader replaces: blocks are
+# separated by whitespace-only lines, and a block is a cue if its first line
+# (or its second, after an identifier) is a timing line.
+CUE_TIMINGS = re.compile(r'\s*((?:\d+:)?\d{2}:\d{2}.\d{3})\s*-->\s*((?:\d+:)?\d{2}:\d{2}.\d{3})')
+CUE_TAGS = re.compile(r'<.*?>')
+WORD_TIMING = re.compile(r'<(?:\d+:)?\d{2}:\d{2}\.\d{3}>|<c>')
+BRACKETS = re.compile(r'\[.*?\]')
+
+def cue_from_block(block):
+    """(start, end, payload lines) of a cue block, or None if it isn't one."""
+    if len(block) >= 2 and '-->' not in block[1] and CUE_TIMINGS.match(block[0]):
+        first = 0
+    elif len(block) >= 3 and '-->' not in block[0] and '-->' not in block[2] and CUE_TIMINGS.match(block[1]):
+        first = 1
+    else:
+        return None
+
+    # Any later timing line in the block replaces the cue times.
+    start = end = None
+    payload = []
+    for line in block[first:]:
+        timing = CUE_TIMINGS.match(line) if '-->' in line else None
+        if timing:
+            start, end = timing.group(1), timing.group(2)
+        else:
+            payload.append(line)
+    return start, end, payload
+
+def read_cues(f, spec=False):
+    """
+    Stream the cues of an open vtt file, one block at a time.
+    Yields (start, end, payload lines), with the raw cue text.
+
+    Like webvtt-py, a whitespace-only line ends a block. With spec, only
+    an empty line does, as in the WebVTT spec: auto-captions put a ' '
+    line above the first caption line after a pause, which would
+    otherwise cut that cue off from its text.
+    """
+    first = f.readline()
+    if not first.startswith('WEBVTT'):
+        raise ValueError('Invalid format')
+
+    block = [ first.rstrip('\n\r') ]
+    for line in f:
+        if (line.rstrip('\n\r') if spec else line.strip()):
+            block.append(line.rstrip('\n\r'))
+        elif block:
+            cue = cue_from_block(block)
+            if cue: yield cue
+            block = []
+    if block:
+        cue = cue_from_block(block)
+        if cue: yield cue
+
+def cue_text(lines):
+    """Caption text of a cue: tags and [bracketed] annotations removed, lowercased."""
+    text = '\n'.join(lines)
+    if '<' in text:
+        text = CUE_TAGS.sub('', text)
+    if '[' in text:
+        text = BRACKETS.sub('', text)
+    return text.strip().lower()
+
+def raw_segments(f):
+    """
+    (start, end, text) of the single-line cues, skipping repeats of the
+    previous text or start second. Auto-captions show every line alone in
+    a 10ms cue once it is complete, so that is the cue kept, and its start
+    is when the line ends.
+    """
     seen_starts = set()
-    for caption in webvtt.read(vtt_filename):
+    previous = None
+    for start, end, lines in read_cues(f):
 
-        start = get_sec(caption.start)
-        text = re.sub(r'\[.*?\]', '', caption.text).strip().lower()
+        start = get_sec(start)
+        end = get_sec(end)
+        text = cue_text(lines)
 
         if '\n' in text: continue
         if text == '': continue
         if start in seen_starts: continue
-        if len(segments) > 0 and text == segments[-1][1]: continue
+        if text == previous: continue
 
         seen_starts.add(start)
-        segments.append([ start, text ])
-
-        idx = len(segments) - 1
-        words = text.split()
-        for word in words:
-            if word in sw: continue
-            if word in word_map:
-                word_map[word].add(idx)
-            else:
-                word_map[word] = { idx }
+        previous = text
+        yield start, end, text
 
+def carried_lines(texts, recent):
+    """
+    How many of a cue's first lines were already emitted: the longest run
+    that repeats the end of recent, where the last line may since have grown
+    (and is then counted as new, to replace it).
+    """
+    for k in range(min(len(texts), len(recent)), 0, -1):
+        if texts[:k - 1] != recent[-k:-1]: continue
+        if texts[k - 1] == recent[-1]:
+            return k
+        if texts[k - 1].startswith(recent[-1] + ' '):
+            return k - 1
+    return 0
 
-        full_text += ' ' + text
-        idx_to_time[len(full_text)] = get_sec(caption.end)
+def normalized_segments(f):
+    """
+    (start, end, text) of every spoken line, once, starting when it is
+    first shown.
 
-    # print(full_text)
-    # print(idx_to_time)
+    Auto-captions roll: a cue shows the previous line above the new one,
+    whose words carry <c> timing tags, then the new line alone for 10ms.
+    A cue's new lines are those from the first tagged one on; in a cue
+    without tags, those after the lines that repeat the last ones emitted
+    (all of them, for the 10ms cues). A line said twice in a row is kept,
+    as its second showing is tagged again.
 
-    # import re
-    # query = 'everyone in the chat'
-    # indices = [i.start() for i in re.finditer(pattern=query, string=full_text)]
-    # for i in indices:
-    #     print(i)
-    #     dec = 0
-    #     while (i-dec) not in idx_to_time:
-    #         dec += 1
-    #     print('start: ' + idx_to_time[i-dec])
-    #     print(full_text[i-dec:i+len(query)])
-    # sys.exit(1)
+    Roll-up captions without tags instead grow the last line a word at a
+    time: an untagged line that extends the last one replaces it, keeping
+    its start.
+    """
+    recent = []
+    pending = None
+    for start, end, lines in read_cues(f, spec=True):
+        texts = []
+        first_new = None
+        for line in lines:
+            text = cue_text([line])
+            if text == '': continue
+            if first_new is None and WORD_TIMING.search(line):
+                first_new = len(texts)
+            texts.append(text)
+
+        tagged = first_new is not None
+        if not tagged:
+            first_new = carried_lines(texts, recent)
+
+        for text in texts[first_new:]:
+            if pending and not tagged and text.startswith(pending[2] + ' '):
+                pending = (pending[0], get_sec(end), text)
+                recent[-1] = text
+                continue
+            if pending:
+                yield pending
+            pending = (get_sec(start), get_sec(end), text)
+            recent = (recent + [ text ])[-3:]
+    if pending:
+        yield pending
+
+def parse_vtt(vtt_filename, dates, normalize=False):
+    vid = get_vid(vtt_filename)
+    upload_date = dates[vid]
+
+    # Parse vtt file
+    segments = []
+    word_map = {}
+    idx_to_time = {}
+    length = 0
+    with open(vtt_filename, encoding='utf-8-sig') as f:
+        for start, end, text in (normalized_segments(f) if normalize else raw_segments(f)):
+
+            segments.append([ start, text ])
+
+            idx = len(segments) - 1
+            for word in text.split():
+                if word in sw_set: continue
+                if word in word_map:
+                    word_map[word].add(idx)
+                else:
+                    word_map[word] = { idx }
+
+            # full_text is ' ' + text for every segment; only its length is
+            # needed until the end.
+            length += 1 + len(text)
+            idx_to_time[length] = end
 
     # Convert sets to lists, for the json export
     for word, idxs in word_map.items():
         word_map[word] = list(idxs)
 
-
-    # Export parsed data to json
-    print(json.dumps({
+    return {
         'id': vid,
         'segments': segments,
         'word_map': word_map,
-        'full_text': full_text,
+        'full_text': ''.join([ ' ' + text for _, text in segments ]),
         'idx_to_time': idx_to_time,
         'upload_date': upload_date
-    }))
-    # }, indent=2))
+    }
+
+def find_vtt_files(patterns):
+    """Expand directories and globs into a sorted list of vtt files."""
+    files = set()
+    for pattern in patterns:
+        # Existing files are taken as they are: "[videoId]" in a file
+        # name would be read by glob as a character class.
+        if os.path.isfile(pattern):
+            files.add(pattern)
+            continue
+        if os.path.isdir(pattern):
+            pattern = os.path.join(glob.escape(pattern), '*.vtt')
+        files.update(glob.glob(pattern))
+    return sorted(files)
+
+
+# Batch workers. The stopword list is loaded at import and the dates are
+# handed over once per worker, instead of once per file.
+worker_dates = None
+worker_normalize = False
+
+def init_worker(dates, normalize=False):
+    global worker_dates, worker_normalize
+    worker_dates = dates
+    worker_normalize = normalize
+
+def parse_one(job):
+    vtt_filename, output_path = job
+    try:
+        data = parse_vtt(vtt_filename, worker_dates, worker_normalize)
+        with open(output_path, 'w') as f:
+            f.write(json.dumps(data) + '\n')
+    except Exception as e:
+        return vtt_filename, f'{type(e).__name__}: {e}'
+    return vtt_filename, None
+
+def parse_batch(jobs, dates, workers=None, normalize=False):
+    """Parse (vtt, output) jobs with a process pool. Returns a list of (file, error)."""
+    workers = workers or os.cpu_count() or 1
+
+    failures = []
+    start = time.time()
+    with Pool(workers, initializer=init_worker, initargs=(dates, normalize)) as pool:
+        for n, (vtt_filename, error) in enumerate(pool.imap_unordered(parse_one, jobs, chunksize=4), 1):
+            if error:
+                failures.append((vtt_filename, error))
+                print(f'[{n}/{len(jobs)}] FAILED {vtt_filename}: {error}', file=sys.stderr)
+            else:
+                print(f'[{n}/{len(jobs)}] {vtt_filename}', file=sys.stderr)
+    elapsed = time.time() - start
+
+    rate = len(jobs) / elapsed if elapsed > 0 else 0
+    print(f'Parsed {len(jobs) - len(failures)}/{len(jobs)} files in {elapsed:.1f}s '
+          f'({rate:.1f} files/s, {workers} workers)')
+    if failures:
+        print(f'{len(failures)} failures:')
+        for vtt_filename, error in failures:
+            print(f'  {vtt_filename}: {error}')
+    return failures
+
+def run_batch(args):
+    vtt_files = find_vtt_files(args.paths)
+    jobs = [ (f, get_output_path(f, args.out)) for f in vtt_files ]
+    dates = load_dates(args.dates)
+    os.makedirs(args.out, exist_ok=True)
+
+    m = manifest.load(args.manifest)
+    fingerprint = manifest.parser_fingerprint(sw, flags=[ '--normalize' ] if args.normalize else [])
+    if m['parser'] != fingerprint and m['files']:
+        print('Parser, stopwords or --normalize changed since the last run, reparsing everything.')
+    todo, skipped, entries = manifest.plan(m, jobs, fingerprint, dates, get_vid, force=args.force)
+    print(f'{len(vtt_files)} vtt files: {len(skipped)} unchanged, {len(todo)} to parse')
+
+    failures = parse_batch(todo, dates, args.workers, args.normalize) if todo else []
+    failed = { f for f, _ in failures }
+    for vtt_filename, _ in todo:
+        name = os.path.basename(vtt_filename)
+        if vtt_filename in failed:
+            m['files'].pop(name, None)
+        else:
+            m['files'][name] = entries[name]
+    m['parser'] = fingerprint
+
+    # Parsed outputs whose vtt is no longer among the inputs.
+    vtt_names = { os.path.basename(f) for f in vtt_files }
+    orphans = manifest.find_orphans(m, args.out, vtt_names)
+    if orphans:
+        print(f'{len(orphans)} parsed outputs have no source vtt' + (', removing:' if args.prune else ':'))
+        for path in orphans:
+            print(f'  {path}')
+            if args.prune:
+                os.remove(path)
+    if args.prune:
+        for name in list(m['files']):
+            if name not in vtt_names:
+                del m['files'][name]
+
+    manifest.save(m, args.manifest)
+    return failures
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Parse youtube auto-caption vtt files.')
+    parser.add_argument('paths', nargs='+', help='vtt file, or with --batch: directories / globs of vtt files')
+    parser.add_argument('--batch', action='store_true', help='parse every file into --out with a process pool')
+    parser.add_argument('--out', default=PARSED_PATH, help=f'batch output directory (default: {PARSED_PATH})')
+    parser.add_argument('--workers', type=int, default=None, help='batch worker processes (default: cpu count)')
+    parser.add_argument('--dates', default=DATES_PATH, help=f'upload dates file (default: {DATES_PATH})')
+    parser.add_argument('--manifest', default=manifest.MANIFEST_PATH, help=f'batch manifest (default: {manifest.MANIFEST_PATH})')
+    parser.add_argument('--force', action='store_true', help='batch: reparse files even if unchanged')
+    parser.add_argument('--prune', action='store_true', help='batch: delete parsed outputs that have no source vtt')
+    parser.add_argument('--normalize', action='store_true', help='rebuild the spoken lines from the rolling cues')
+    args = parser.parse_args()
+
+    if args.batch:
+        failures = run_batch(args)
+        sys.exit(1 if failures else 0)
+
+    if len(args.paths) != 1:
+        print('Expected 1 command line paramter (vtt file path). Exiting...')
+        sys.exit(1)
+
+    # Export parsed data to json
+    print(json.dumps(parse_vtt(args.paths[0], load_dates(args.dates), args.normalize)))
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+"""
+Runs the refresh, from fetching new subtitles to publishing the database,
+as a graph of stages with declared inputs and outputs:
+
+    links -> subtitles -> parse -> final -> merge -> build_db -> term_stats -> suggestions -> materialize
+    materialize -> package -> publish_db [-> deploy]
+
+A stage is skipped when nothing it depends on changed since its last
+successful run: its command, the scripts it runs, its input files and the
+outputs of the stages before it (as they were when those finished).
+Stages whose dependencies are done run in parallel (--jobs).
+
+Every finished stage is checkpointed to data/pipeline/state.json, so after
+a failure the next run resumes at the stage that failed. Each run writes
+a report of wall time, CPU time (user + sys, child processes included) and
+peak RSS per stage to data/pipeline/runs/, and the stage logs to
+data/pipeline/logs/<run>/.
+
+links and subtitles fetch from YouTube and always run, unless --offline.
+package writes the delta from the published database to the new one
+(delta.py), which publish_db applies to ../app/data/squeex.db and deploy
+sends to production; deploy only runs with --deploy.
+
+Usage (in the venv, from preprocessing/):
+    python3 scripts/pipeline.py
+    python3 scripts/pipeline.py --offline --jobs 2
+    python3 scripts/pipeline.py --deploy --server-log ~/squeex.log
+    python3 scripts/pipeline.py --force build_db     # rebuild from build_db on
+    python3 scripts/pipeline.py --plan               # what would run
+"""
+
+PIPELINE_DIR = 'data/pipeline'
+STATE_PATH = os.path.join(PIPELINE_DIR, 'state.json')
+RUNS_DIR = os.path.join(PIPELINE_DIR, 'runs')
+LOGS_DIR = os.path.join(PIPELINE_DIR, 'logs')
+
+FETCH_STAGES = ('links', 'subtitles')
+OPT_IN_STAGES = ('deploy',)
+
+# Files up to this size are hashed, larger files and directories are
+# compared by size and mtime.
+HASH_LIMIT = 1 << 20
+
+
+def stages(args):
+    """
+    The stages in dependency order. cmd runs in preprocessing/; when it
+    fails and the stage has a fallback, the fallback commands run instead.
+    sources are scripts the command imports, on top of those it names.
+
+    The database is the corpus: merge only writes the changeset, which
+    build_db applies. Its fallback, a full build, rebuilds final's output
+    from every parsed file first.
+    """
+    py = sys.executable
+    workers = [ '--workers', str(args.workers) ] if args.workers else []
+    normalize = [ '--normalize' ] if args.normalize_cues else []
+    server_logs = [ arg for path in args.server_log for arg in ('--log', path) ]
+    return [
+        { 'name': 'links', 'cmd': [ 'bash', 'scripts/1_get_links.sh' ], 'always': True,
+          'outputs': [ 'data/urls.txt' ] },
+        { 'name': 'subtitles', 'deps': [ 'links' ], 'cmd': [ py, 'scripts/fetch_subtitles.py' ],
+          'inputs': [ 'data/urls.txt' ], 'outputs': [ 'data/vtt', 'data/dates.txt' ] },
+        { 'name': 'parse', 'deps': [ 'subtitles' ],
+          'cmd': [ py, 'scripts/parse.py', '--batch', 'data/vtt', '--out', 'data/parsed', *workers, *normalize ],
+          'sources': [ 'scripts/manifest.py' ],
+          'inputs': [ 'data/vtt', 'data/dates.txt' ], 'outputs': [ 'data/parsed' ] },
+        { 'name': 'final', 'deps': [ 'parse' ], 'cmd': [ py, 'scripts/final.py', '--changed', '--stream' ],
+          'sources': [ 'scripts/manifest.py' ],
+          'outputs': [ 'data/final.json', 'data/full.json' ] },
+        { 'name': 'merge', 'deps': [ 'final' ], 'cmd': [ py, 'scripts/merge.py' ],
+          'sources': [ 'scripts/corpus.py', 'scripts/manifest.py' ],
+          'outputs': [ 'data/changeset.json' ] },
+        { 'name': 'build_db', 'deps': [ 'merge' ],
+          'cmd': [ py, 'scripts/build_db.py', '--incremental' ],
+          'fallback': [ [ py, 'scripts/final.py', '--stream' ], [ py, 'scripts/build_db.py' ] ],
+          'sources': [ 'scripts/corpus.py', 'scripts/postings.py', 'scripts/boundaries.py', 'scripts/manifest.py' ],
+          'outputs': [ 'data/squeex.db' ] },
+        { 'name': 'term_stats', 'deps': [ 'build_db' ],
+          'cmd': [ py, 'scripts/term_stats.py', '--update' ], 'fallback': [ [ py, 'scripts/term_stats.py' ] ],
+          'sources': [ 'scripts/corpus.py', 'scripts/postings.py' ],
+          'outputs': [ 'data/term_stats.db' ] },
+        { 'name': 'suggestions', 'deps': [ 'term_stats' ],
+          'cmd': [ py, 'scripts/analyze_deviance.py', '--stats', 'data/term_stats.db' ],
+          'outputs': [ '../suggestions.json' ] },
+        { 'name': 'materialize', 'deps': [ 'build_db', 'suggestions' ], 'cmd': [ py, 'scripts/materialize.py', *server_logs ],
+          'sources': [ 'scripts/search.py', 'scripts/postings.py', 'scripts/boundaries.py' ],
+          'outputs': [ 'data/squeex.db' ] },
+        { 'name': 'package', 'deps': [ 'materialize' ], 'cmd': [ py, 'scripts/delta.py', 'build' ],
+          'sources': [ 'scripts/corpus.py', 'scripts/build_db.py', 'scripts/search.py' ],
+          'outputs': [ 'data/deltas' ] },
+        { 'name': 'publish_db', 'deps': [ 'package' ],
+          'cmd': [ py, 'scripts/delta.py', 'apply', 'data/deltas/latest' ],
+          'fallback': [ [ py, 'scripts/delta.py', 'install', 'data/squeex.db' ] ],
+          'outputs': [ '../app/data/squeex.db' ] },
+        { 'name': 'deploy', 'deps': [ 'publish_db' ], 'cmd': [ 'bash', 'scripts/5_deploy.sh' ] },
+    ]
+
+
+def path_digest(path):
+    """Changes when the file or anything under the directory changes. None if missing."""
+    if os.path.isdir(path):
+        h = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                st = os.stat(os.path.join(root, name))
+                h.update(f'{os.path.relpath(os.path.join(root, name), path)}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+        return h.hexdigest()
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    if st.st_size > HASH_LIMIT:
+        return f'{st.st_size}:{st.st_mtime_ns}'
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def stage_sources(stage):
+    named = [ arg for cmd in commands(stage) for arg in cmd if arg.endswith(('.py', '.sh')) ]
+    return named + stage.get('sources', [])
+
+
+def commands(stage):
+    return [ stage['cmd'], *stage.get('then', []), *stage.get('fallback', []) ]
+
+
+def signature(stage, state):
+    """What the stage's last successful run has to match for it to be skipped."""
+    h = hashlib.sha256()
+    h.update(json.dumps(commands(stage)).encode())
+    for path in stage_sources(stage) + stage.get('inputs', []):
+        h.update(f'{path}\0{path_digest(path)}\n'.encode())
+    for dep in stage.get('deps', []):
+        h.update(f'{dep}\0{state["stages"].get(dep, {}).get("outputs")}\n'.encode())
+    return h.hexdigest()[:16]
+
+
+def outputs_digest(stage):
+    h = hashlib.sha256()
+    for path in stage.get('outputs', []):
+        h.update(f'{path}\0{path_digest(path)}\n'.encode())
+    return h.hexdigest()[:16]
+
+
+def is_current(stage, state):
+    recorded = state['stages'].get(stage['name'])
+    return (not stage.get('always') and recorded is not None
+            and recorded['signature'] == signature(stage, state)
+            and all(os.path.exists(path) for path in stage.get('outputs', [])))
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return { 'stages': {} }
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def measure(cmd, cwd, log):
+    """
+    Run cmd to completion with its output appended to the open file log.
+    Returns (exit code, wall seconds, cpu seconds, peak RSS in MB).
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+    # wait4 reports the child's usage including the children it waited
+    # for (e.g. parse.py's worker pool).
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return proc.returncode, wall, usage.ru_utime + usage.ru_stime, rss_mb
+
+
+def run_stage(stage, log_path):
+    """Run the stage's commands, the fallback ones if the command fails. Returns its report entry."""
+    result = { 'status': 'ok', 'wall_s': 0, 'cpu_s': 0, 'peak_rss_mb': 0 }
+
+    def run(cmd):
+        with open(log_path, 'a') as log:
+            log.write(f'$ {" ".join(cmd)}\n')
+            log.flush()
+            code, wall, cpu, rss = measure(cmd, '.', log)
+        result['wall_s'] = round(result['wall_s'] + wall, 3)
+        result['cpu_s'] = round(result['cpu_s'] + cpu, 3)
+        result['peak_rss_mb'] = round(max(result['peak_rss_mb'], rss), 1)
+        return code
+
+    code = run(stage['cmd'])
+    if code != 0 and 'fallback' in stage:
+        result['status'] = 'fallback'
+        for cmd in stage['fallback']:
+            code = run(cmd)
+            if code != 0: break
+    for cmd in stage.get('then', []):
+        if code != 0: break
+        code = run(cmd)
+    if code != 0:
+        result['status'] = 'failed'
+        result['exit_code'] = code
+    return result
+
+
+def select(all_stages, args):
+    names = [ stage['name'] for stage in all_stages ]
+    unknown = set(args.force) - set(names)
+    if unknown:
+        sys.exit(f'Unknown stages: {", ".join(sorted(unknown))} (stages: {", ".join(names)})')
+    excluded = set(FETCH_STAGES if args.offline else ()) | set(() if args.deploy else OPT_IN_STAGES)
+    return [ stage for stage in all_stages if stage['name'] not in excluded ]
+
+
+def print_plan(selected, state, forced):
+    """Which stages a run would start, assuming those before them change their outputs."""
+    runs = set()
+    for stage in selected:
+        reason = ('forced' if stage['name'] in forced
+                  else 'always' if stage.get('always')
+                  else f'after {", ".join(d for d in stage.get("deps", []) if d in runs)}' if runs & set(stage.get('deps', []))
+                  else None if is_current(stage, state)
+                  else 'changed')
+        if reason:
+            runs.add(stage['name'])
+        print(f'  {stage["name"]:<14} {"run (" + reason + ")" if reason else "skip"}')
+
+
+def run(selected, state, forced, jobs):
+    """Run the graph. Returns the report of every selected stage."""
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    if os.path.exists(os.path.join(LOGS_DIR, run_id)):
+        run_id += f'-{os.getpid()}'
+    log_dir = os.path.join(LOGS_DIR, run_id)
+    os.makedirs(log_dir, exist_ok=True)
+    names = { stage['name'] for stage in selected }
+    pending = list(selected)
+    running = {}
+    report = {}
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for stage in list(pending):
+                deps = [ d for d in stage.get('deps', []) if d in names ]
+                if any(d not in report or report[d]['status'] == 'running' for d in deps):
+                    continue
+                pending.remove(stage)
+                name = stage['name']
+                if failed or any(report[d]['status'] in ('failed', 'not run') for d in deps):
+                    report[name] = { 'status': 'not run' }
+                elif name not in forced and is_current(stage, state):
+                    report[name] = { 'status': 'skipped' }
+                    print(f'  {name:<14} skipped, up to date')
+                else:
+                    print(f'  {name:<14} started')
+                    sig = signature(stage, state)
+                    future = pool.submit(run_stage, stage, os.path.join(log_dir, f'{name}.log'))
+                    running[future] = name
+                    report[name] = { 'status': 'running', 'signature': sig }
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                stage = next(s for s in selected if s['name'] == name)
+                result = future.result()
+                sig = report[name]['signature']
+                report[name] = result
+                if result['status'] == 'failed':
+                    failed = True
+                    print(f'  {name:<14} FAILED ({result["exit_code"]}), see {os.path.join(log_dir, name + ".log")}')
+                    continue
+                state['stages'][name] = {
+                    'signature': sig,
+                    'outputs': outputs_digest(stage),
+                    'finished': datetime.now().isoformat(timespec='seconds'),
+                }
+                save_state(state)
+                print(f'  {name:<14} {result["status"]:<8} {result["wall_s"]:8.2f}s  cpu {result["cpu_s"]:8.2f}s  '
+                      f'rss {result["peak_rss_mb"]:7.1f} MB')
+
+    return run_id, report
+
+
+def write_report(run_id, report, wall):
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    path = os.path.join(RUNS_DIR, f'{run_id}.json')
+    with open(path, 'w') as f:
+        json.dump({ 'run': run_id, 'wall_s': round(wall, 3), 'stages': report }, f, indent=2)
+        f.write('\n')
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the refresh pipeline, skipping stages that are up to date.')
+    parser.add_argument('--offline', action='store_true', help='do not fetch new videos (skip links and subtitles)')
+    parser.add_argument('--deploy', action='store_true', help='also copy the database to production')
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE', help='run this stage even if it is up to date (repeatable)')
+    parser.add_argument('--force-all', action='store_true', help='run every stage')
+    parser.add_argument('--jobs', type=int, default=2, help='stages run at the same time (default: 2)')
+    parser.add_argument('--workers', type=int, default=None, help='parse.py workers (default: cpu count)')
+    parser.add_argument('--normalize-cues', action='store_true', help='parse.py --normalize: collapse rolling caption cues')
+    parser.add_argument('--server-log', action='append', default=[], help='server request log for materialize.py --log (repeatable)')
+    parser.add_argument('--plan', action='store_true', help='print which stages would run and exit')
+    args = parser.parse_args()
+
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    selected = select(stages(args), args)
+    forced = { stage['name'] for stage in selected } if args.force_all else set(args.force)
+    state = load_state()
+
+    if args.plan:
+        print_plan(selected, state, forced)
+        sys.exit(0)
+
+    start = time.perf_counter()
+    run_id, report = run(selected, state, forced, args.jobs)
+    path = write_report(run_id, report, time.perf_counter() - start)
+    failed = [ name for name, result in report.items() if result['status'] == 'failed' ]
+    print(f'Wrote {path}')
+    if failed:
+        print(f'Failed: {", ".join(failed)}. Run again to resume from there.')
+        sys.exit(1)
@@ -0,0 +1,122 @@
+from bisect import bisect_right
+
+import postings
+
+"""
+Positional inverted index for phrase queries.
+
+Every token of a video's transcript (stopwords included) gets a position:
+its index in full_text.split(), which is the segments' words in order.
+build_db.py stores
+
+    positions(word, vid, positions)   sorted token positions, postings.py BLOB
+    videos.token_starts               position of each segment's first token
+
+so a position maps to its segment (bisection over token_starts) and from
+there to a start time. A multi-word phrase is answered by intersecting the
+words' video sets and checking the positions are adjacent, instead of
+running a regex over every transcript. Matches are whole tokens, so
+"the cat" does not match "bathe catalog" the way the substring search does.
+
+Usage:
+    from positional import PositionalIndex
+    index = PositionalIndex(sqlite3.connect('data/squeex.db'))
+    index.phrase('everyone in the chat')   # { vid: [ [start, text], ... ] }
+"""
+
+
+def token_positions(segments):
+    """Returns ({word: [positions]}, [first position of each segment])."""
+    positions = {}
+    token_starts = []
+    position = 0
+    for _, text in segments:
+        token_starts.append(position)
+        for word in text.split():
+            if word in positions:
+                positions[word].append(position)
+            else:
+                positions[word] = [ position ]
+            position += 1
+    return positions, token_starts
+
+
+def position_rows(vid, segments):
+    positions, _ = token_positions(segments)
+    for word, word_positions in positions.items():
+        yield (word, vid, postings.encode(word_positions))
+
+
+def pack_token_starts(segments):
+    _, token_starts = token_positions(segments)
+    return postings.encode(token_starts)
+
+
+class PositionalIndex:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.token_starts = {}
+
+    def word_postings(self, word):
+        """{vid: encoded positions} for one word."""
+        rows = self.conn.execute('SELECT vid, positions FROM positions WHERE word = ?', (word,))
+        return dict(rows)
+
+    def segment_of(self, vid, position):
+        if vid not in self.token_starts:
+            (blob,) = self.conn.execute('SELECT token_starts FROM videos WHERE vid = ?', (vid,)).fetchone()
+            self.token_starts[vid] = postings.decode(blob)
+        return bisect_right(self.token_starts[vid], position) - 1
+
+    def match_positions(self, phrase):
+        """{vid: [position of the first token of each match]}."""
+        tokens = phrase.lower().split()
+        if not tokens:
+            return {}
+
+        lists = []
+        for offset, token in enumerate(tokens):
+            word_postings = self.word_postings(token)
+            if not word_postings:
+                return {}
+            lists.append((offset, word_postings))
+
+        # Intersect videos, rarest word first.
+        lists.sort(key=lambda item: len(item[1]))
+        vids = set(lists[0][1])
+        for _, word_postings in lists[1:]:
+            vids &= word_postings.keys()
+            if not vids:
+                return {}
+
+        matches = {}
+        for vid in vids:
+            decoded = [ (offset, postings.decode(word_postings[vid])) for offset, word_postings in lists ]
+            decoded.sort(key=lambda item: len(item[1]))
+            offset, first = decoded[0]
+            starts = [ p - offset for p in first if p >= offset ]
+            for offset, positions in decoded[1:]:
+                positions = set(positions)
+                starts = [ s for s in starts if s + offset in positions ]
+                if not starts:
+                    break
+            if starts:
+                matches[vid] = starts
+        return matches
+
+    def phrase(self, phrase):
+        """{vid: [[start time, text of the segments the match spans], ...]}."""
+        length = len(phrase.split())
+        results = {}
+        for vid, starts in sorted(self.match_positions(phrase).items()):
+            hits = []
+            for position in starts:
+                first = self.segment_of(vid, position)
+                last = self.segment_of(vid, position + length - 1)
+                rows = self.conn.execute(
+                    'SELECT start, text FROM segments WHERE vid = ? AND idx BETWEEN ? AND ? ORDER BY idx',
+                    (vid, first, last)).fetchall()
+                hits.append([ rows[0][0], ' '.join(text for _, text in rows) ])
+            results[vid] = hits
+        return results
@@ -0,0 +1,63 @@
+"""
+Posting-list codec for word_map.segment_indexes.
+
+A posting list is a sorted list of distinct segment indexes. It is stored
+as the gaps between consecutive indexes (the first one relative to 0),
+each written as an unsigned LEB128 varint: 7 bits per byte, high bit set
+on every byte but the last. Typical lists take one byte per index.
+
+app/lib/postings.js is the matching decoder for the server.
+"""
+
+CONTINUATION = bytes(range(0x80, 0x100))
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(blob, pos):
+    """Returns (value, position after it)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = blob[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode(indexes):
+    out = bytearray()
+    prev = 0
+    for idx in sorted(set(indexes)):
+        write_varint(out, idx - prev)
+        prev = idx
+    return bytes(out)
+
+
+def decode(blob):
+    out = []
+    value = 0
+    shift = 0
+    prev = 0
+    for byte in blob:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            prev += value
+            out.append(prev)
+            value = 0
+            shift = 0
+    return out
+
+
+def count(blob):
+    """Number of indexes in an encoded list, without decoding it."""
+    return len(blob.translate(None, CONTINUATION))
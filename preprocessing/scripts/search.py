@@ -0,0 +1,157 @@
+import re
+import json
+import random
+
+import postings
+import boundaries
+from transcripts import Reader, CACHE_SIZE
+
+"""
+The server's search (getWord / getPhrase in app/lib/get.js) against
+squeex.db in Python, for the stages that need its exact results: the
+precomputed results of materialize.py and their --check.
+
+Results are the `segments` of the API payload, { vid: [ [start, text] ] },
+in the same order, and serialize to the same JSON as JSON.stringify
+(segments_json). JavaScript strings index UTF-16 code units, so
+transcripts with characters outside the BMP are matched and cut as UTF-16
+too. Transcript columns are read through transcripts.Reader, which
+decompresses them and keeps the last cache_size it read.
+
+Usage:
+    from search import Search
+    search = Search(sqlite3.connect('data/squeex.db'))
+    search.query('bazinga')          # like GET /bazinga
+    search.query('in the chat')
+"""
+
+LONE_SURROGATE = re.compile('[\ud800-\udfff]')
+
+
+def is_phrase(query):
+    """The route's test: a query with a space after trimming is a phrase."""
+    return ' ' in query.strip()
+
+
+def to_utf16(text):
+    """text with non-BMP characters as surrogate pairs, so indexes match JavaScript's."""
+    if text.isascii() or max(text) <= '\uffff':
+        return text
+    return ''.join(c if c <= '\uffff' else surrogate_pair(c) for c in text)
+
+
+def surrogate_pair(c):
+    code = ord(c) - 0x10000
+    return chr(0xd800 + (code >> 10)) + chr(0xdc00 + (code & 0x3ff))
+
+
+def from_utf16(text):
+    """Joins surrogate pairs back; a pair cut in half stays a lone surrogate."""
+    if text.isascii():
+        return text
+    return text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'surrogatepass')
+
+
+def segments_json(segments):
+    """JSON.stringify(segments): compact, non-ASCII as is, lone surrogates escaped."""
+    out = json.dumps(segments, ensure_ascii=False, separators=(',', ':'))
+    return LONE_SURROGATE.sub(lambda m: f'\\u{ord(m.group()):04x}', out)
+
+
+def phrase_regex(phrase):
+    # escapeRegExp + the 'i' flag. Without the 'u' flag JavaScript only
+    # folds case within each character's own upper/lower pair, which for
+    # ASCII phrases is re.ASCII.
+    flags = re.IGNORECASE | (re.ASCII if phrase.isascii() else 0)
+    return re.compile(re.escape(phrase), flags)
+
+
+def has_table(conn, name):
+    return conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (name,)).fetchone() is not None
+
+
+def sample_queries(conn, n, seed=0):
+    """
+    Queries to compare searches with: the precomputed ones (the results
+    table), n words and n phrases of 2-3 tokens picked from the transcripts.
+    """
+    rng = random.Random(seed)
+    queries = []
+    if has_table(conn, 'results'):
+        queries += [ query for query, in conn.execute('SELECT query FROM results ORDER BY query') ]
+    words = [ word for word, in conn.execute('SELECT DISTINCT word FROM word_map ORDER BY word') ]
+    queries += rng.sample(words, min(n, len(words)))
+    texts = [ text for text, in conn.execute('SELECT text FROM segments ORDER BY vid, idx LIMIT 100000') ]
+    for text in rng.sample(texts, min(n, len(texts))):
+        tokens = text.split()
+        if len(tokens) >= 2:
+            i = rng.randrange(len(tokens) - 1)
+            queries.append(' '.join(tokens[i:i + rng.choice((2, 3))]))
+    return queries
+
+
+class Search:
+
+    def __init__(self, conn, cache_size=CACHE_SIZE):
+        self.conn = conn
+        self.reader = Reader(conn, cache_size)
+        self.has_segments_table = has_table(conn, 'segments')
+        self.has_fts = has_table(conn, 'videos_fts')
+        self.has_boundaries = conn.execute(
+            "SELECT 1 FROM pragma_table_info('videos') WHERE name = 'boundaries'").fetchone() is not None
+        self.phrase_columns = 'v.vid, v.boundaries' if self.has_boundaries else 'v.vid, NULL'
+
+    def query(self, query):
+        return self.phrase(query) if is_phrase(query) else self.word(query)
+
+    def word(self, word):
+        segments = {}
+        if self.has_segments_table:
+            for vid, blob in self.conn.execute('SELECT vid, segment_indexes FROM word_map WHERE word = ? ORDER BY vid',
+                                               (word.lower(),)):
+                rows = [ self.segment(vid, idx) for idx in postings.decode(blob) ]
+                rows = [ list(row) for row in rows if row is not None ]
+                if rows:
+                    segments[vid] = rows
+            return segments
+
+        for vid, blob in self.conn.execute('SELECT vid, segment_indexes FROM word_map WHERE word = ?', (word.lower(),)):
+            all_segments = self.reader.segments(vid)
+            if all_segments is None: continue
+            indexes = set(postings.decode(blob))
+            segments[vid] = [ s for i, s in enumerate(all_segments) if i in indexes ]
+        return segments
+
+    def segment(self, vid, idx):
+        return self.conn.execute('SELECT start, text FROM segments WHERE vid = ? AND idx = ?', (vid, idx)).fetchone()
+
+    def can_use_fts(self, phrase):
+        return self.has_fts and len(phrase) >= 3 and phrase.isascii()
+
+    def phrase(self, phrase):
+        regex = phrase_regex(to_utf16(phrase))
+        length = len(to_utf16(phrase))
+        if self.can_use_fts(phrase):
+            fts_phrase = '"' + phrase.lower().replace('"', '""') + '"'
+            rows = self.conn.execute(f'''SELECT {self.phrase_columns}
+                FROM videos_fts f JOIN videos v ON v.rowid = f.rowid
+                WHERE videos_fts MATCH ? ORDER BY f.rowid''', (fts_phrase,))
+        else:
+            rows = self.conn.execute(f'SELECT {self.phrase_columns} FROM videos v ORDER BY v.rowid')
+
+        segments = {}
+        for vid, packed in rows:
+            text = self.reader.full_text(vid)
+            if not text: continue
+            text = to_utf16(text)
+            indices = [ m.start() for m in regex.finditer(text) ]
+            if not indices: continue
+
+            if packed is not None:
+                offsets, times = boundaries.unpack(packed)
+                matches = [ boundaries.snippet(text, offsets, times, i, length) for i in indices ]
+            else:
+                idx_to_time = { int(k): v for k, v in self.reader.idx_to_time(vid).items() }
+                matches = [ boundaries.walk_snippet(text, idx_to_time, i, length) for i in indices ]
+            segments[vid] = [ [ start, from_utf16(snippet) ] for start, snippet in matches ]
+        return segments
@@ -0,0 +1,404 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import sqlite3
+import argparse
+import statistics
+from array import array
+from bisect import bisect_right
+
+import postings
+import boundaries
+import transcripts
+from search import Search, is_phrase, phrase_regex, to_utf16, from_utf16, segments_json, sample_queries
+
+"""
+A single immutable index file (data/squeex.idx) with everything word and
+phrase search read from squeex.db, and a reader that memory-maps it.
+
+    squeex_index.write('data/squeex.db', 'data/squeex.idx')
+    index = squeex_index.Index('data/squeex.idx')
+    index.query('bazinga')           # same result as Search / GET /bazinga
+    index.query('in the chat')
+
+Layout: the magic, then sections aligned to 8 bytes, then a JSON directory
+(section offsets, lengths and array typecodes, updatedAt, the videos as
+[vid, title, upload_date] in rowid order), then the directory offset (u64)
+and the magic again. Arrays are in the byte order of the machine that
+wrote them, recorded in the directory. Videos are numbered by rowid and
+segments globally, video by video; `x_offsets`-style arrays have one more
+entry than rows, so row i spans [a[i], a[i + 1]).
+
+    text_heap        full_text of every video, UTF-8
+    fold_heap        the same with ASCII letters lowercased, same offsets
+    segment_heap     segment texts, UTF-8
+    postings         u32 segment indexes, per (word, video) entry
+    video_text       u64[V+1] full_text spans in text_heap
+    video_segments   u64[V+1] first segment of each video
+    video_bounds     u64[V+1] spans in bound_offsets / bound_times
+    bound_offsets    u32 cue boundaries (UTF-16 offsets, see boundaries.py)
+    bound_times      i32 cue start times
+    segment_starts   i32[S] segment start times
+    segment_text     u64[S+1] spans in segment_heap
+    word_heap        the vocabulary, UTF-8, sorted bytewise like SQLite
+    word_offsets     u64[W+1] spans in word_heap
+    word_entries     u64[W+1] spans in entry_videos / entry_postings
+    entry_videos     u32[E] video of each entry, by vid within a word
+    entry_postings   u64[E+1] spans in postings
+
+The reader only keeps memoryviews over the map: a word lookup bisects the
+vocabulary and slices postings and segments out of it, a phrase search runs
+one bytes search over the folded heap in place (mmap.find) and decodes
+only the videos it lands in. Non-ASCII phrases scan every video, like the
+server without FTS. Results are what search.py (and so the server) returns.
+
+The file is written from a finished database, by `build_db.py --index` or
+the build command below, and is never updated in place.
+
+Usage:
+    python3 scripts/squeex_index.py build [--db data/squeex.db] [--out data/squeex.idx]
+    python3 scripts/squeex_index.py query 'bazinga' 'in the chat'
+    python3 scripts/squeex_index.py bench [--queries 200]   # latency vs SQLite
+"""
+
+DB_PATH = 'data/squeex.db'
+INDEX_PATH = 'data/squeex.idx'
+
+MAGIC = b'SQXIDX01'
+FORMAT = '1'
+TRAILER = struct.Struct('<Q8s')
+
+STREAMED = ('text_heap', 'fold_heap', 'segment_heap', 'postings')
+TYPECODES = {
+    'text_heap': 'B',
+    'fold_heap': 'B',
+    'segment_heap': 'B',
+    'postings': 'I',
+    'video_text': 'Q',
+    'video_segments': 'Q',
+    'video_bounds': 'Q',
+    'bound_offsets': 'I',
+    'bound_times': 'i',
+    'segment_starts': 'i',
+    'segment_text': 'Q',
+    'word_heap': 'B',
+    'word_offsets': 'Q',
+    'word_entries': 'Q',
+    'entry_videos': 'I',
+    'entry_postings': 'Q',
+}
+
+
+class Writer:
+    """Appends 8-byte aligned sections to the file and records them."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sections = {}
+        f.write(MAGIC)
+
+    def begin(self, name):
+        self.f.write(b'\0' * (-self.f.tell() % 8))
+        self.sections[name] = [ self.f.tell(), 0, TYPECODES[name] ]
+
+    def append(self, name, data):
+        self.f.write(data)
+        self.sections[name][1] += len(data)
+
+    def section(self, name, data):
+        self.begin(name)
+        self.append(name, data)
+
+
+def write(db_path, path):
+    """Writes the index of the database at db_path to path (atomically)."""
+    start = time.time()
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    info = dict(conn.execute('SELECT key, value FROM info'))
+    videos = conn.execute('SELECT vid, title, upload_date FROM videos ORDER BY rowid').fetchall()
+    numbers = { vid: n for n, (vid, _, _) in enumerate(videos) }
+    reader = transcripts.Reader(conn, cache_size=0)
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        out = Writer(f)
+        arrays = { name: array(code) for name, code in TYPECODES.items() if name not in STREAMED and code != 'B' }
+
+        out.begin('text_heap')
+        arrays['video_text'].append(0)
+        arrays['video_bounds'].append(0)
+        for text, packed, idx_to_time in conn.execute(
+                'SELECT full_text, boundaries, idx_to_time FROM videos ORDER BY rowid'):
+            data = (reader.decode(text) or '').encode('utf-8', 'surrogatepass')
+            out.append('text_heap', data)
+            arrays['video_text'].append(arrays['video_text'][-1] + len(data))
+            if packed is not None:
+                offsets, times = boundaries.unpack(packed)
+            else:
+                offsets, times = boundaries.from_idx_to_time(json.loads(reader.decode(idx_to_time) or '{}'))
+            arrays['bound_offsets'].extend(offsets)
+            arrays['bound_times'].extend(times)
+            arrays['video_bounds'].append(len(arrays['bound_offsets']))
+
+        # bytes.lower() only folds ASCII, so offsets stay those of text_heap.
+        out.begin('fold_heap')
+        for text, in conn.execute('SELECT full_text FROM videos ORDER BY rowid'):
+            out.append('fold_heap', (reader.decode(text) or '').encode('utf-8', 'surrogatepass').lower())
+
+        out.begin('segment_heap')
+        arrays['video_segments'].append(0)
+        arrays['segment_text'].append(0)
+        size = 0
+        for vid, _, _ in videos:
+            for i, (idx, seg_start, text) in enumerate(conn.execute(
+                    'SELECT idx, start, text FROM segments WHERE vid = ? ORDER BY idx', (vid,))):
+                if idx != i:
+                    raise ValueError(f'{vid}: segment {idx} at position {i}, segments must be numbered from 0')
+                data = text.encode('utf-8', 'surrogatepass')
+                out.append('segment_heap', data)
+                size += len(data)
+                arrays['segment_starts'].append(seg_start)
+                arrays['segment_text'].append(size)
+            arrays['video_segments'].append(len(arrays['segment_starts']))
+
+        out.begin('postings')
+        words = bytearray()
+        arrays['word_offsets'].append(0)
+        arrays['word_entries'].append(0)
+        arrays['entry_postings'].append(0)
+        n_postings = 0
+        previous = None
+        for word, vid, blob in conn.execute('SELECT word, vid, segment_indexes FROM word_map ORDER BY word, vid'):
+            if vid not in numbers: continue
+            if word != previous:
+                if previous is not None:
+                    arrays['word_entries'].append(len(arrays['entry_videos']))
+                words += word.encode('utf-8', 'surrogatepass')
+                arrays['word_offsets'].append(len(words))
+                previous = word
+            indexes = array('I', postings.decode(blob))
+            out.append('postings', indexes)
+            n_postings += len(indexes)
+            arrays['entry_videos'].append(numbers[vid])
+            arrays['entry_postings'].append(n_postings)
+        if previous is not None:
+            arrays['word_entries'].append(len(arrays['entry_videos']))
+
+        out.section('word_heap', bytes(words))
+        for name, values in arrays.items():
+            out.section(name, values)
+
+        f.write(b'\0' * (-f.tell() % 8))
+        directory = f.tell()
+        f.write(json.dumps({
+            'format': FORMAT,
+            'byteorder': sys.byteorder,
+            'updatedAt': info.get('updatedAt'),
+            'schema': info.get('schema'),
+            'videos': videos,
+            'sections': out.sections,
+        }, ensure_ascii=False).encode('utf-8'))
+        f.write(TRAILER.pack(directory, MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    conn.close()
+    os.replace(tmp, path)
+
+    print(f'Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB, {len(videos)} videos, '
+          f'{len(arrays["segment_starts"])} segments, {len(arrays["word_offsets"]) - 1} words) '
+          f'from {db_path} in {time.time() - start:.1f}s')
+
+
+class Index:
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        directory, magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if self.map[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            raise ValueError(f'{path} is not a squeex index')
+        meta = json.loads(self.map[directory:len(self.map) - TRAILER.size])
+        if meta['format'] != FORMAT or meta['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path}: format {meta["format"]} ({meta["byteorder"]} endian) is not readable here')
+
+        self.updated_at = meta['updatedAt']
+        self.videos = [ vid for vid, _, _ in meta['videos'] ]
+        self.view = memoryview(self.map)
+        self.sections = meta['sections']
+        for name, (offset, length, code) in meta['sections'].items():
+            size = array(code).itemsize
+            setattr(self, name, self.view[offset:offset + length * size].cast(code))
+
+    def close(self):
+        for name in TYPECODES:
+            getattr(self, name).release()
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def query(self, query):
+        return self.phrase(query) if is_phrase(query) else self.word(query)
+
+    def find(self, word):
+        """Vocabulary number of word (UTF-8 bytes), or None."""
+        offsets, heap = self.word_offsets, self.word_heap
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if heap[offsets[mid]:offsets[mid + 1]].tobytes() < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and heap[offsets[lo]:offsets[lo + 1]] == word:
+            return lo
+        return None
+
+    def segment(self, s):
+        return str(self.segment_heap[self.segment_text[s]:self.segment_text[s + 1]], 'utf-8', 'surrogatepass')
+
+    def word(self, word):
+        w = self.find(word.lower().encode('utf-8', 'surrogatepass'))
+        if w is None:
+            return {}
+        segments = {}
+        for e in range(self.word_entries[w], self.word_entries[w + 1]):
+            n = self.entry_videos[e]
+            base = self.video_segments[n]
+            count = self.video_segments[n + 1] - base
+            rows = [ [ self.segment_starts[base + idx], self.segment(base + idx) ]
+                     for idx in self.postings[self.entry_postings[e]:self.entry_postings[e + 1]] if idx < count ]
+            if rows:
+                segments[self.videos[n]] = rows
+        return segments
+
+    def candidates(self, phrase):
+        """Numbers of the videos that may contain phrase, in rowid order."""
+        if not phrase.isascii():
+            return [ n for n in range(len(self.videos)) if self.video_text[n] < self.video_text[n + 1] ]
+        # An ASCII phrase only matches ASCII bytes, which fold_heap has in
+        # lower case: find its first occurrence, note the video and jump to
+        # the next one.
+        needle = phrase.lower().encode()
+        heap = self.sections['fold_heap'][0]
+        end = heap + self.video_text[len(self.videos)]
+        found = []
+        pos = self.map.find(needle, heap, end)
+        while pos != -1:
+            n = bisect_right(self.video_text, pos - heap) - 1
+            video_end = heap + self.video_text[n + 1]
+            if pos + len(needle) <= video_end:
+                found.append(n)
+                pos = self.map.find(needle, video_end, end)
+            else:
+                pos = self.map.find(needle, pos + 1, end)
+        return found
+
+    def phrase(self, phrase):
+        regex = phrase_regex(to_utf16(phrase))
+        length = len(to_utf16(phrase))
+        segments = {}
+        for n in self.candidates(phrase):
+            vid = self.videos[n]
+            a, b = self.video_text[n], self.video_text[n + 1]
+            text = to_utf16(str(self.text_heap[a:b], 'utf-8', 'surrogatepass'))
+            indices = [ m.start() for m in regex.finditer(text) ]
+            if not indices: continue
+
+            lo, hi = self.video_bounds[n], self.video_bounds[n + 1]
+            offsets, times = self.bound_offsets[lo:hi], self.bound_times[lo:hi]
+            matches = [ boundaries.snippet(text, offsets, times, i, length) for i in indices ]
+            segments[vid] = [ [ start, from_utf16(snippet) ] for start, snippet in matches ]
+        return segments
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def timed(fn, query):
+    start = time.perf_counter()
+    result = fn(query)
+    return time.perf_counter() - start, result
+
+
+def bench(db_path, index_path, n):
+    """Times every sampled query on both paths; exits 1 if any result differs."""
+    start = time.perf_counter()
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    search = Search(conn)
+    open_db = time.perf_counter() - start
+    start = time.perf_counter()
+    index = Index(index_path)
+    open_index = time.perf_counter() - start
+    if index.updated_at != dict(conn.execute('SELECT key, value FROM info')).get('updatedAt'):
+        print(f'{index_path} was written from another version of {db_path}, rebuild it.')
+        sys.exit(1)
+
+    queries = sample_queries(conn, n)
+    for query in queries[:20]:  # warm both caches
+        search.query(query), index.query(query)
+
+    times = { 'word': ([], []), 'phrase': ([], []) }
+    mismatches = []
+    for query in queries:
+        db_time, expected = timed(search.query, query)
+        index_time, actual = timed(index.query, query)
+        kind = 'phrase' if is_phrase(query) else 'word'
+        times[kind][0].append(db_time)
+        times[kind][1].append(index_time)
+        if segments_json(actual) != segments_json(expected):
+            mismatches.append(query)
+
+    print(f'{len(queries)} queries, open: sqlite {open_db * 1000:.2f} ms, index {open_index * 1000:.2f} ms')
+    print(f'{"":8}{"":8}{"mean":>10}{"p50":>10}{"p95":>10}   (ms)')
+    for kind, (db_times, index_times) in times.items():
+        if not db_times: continue
+        for label, values in (('sqlite', db_times), ('index', index_times)):
+            print(f'{kind:8}{label:8}{statistics.mean(values) * 1000:10.3f}'
+                  f'{percentile(values, 0.5) * 1000:10.3f}{percentile(values, 0.95) * 1000:10.3f}')
+        print(f'{"":8}{"speedup":8}{statistics.mean(db_times) / statistics.mean(index_times):9.1f}x')
+    index.close()
+    conn.close()
+
+    if mismatches:
+        print(f'{len(mismatches)} queries differ from SQLite: {mismatches[:10]}')
+        sys.exit(1)
+    print('Same results as SQLite for every query.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory-mapped search index over squeex.db.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('build', help='write the index of a database')
+    p.add_argument('--db', default=DB_PATH, help=f'database (default: {DB_PATH})')
+    p.add_argument('--out', default=INDEX_PATH, help=f'index path (default: {INDEX_PATH})')
+
+    p = commands.add_parser('query', help='search the index, results as JSON')
+    p.add_argument('queries', nargs='+')
+    p.add_argument('--index', default=INDEX_PATH, help=f'index path (default: {INDEX_PATH})')
+
+    p = commands.add_parser('bench', help='latency and results against the SQLite search')
+    p.add_argument('--db', default=DB_PATH, help=f'database (default: {DB_PATH})')
+    p.add_argument('--index', default=INDEX_PATH, help=f'index path (default: {INDEX_PATH})')
+    p.add_argument('--queries', type=int, default=200, help='sampled words and phrases, each (default: 200)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        write(args.db, args.out)
+    elif args.command == 'query':
+        with Index(args.index) as index:
+            for query in args.queries:
+                print(json.dumps({ 'query': query, 'segments': index.query(query) }, ensure_ascii=False))
+    else:
+        bench(args.db, args.index, args.queries)
@@ -0,0 +1,176 @@
+import os
+import sys
+import random
+import argparse
+import itertools
+from datetime import date, timedelta
+
+"""
+Deterministic synthetic corpus for benchmarks: YouTube-style auto-caption
+vtt files and a matching dates.txt, so every pipeline stage can be run
+offline on an archive of any size.
+
+The captions follow what yt-dlp --write-auto-subs downloads: each caption
+line appears in a 2-3s cue with <c> word timings below the previous line,
+then again in a 10ms cue on its own, so most lines show up in two or three
+cues. Words are drawn from a Zipf-like vocabulary (a common English core,
+stream-specific words and generated filler), with [Music] / [Laughter]
+cues and occasional silences.
+
+--style rollup writes live roll-up captions instead: no word timings,
+the new line grows a word per cue below the previous one.
+
+Also writes a word frequency list in the format analyze_deviance.py reads,
+so the suggestions stage does not need to download one.
+
+Usage:
+    python3 scripts/synth.py --out /tmp/synth --videos 200 --hours 4
+    python3 scripts/synth.py --out /tmp/rollup --videos 20 --style rollup
+    # -> /tmp/synth/vtt/*.en.vtt, /tmp/synth/dates.txt, /tmp/synth/freq.txt
+"""
+
+COMMON = ('the i you to and a it that of is in we this what so like oh '
+          'just go do be yeah on know no for was have get okay but right '
+          'there one not my me all can here if up that\'s it\'s don\'t i\'m '
+          'out are now got gonna good see think with at chat time let\'s '
+          'this game there\'s going come how back they why really thank '
+          'well look guys need want about make from when people some').split()
+
+STREAM = ('squeex bazinga speedrun poggers chat stream vod boss raid '
+          'sub emote clip dono hype lmao kekw based cringe lore pb wr '
+          'glitch skip split grind loot').split()
+
+ANNOTATIONS = ('[Music]', '[Laughter]', '[Applause]')
+
+SYLLABLES = 'ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu za ze zo'.split()
+
+STYLES = ('youtube', 'rollup')
+
+ID_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_'
+
+
+def vocabulary(size, rng):
+    """Common words first, then stream words, then generated filler."""
+    words = list(dict.fromkeys(COMMON + STREAM))
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class WordSampler:
+    """Draws words with probability ~ 1 / rank."""
+
+    def __init__(self, words, exponent=1.0):
+        self.words = words
+        self.cum_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(words) + 1)))
+
+    def sample(self, rng, n):
+        return rng.choices(self.words, cum_weights=self.cum_weights, k=n)
+
+
+def timestamp(ms):
+    return f'{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}'
+
+
+def write_vtt(path, hours, rng, sampler=None, style='youtube'):
+    """An auto-caption file covering `hours` of video."""
+    sampler = sampler or WordSampler(vocabulary(2000, random.Random(0)))
+    with open(path, 'w') as f:
+        f.write('WEBVTT\nKind: captions\nLanguage: en\n\n')
+        ms = 0
+        prev = ''
+        while ms < hours * 3600000:
+            if rng.random() < 0.01:
+                ms += rng.randint(5000, 60000)
+                prev = ''
+            if rng.random() < 0.04:
+                line = rng.choice(ANNOTATIONS)
+                tagged = line
+            else:
+                words = sampler.sample(rng, rng.randint(1, 9))
+                line = ' '.join(words)
+                tagged = words[0] + ''.join(
+                    f'<{timestamp(ms + 280 * i)}><c> {w}</c>' for i, w in enumerate(words[1:], 1))
+            end = ms + rng.randint(1000, 4000)
+            if style == 'rollup':
+                words = line.split()
+                step = (end - ms) // len(words)
+                for i in range(1, len(words) + 1):
+                    partial = ' '.join(words[:i])
+                    cue_end = end if i == len(words) else ms + step * i
+                    f.write(f'{timestamp(ms + step * (i - 1))} --> {timestamp(cue_end)}\n')
+                    f.write(f'{prev}\n{partial}\n\n' if prev else f'{partial}\n\n')
+                prev = line
+                ms = end
+                continue
+            f.write(f'{timestamp(ms)} --> {timestamp(end)} align:start position:0%\n')
+            f.write(f'{prev}\n{tagged}\n\n' if prev else f' \n{tagged}\n\n')
+            f.write(f'{timestamp(end)} --> {timestamp(end + 10)} align:start position:0%\n')
+            f.write(f'{line}\n \n\n')
+            prev = line
+            ms = end + 10
+
+
+def video_id(rng):
+    return ''.join(rng.choice(ID_CHARS) for _ in range(11))
+
+
+def write_freq(path, words, rng):
+    """
+    English-baseline counts for the vocabulary: stream words and some of
+    the filler are left out, as they would be missing from a real list.
+    """
+    stream = set(STREAM)
+    common = set(COMMON)
+    with open(path, 'w') as f:
+        for rank, word in enumerate(words, 1):
+            if word in stream or (word not in common and rng.random() < 0.3):
+                continue
+            f.write(f'{word}\t{int(1e10 / rank)}\n')
+
+
+def generate(out_dir, videos, hours, seed=0, vocabulary_size=20000, start_date=date(2020, 1, 1), style='youtube'):
+    """
+    Write `videos` vtt files to <out_dir>/vtt, their upload dates to
+    <out_dir>/dates.txt and a frequency list to <out_dir>/freq.txt.
+    Lengths vary between 0.5 and 1.5 x `hours`, upload dates increase with
+    the index. Returns (vid, vtt path) in upload order.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(vocabulary_size, rng)
+    sampler = WordSampler(words)
+
+    vtt_dir = os.path.join(out_dir, 'vtt')
+    os.makedirs(vtt_dir, exist_ok=True)
+    videos_written = []
+    day = start_date
+    with open(os.path.join(out_dir, 'dates.txt'), 'w') as dates_file:
+        for _ in range(videos):
+            vid = video_id(rng)
+            day += timedelta(days=rng.randint(1, 3))
+            title = f'Squeex VOD {day.isoformat()} - {" ".join(sampler.sample(rng, 3))}'
+            path = os.path.join(vtt_dir, f'{title} [{vid}].en.vtt')
+            write_vtt(path, hours * rng.uniform(0.5, 1.5), rng, sampler, style)
+            dates_file.write(f'{vid}:{day.strftime("%Y%m%d")}\n')
+            videos_written.append((vid, path))
+
+    write_freq(os.path.join(out_dir, 'freq.txt'), words, rng)
+    return videos_written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic auto-caption corpus.')
+    parser.add_argument('--out', required=True, help='output directory')
+    parser.add_argument('--videos', type=int, default=100)
+    parser.add_argument('--hours', type=float, default=4, help='average video length (default: 4)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--style', choices=STYLES, default='youtube', help='caption style (default: youtube)')
+    args = parser.parse_args()
+
+    written = generate(args.out, args.videos, args.hours, args.seed, style=args.style)
+    size = sum(os.path.getsize(path) for _, path in written)
+    print(f'Wrote {len(written)} videos ({size / 1e6:.1f} MB of vtt) to {args.out}', file=sys.stderr)
@@ -0,0 +1,484 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+from array import array
+from collections import Counter
+from datetime import datetime
+
+import corpus
+import postings
+import transcripts
+
+"""
+Per-video term statistics for analyze_deviance.py, kept in a sidecar
+database (data/term_stats.db) next to data/squeex.db.
+
+videos      one row per video: corpus order (seq), upload date, which
+            half of the trending split it is in (1 older, 2 recent, 0 no
+            usable date), and its unigram and bigram counts as varint
+            packed (term id, count) arrays
+words       every word_map word with its mentions (segments it appears
+            in, summed over videos) in total and per half, and pos, its
+            first word_map rowid in squeex.db
+bigrams     every pair of adjacent 3+ letter words in the transcripts,
+            with its count
+info        updatedAt and build of the squeex.db it was counted from
+
+analyze_deviance.py breaks ties between words in the order they entered
+the corpus (pos) and between bigrams by count, then bigram, the same
+with or without the sidecar. A full build reads everything from
+squeex.db. --update applies data/changeset.json (see merge.py) instead:
+the counts of replaced and deleted videos are subtracted, those of added
+and replaced videos are added, and only the videos that cross the
+midpoint of the date split are moved between halves, so it takes time
+proportional to the changed videos. pos is looked up again for the words
+the changeset touched, so squeex.db has to be updated the same way
+(build_db.py --incremental). A full rebuild of squeex.db renumbers
+word_map, so --update refuses a squeex.db from another build (info.build)
+than the one counted; rebuild this too.
+
+--check recounts everything from squeex.db and compares it with the
+sidecar, orders included.
+
+Usage:
+    python3 scripts/term_stats.py                # full build
+    python3 scripts/term_stats.py --update       # apply the changeset
+    python3 scripts/term_stats.py --check
+"""
+
+STATS_PATH = 'data/term_stats.db'
+DB_PATH = 'data/squeex.db'
+SCHEMA_VERSION = 2
+
+WORD_RE = re.compile(r'[a-z]+')
+
+
+def pack_ints(values):
+    out = bytearray()
+    for value in values:
+        postings.write_varint(out, value)
+    return bytes(out)
+
+
+def unpack_ints(blob):
+    values = []
+    pos = 0
+    while pos < len(blob):
+        value, pos = postings.read_varint(blob, pos)
+        values.append(value)
+    return values
+
+
+def parse_upload_date(d):
+    """upload_date as a datetime, or None if it can't be read."""
+    try:
+        if isinstance(d, int):
+            ds = str(d)
+            return datetime(int(ds[:4]), int(ds[4:6]), int(ds[6:8]))
+        return datetime.fromisoformat(str(d))
+    except:
+        return None
+
+
+def split_halves(videos):
+    """
+    (vid, upload_date) in corpus order -> { vid: 1 or 2 }: the older and
+    the recent half by upload date. Videos without a usable date are left out.
+    """
+    dated = [ (vid, parse_upload_date(d)) for vid, d in videos ]
+    dated = [ (vid, d) for vid, d in dated if d is not None ]
+    dated.sort(key=lambda x: x[1])
+    midpoint = len(dated) // 2
+    return { vid: 1 if i < midpoint else 2 for i, (vid, _) in enumerate(dated) }
+
+
+def transcript_pairs(text):
+    """Adjacent word pairs of a transcript, both 3+ letters, as 'a b'."""
+    words = WORD_RE.findall((text or '').lower())
+    return [ f'{a} {b}' for a, b in zip(words, words[1:]) if len(a) >= 3 and len(b) >= 3 ]
+
+
+def transcript_bigrams(text):
+    """Counter of transcript_pairs, in first-seen order."""
+    return Counter(transcript_pairs(text))
+
+
+def video_word_counts(db, vid):
+    """{ word: mentions } of one video, through its word_map rows."""
+    segments = transcripts.Reader(db, cache_size=0).segments(vid)
+    counts = {}
+    for word in corpus.video_words(segments or []):
+        row = db.execute('SELECT segment_indexes FROM word_map WHERE word = ? AND vid = ?', (word, vid)).fetchone()
+        if row is not None:
+            counts[word] = postings.count(row[0])
+    return counts
+
+
+class Recount:
+    """Everything the sidecar holds, counted from squeex.db in memory."""
+
+    def __init__(self, db):
+        self.videos = db.execute('SELECT vid, upload_date FROM videos ORDER BY rowid').fetchall()
+        self.halves = split_halves(self.videos)
+
+        self.word_ids = {}
+        self.word_pos = {}
+        video_words = { vid: (array('I'), array('I')) for vid, _ in self.videos }
+        for rowid, word, vid, blob in db.execute('SELECT rowid, word, vid, segment_indexes FROM word_map ORDER BY rowid'):
+            ids, counts = video_words[vid]
+            if word not in self.word_ids:
+                self.word_ids[word] = len(self.word_ids)
+                self.word_pos[word] = rowid
+            ids.append(self.word_ids[word])
+            counts.append(postings.count(blob))
+        self.video_words = video_words
+
+        self.bigram_ids = {}
+        self.video_bigrams = {}
+        reader = transcripts.Reader(db, cache_size=0)
+        for vid, text in db.execute('SELECT vid, full_text FROM videos ORDER BY rowid'):
+            bigrams = transcript_bigrams(reader.decode(text))
+            ids = array('I', (self.bigram_ids.setdefault(bg, len(self.bigram_ids)) for bg in bigrams))
+            self.video_bigrams[vid] = (ids, array('I', bigrams.values()))
+
+    def word_totals(self):
+        """{ word: [total, old, new] }"""
+        words = list(self.word_ids)
+        totals = [ [0, 0, 0] for _ in words ]
+        for vid, (ids, counts) in self.video_words.items():
+            half = self.halves.get(vid, 0)
+            for i, count in zip(ids, counts):
+                totals[i][0] += count
+                if half:
+                    totals[i][half] += count
+        return dict(zip(words, totals))
+
+    def bigram_totals(self):
+        totals = [0] * len(self.bigram_ids)
+        for ids, counts in self.video_bigrams.values():
+            for i, count in zip(ids, counts):
+                totals[i] += count
+        return dict(zip(self.bigram_ids, totals))
+
+
+def create_schema(c):
+    c.execute('''CREATE TABLE videos (
+        vid TEXT PRIMARY KEY,
+        seq INTEGER,
+        upload_date,
+        half INTEGER,
+        word_ids BLOB,
+        word_counts BLOB,
+        bigram_ids BLOB,
+        bigram_counts BLOB
+    )''')
+
+    c.execute('''CREATE TABLE words (
+        id INTEGER PRIMARY KEY,
+        word TEXT UNIQUE,
+        total INTEGER,
+        old INTEGER,
+        new INTEGER,
+        pos INTEGER
+    )''')
+
+    c.execute('''CREATE TABLE bigrams (
+        id INTEGER PRIMARY KEY,
+        bigram TEXT UNIQUE,
+        total INTEGER
+    )''')
+
+    c.execute('''CREATE TABLE info (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )''')
+
+
+def create_indexes(c):
+    # Top bigrams by count, ties by bigram.
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bigrams_total ON bigrams(total DESC, bigram)')
+
+
+def db_updated_at(db):
+    return db.execute("SELECT value FROM info WHERE key = 'updatedAt'").fetchone()[0]
+
+
+def db_build(db):
+    """The full build squeex.db comes from (info.build), '' for databases from before it was recorded."""
+    row = db.execute("SELECT value FROM info WHERE key = 'build'").fetchone()
+    return row[0] if row else ''
+
+
+def ranked_bigrams(totals):
+    """(bigram, total) by total, highest first, ties by bigram."""
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+def build(stats_path, db_path):
+    start = time.time()
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    print(f'Counting terms in {db_path}...')
+    counts = Recount(db)
+    updated_at = db_updated_at(db)
+    build_id = db_build(db)
+    db.close()
+
+    tmp_path = stats_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    c = conn.cursor()
+    c.execute('PRAGMA journal_mode = OFF')
+    c.execute('PRAGMA synchronous = OFF')
+    c.execute('BEGIN')
+    create_schema(c)
+
+    rows = []
+    for seq, (vid, upload_date) in enumerate(counts.videos, 1):
+        word_ids, word_counts = counts.video_words[vid]
+        bigram_ids, bigram_counts = counts.video_bigrams[vid]
+        # Ids are 1-based in the tables.
+        rows.append((vid, seq, upload_date, counts.halves.get(vid, 0),
+                     pack_ints(i + 1 for i in word_ids), pack_ints(word_counts),
+                     pack_ints(i + 1 for i in bigram_ids), pack_ints(bigram_counts)))
+    c.executemany('INSERT INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    c.executemany('INSERT INTO words VALUES (?, ?, ?, ?, ?, ?)',
+                  ((i, word, *totals, counts.word_pos[word]) for i, (word, totals) in enumerate(counts.word_totals().items(), 1)))
+    c.executemany('INSERT INTO bigrams VALUES (?, ?, ?)',
+                  ((i, bigram, total) for i, (bigram, total) in enumerate(counts.bigram_totals().items(), 1)))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('updatedAt', updated_at))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('build', build_id))
+    c.execute('INSERT INTO info VALUES (?, ?)', ('schema', str(SCHEMA_VERSION)))
+    create_indexes(c)
+    c.execute('COMMIT')
+    c.execute('PRAGMA journal_mode = DELETE')
+    c.execute('VACUUM')
+    conn.close()
+    os.replace(tmp_path, stats_path)
+
+    size_mb = os.path.getsize(stats_path) / (1024 * 1024)
+    print(f'Done in {time.time() - start:.1f}s. {stats_path} ({size_mb:.1f} MB, {len(counts.videos)} videos, '
+          f'{len(counts.word_ids)} words, {len(counts.bigram_ids)} bigrams)')
+
+
+class Totals:
+    """Pending changes to words / bigrams totals, applied in one pass."""
+
+    def __init__(self, c, table, columns):
+        self.c = c
+        self.table = table
+        self.columns = columns
+        self.deltas = {}
+
+    def add(self, term_id, column, delta):
+        row = self.deltas.setdefault(term_id, [0] * len(self.columns))
+        row[column] += delta
+
+    def apply(self):
+        assignments = ', '.join(f'{col} = {col} + ?' for col in self.columns)
+        self.c.executemany(f'UPDATE {self.table} SET {assignments} WHERE id = ?',
+                           ((*delta, term_id) for term_id, delta in self.deltas.items() if any(delta)))
+        # Terms no video contains any more.
+        self.c.executemany(f'DELETE FROM {self.table} WHERE id = ? AND total = 0',
+                           ((term_id,) for term_id in self.deltas))
+
+
+def term_ids(c, table, column, terms):
+    """Ids of `terms`, inserting the new ones at the end in iteration order."""
+    ids = {}
+    new = []
+    for term in terms:
+        row = c.execute(f'SELECT id FROM {table} WHERE {column} = ?', (term,)).fetchone()
+        if row is None:
+            new.append(term)
+        else:
+            ids[term] = row[0]
+    zeros = ', 0' * (4 if table == 'words' else 1)
+    for term in new:
+        c.execute(f'INSERT INTO {table} VALUES (NULL, ?{zeros})', (term,))
+        ids[term] = c.lastrowid
+    return ids
+
+
+def update(stats_path, db_path, changeset_path, force=False):
+    if not os.path.exists(stats_path):
+        print(f'{stats_path} not found, run a full build first.')
+        sys.exit(1)
+    changeset = corpus.load_changeset(changeset_path)
+
+    conn = sqlite3.connect(stats_path, isolation_level=None)
+    c = conn.cursor()
+    current = c.execute("SELECT value FROM info WHERE key = 'updatedAt'").fetchone()[0]
+    if current == changeset['updatedAt']:
+        print(f'{stats_path} is already at {current}, nothing to do.')
+        return
+    row = c.execute("SELECT value FROM info WHERE key = 'schema'").fetchone()
+    if row is None or row[0] != str(SCHEMA_VERSION):
+        print(f'{stats_path} has an older schema, run a full build.')
+        sys.exit(1)
+    if current != changeset['base'] and not force:
+        print(f'{stats_path} is at {current}, but the changeset is based on {changeset["base"]}. '
+              'Run a full build, or pass --force.')
+        sys.exit(1)
+
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    if db_updated_at(db) != changeset['updatedAt']:
+        print(f'{db_path} is not at {changeset["updatedAt"]}, update it first (build_db.py --incremental).')
+        sys.exit(1)
+    (counted_build,) = c.execute("SELECT value FROM info WHERE key = 'build'").fetchone()
+    if db_build(db) != counted_build:
+        print(f'{db_path} was rebuilt since {stats_path} was counted, its word_map is numbered anew. Run a full build.')
+        sys.exit(1)
+
+    start = time.time()
+    words = Totals(c, 'words', ('total', 'old', 'new'))
+    bigrams = Totals(c, 'bigrams', ('total',))
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        # Take out what replaced and deleted videos counted for.
+        removed = changeset['replaced'] + changeset['deleted']
+        for vid in removed:
+            row = c.execute('SELECT half, word_ids, word_counts, bigram_ids, bigram_counts FROM videos WHERE vid = ?',
+                            (vid,)).fetchone()
+            if row is None: continue
+            half, word_ids, word_counts, bigram_ids, bigram_counts = row
+            for i, count in zip(unpack_ints(word_ids), unpack_ints(word_counts)):
+                words.add(i, 0, -count)
+                if half:
+                    words.add(i, half, -count)
+            for i, count in zip(unpack_ints(bigram_ids), unpack_ints(bigram_counts)):
+                bigrams.add(i, 0, -count)
+        c.executemany('DELETE FROM videos WHERE vid = ?', ((vid,) for vid in changeset['deleted']))
+
+        # Count added and replaced videos in corpus order. Replaced videos
+        # keep their place, added ones go at the end.
+        changed = corpus.changed_vids(changeset)
+        rowids = { vid: db.execute('SELECT rowid FROM videos WHERE vid = ?', (vid,)).fetchone()[0] for vid in changed }
+        changed.sort(key=rowids.get)
+        word_counts = { vid: video_word_counts(db, vid) for vid in changed }
+        reader = transcripts.Reader(db, cache_size=0)
+        bigram_counts = { vid: transcript_bigrams(reader.full_text(vid)) for vid in changed }
+
+        # New bigrams go at the end in first-seen order.
+        word_ids = term_ids(c, 'words', 'word', dict.fromkeys(w for counts in word_counts.values() for w in counts))
+        bigram_ids = term_ids(c, 'bigrams', 'bigram', dict.fromkeys(bg for counts in bigram_counts.values() for bg in counts))
+
+        (seq,) = c.execute('SELECT COALESCE(MAX(seq), 0) FROM videos').fetchone()
+        for vid in changed:
+            upload_date = db.execute('SELECT upload_date FROM videos WHERE vid = ?', (vid,)).fetchone()[0]
+            wc = word_counts[vid]
+            bc = bigram_counts[vid]
+            ids = [ word_ids[w] for w in wc ]
+            for i, count in zip(ids, wc.values()):
+                words.add(i, 0, count)
+            for bg, count in bc.items():
+                bigrams.add(bigram_ids[bg], 0, count)
+            blobs = (pack_ints(ids), pack_ints(wc.values()), pack_ints(bigram_ids[bg] for bg in bc), pack_ints(bc.values()))
+            if vid in changeset['replaced'] and c.execute('SELECT 1 FROM videos WHERE vid = ?', (vid,)).fetchone():
+                # Counted in neither half until the split below.
+                c.execute('''UPDATE videos SET upload_date = ?, half = 0, word_ids = ?, word_counts = ?,
+                             bigram_ids = ?, bigram_counts = ? WHERE vid = ?''', (upload_date, *blobs, vid))
+            else:
+                seq += 1
+                c.execute('INSERT INTO videos VALUES (?, ?, ?, 0, ?, ?, ?, ?)', (vid, seq, upload_date, *blobs))
+
+        # Move the videos whose half of the date split changed.
+        videos = c.execute('SELECT vid, upload_date, half FROM videos ORDER BY seq').fetchall()
+        halves = split_halves([ (vid, d) for vid, d, _ in videos ])
+        moved = 0
+        for vid, _, half in videos:
+            new_half = halves.get(vid, 0)
+            if new_half == half: continue
+            moved += 1
+            ids, counts = c.execute('SELECT word_ids, word_counts FROM videos WHERE vid = ?', (vid,)).fetchone()
+            for i, count in zip(unpack_ints(ids), unpack_ints(counts)):
+                if half:
+                    words.add(i, half, -count)
+                if new_half:
+                    words.add(i, new_half, count)
+            c.execute('UPDATE videos SET half = ? WHERE vid = ?', (new_half, vid))
+
+        words.apply()
+        bigrams.apply()
+        # Only the rows of changed videos were rewritten in word_map, so
+        # only the words they contain (or contained) can have a new pos.
+        for word_id in words.deltas:
+            row = c.execute('SELECT word FROM words WHERE id = ?', (word_id,)).fetchone()
+            if row is None: continue
+            (pos,) = db.execute('SELECT MIN(rowid) FROM word_map WHERE word = ?', row).fetchone()
+            c.execute('UPDATE words SET pos = ? WHERE id = ?', (pos, word_id))
+        c.execute("INSERT OR REPLACE INTO info VALUES ('updatedAt', ?)", (changeset['updatedAt'],))
+        c.execute('COMMIT')
+    except BaseException:
+        c.execute('ROLLBACK')
+        raise
+    db.close()
+    conn.close()
+
+    print(f'Updated {stats_path} from {current} to {changeset["updatedAt"]} in {time.time() - start:.1f}s '
+          f'({len(changeset["added"])} added, {len(changeset["replaced"])} replaced, {len(changeset["deleted"])} deleted, '
+          f'{moved} videos changed half, {len(words.deltas)} words and {len(bigrams.deltas)} bigrams touched)')
+
+
+def check(stats_path, db_path):
+    """Recount from squeex.db and compare. Returns the number of mismatches."""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    counts = Recount(db)
+    updated_at = db_updated_at(db)
+    build_id = db_build(db)
+    db.close()
+
+    conn = sqlite3.connect(f'file:{stats_path}?mode=ro', uri=True)
+    info = dict(conn.execute('SELECT key, value FROM info'))
+    words = { word: [total, old, new] for word, total, old, new in conn.execute('SELECT word, total, old, new FROM words ORDER BY pos') }
+    # The order analyze_deviance.py reads them in.
+    bigrams = dict(conn.execute('SELECT bigram, total FROM bigrams ORDER BY total DESC, bigram'))
+    halves = { vid: half for vid, half in conn.execute('SELECT vid, half FROM videos') }
+    video_order = [ vid for (vid,) in conn.execute('SELECT vid FROM videos ORDER BY seq') ]
+    conn.close()
+
+    mismatches = 0
+    def compare(name, ok, detail=''):
+        nonlocal mismatches
+        print(f'  {name:<28} {"ok" if ok else "MISMATCH " + detail}')
+        mismatches += not ok
+
+    def diff(expected, actual):
+        keys = [ k for k in expected.keys() | actual.keys() if expected.get(k) != actual.get(k) ]
+        return f'({len(keys)} differ, e.g. {sorted(keys)[:5]})'
+
+    print(f'Recounted {db_path} ({updated_at}), sidecar at {info.get("updatedAt")}:')
+    compare('updatedAt', updated_at == info.get('updatedAt'))
+    compare('build', build_id == info.get('build'), f'({info.get("build")} counted, {build_id} in {db_path})')
+    compare('videos', video_order == [ vid for vid, _ in counts.videos ])
+    expected_halves = { vid: counts.halves.get(vid, 0) for vid, _ in counts.videos }
+    compare('date split', halves == expected_halves, diff(expected_halves, halves))
+    expected_words = counts.word_totals()
+    compare('word totals', words == expected_words, diff(expected_words, words))
+    compare('word order', list(words) == list(expected_words))
+    expected_bigrams = counts.bigram_totals()
+    compare('bigram totals', bigrams == expected_bigrams, diff(expected_bigrams, bigrams))
+    compare('bigram order', list(bigrams.items()) == ranked_bigrams(expected_bigrams))
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-video term statistics for analyze_deviance.py.')
+    parser.add_argument('--stats', default=STATS_PATH, help=f'sidecar database (default: {STATS_PATH})')
+    parser.add_argument('--db', default=DB_PATH, help=f'database to count (default: {DB_PATH})')
+    parser.add_argument('--update', action='store_true', help='apply the changeset instead of a full build')
+    parser.add_argument('--changeset', default=corpus.CHANGESET_PATH, help=f'--update changeset (default: {corpus.CHANGESET_PATH})')
+    parser.add_argument('--force', action='store_true', help='--update: apply even if the sidecar is not at the changeset base')
+    parser.add_argument('--check', action='store_true', help='compare the sidecar with a full recount')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check(args.stats, args.db) else 0)
+    if args.update:
+        update(args.stats, args.db, args.changeset, args.force)
+    else:
+        build(args.stats, args.db)
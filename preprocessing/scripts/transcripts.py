@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import zlib
+import heapq
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from collections import Counter, OrderedDict
+
+"""
+Codec for the transcript columns of squeex.db: videos.segments (JSON),
+videos.full_text and videos.idx_to_time (JSON).
+
+Each value is stored as a raw deflate stream (zlib wbits -15, level 9) of
+its UTF-8 text, compressed with a preset dictionary shared by every video
+and column. build_db.py trains the dictionary on a sample of the
+transcripts at a full build and stores it in dictionaries(name, data)
+under DICTIONARY; --incremental compresses new rows with the stored one.
+info.compression records the format.
+
+A preset dictionary is text the compressor can refer back to before the
+first byte of a value, so the phrases every stream repeats are cheap from
+the start of each video. train() picks it like zstd's cover algorithm:
+K-byte substrings are scored by how many sampled videos contain them, and
+SEGMENT-byte pieces of the samples are taken greedily by the score of the
+substrings they add, up to deflate's 32KB window. The best pieces go last,
+closest to the data.
+
+Values that are TEXT (databases built before) are returned as they are,
+so readers work with either. Reader decompresses on demand and keeps the
+last CACHE_SIZE values it decoded; it does not notice later writes to the
+database.
+
+app/lib/transcripts.js is the matching decoder for the server.
+
+Usage:
+    from transcripts import Reader
+    reader = Reader(sqlite3.connect('data/squeex.db'))
+    reader.full_text(vid)
+    reader.segments(vid)          # [ [start, text] ]
+
+    python3 scripts/transcripts.py --stats   # sizes, with and without the dictionary
+    python3 scripts/transcripts.py --bench   # search latency against a decompressed copy
+"""
+
+DB_PATH = 'data/squeex.db'
+
+COLUMNS = ('segments', 'full_text', 'idx_to_time')
+FORMAT = 'deflate-dictionary'
+DICTIONARY = 'transcripts'
+
+DICTIONARY_SIZE = 32 * 1024
+LEVEL = 9
+K = 8
+SEGMENT = 64
+# Sampled bytes, taken evenly from the start of each sample.
+TRAIN_BYTES = 1024 * 1024
+CACHE_SIZE = 64
+BENCH_ROUNDS = 3
+
+
+def train(samples, size=DICTIONARY_SIZE, budget=TRAIN_BYTES):
+    """A preset dictionary of at most size bytes for values like samples (bytes)."""
+    if not samples:
+        return b''
+    chunks = [ sample[:max(budget // len(samples), SEGMENT)] for sample in samples ]
+    frequency = Counter()
+    for chunk in chunks:
+        frequency.update({ chunk[i:i + K] for i in range(len(chunk) - K + 1) })
+
+    def kmers(piece):
+        return { piece[i:i + K] for i in range(len(piece) - K + 1) }
+
+    heap = [ (-sum(frequency[kmer] for kmer in kmers(chunk[i:i + SEGMENT])), i, n)
+             for n, chunk in enumerate(chunks) for i in range(0, len(chunk) - SEGMENT + 1, SEGMENT) ]
+    heapq.heapify(heap)
+    covered = set()
+    chosen = []
+    length = 0
+    while heap and length < size:
+        _, i, n = heapq.heappop(heap)
+        piece = chunks[n][i:i + SEGMENT]
+        new = kmers(piece) - covered
+        score = sum(frequency[kmer] for kmer in new if frequency[kmer] > 1)
+        if score == 0:
+            break
+        # Scores only go down as substrings get covered: re-queue a piece
+        # whose stale score put it ahead of one that now beats it.
+        if heap and score < -heap[0][0]:
+            heapq.heappush(heap, (-score, i, n))
+            continue
+        chosen.append(piece)
+        covered |= new
+        length += len(piece)
+    return b''.join(reversed(chosen))[-size:]
+
+
+def compress(text, dictionary):
+    c = zlib.compressobj(LEVEL, zlib.DEFLATED, -15, zdict=dictionary)
+    return c.compress(text.encode('utf-8')) + c.flush()
+
+
+def decompress(blob, dictionary):
+    d = zlib.decompressobj(-15, zdict=dictionary)
+    return (d.decompress(blob) + d.flush()).decode('utf-8')
+
+
+def load_dictionary(conn, schema='main'):
+    """The stored dictionary, or None for a database without one."""
+    if conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'dictionaries'").fetchone() is None:
+        return None
+    row = conn.execute(f'SELECT data FROM {schema}.dictionaries WHERE name = ?', (DICTIONARY,)).fetchone()
+    return row[0] if row else None
+
+
+class Reader:
+    """Decoded transcript columns of the videos in a squeex.db (or an attached one, schema)."""
+
+    def __init__(self, conn, cache_size=CACHE_SIZE, schema='main'):
+        self.conn = conn
+        self.schema = schema
+        self.dictionary = load_dictionary(conn, schema)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def decode(self, value):
+        """A column value as text: decompressed if it is a BLOB."""
+        if isinstance(value, bytes):
+            return decompress(value, self.dictionary)
+        return value
+
+    def text(self, vid, column):
+        """A video's column as text, None if there is no such video."""
+        key = (vid, column)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        row = self.conn.execute(f'SELECT {column} FROM {self.schema}.videos WHERE vid = ?', (vid,)).fetchone()
+        if row is None:
+            return None
+        text = self.decode(row[0])
+        if self.cache_size:
+            self.cache[key] = text
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return text
+
+    def full_text(self, vid):
+        return self.text(vid, 'full_text')
+
+    def segments(self, vid):
+        text = self.text(vid, 'segments')
+        return None if text is None else json.loads(text)
+
+    def idx_to_time(self, vid):
+        text = self.text(vid, 'idx_to_time')
+        return None if text is None else json.loads(text)
+
+
+def stats(conn):
+    """Sizes of each column: as text, compressed alone and with the dictionary."""
+    reader = Reader(conn, cache_size=0)
+    print(f'dictionary: {len(reader.dictionary or b"")} bytes')
+    decode_time = 0
+    for column in COLUMNS:
+        text = stored = alone = 0
+        for value, in conn.execute(f'SELECT {column} FROM videos'):
+            start = time.perf_counter()
+            decoded = reader.decode(value)
+            decode_time += time.perf_counter() - start
+            data = decoded.encode('utf-8')
+            text += len(data)
+            stored += len(value) if isinstance(value, bytes) else len(data)
+            alone += len(compress(decoded, b''))
+        print(f'  {column:<12} {text / 1e6:8.2f} MB text, {stored / 1e6:8.2f} MB stored, '
+              f'{alone / 1e6:8.2f} MB without the dictionary')
+    videos = conn.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+    print(f'decoding every column of a video: {decode_time / max(videos, 1) * 1000:.2f} ms')
+
+
+def decompressed_copy(db_path, path):
+    """Copy of the database with the transcript columns stored as text."""
+    shutil.copy(db_path, path)
+    conn = sqlite3.connect(path)
+    reader = Reader(conn, cache_size=0)
+    rows = conn.execute(f'SELECT vid, {", ".join(COLUMNS)} FROM videos').fetchall()
+    conn.executemany(f'UPDATE videos SET {", ".join(c + " = ?" for c in COLUMNS)} WHERE vid = ?',
+                     ([ reader.decode(value) for value in values ] + [ vid ] for vid, *values in rows))
+    conn.commit()
+    return conn
+
+
+def timed(decode, counts):
+    """decode, adding the values it decompresses and the seconds it takes to counts."""
+    def wrapper(value):
+        if not isinstance(value, bytes):
+            return value
+        start = time.perf_counter()
+        text = decode(value)
+        counts[0] += 1
+        counts[1] += time.perf_counter() - start
+        return text
+    return wrapper
+
+
+def bench(db_path, n, rounds=BENCH_ROUNDS):
+    """
+    Search latency per query, words and phrases apart, against a copy of
+    the database without compression: decompressing every value (cold)
+    and with the cache warmed by a first pass over the queries (cached).
+    The best of rounds interleaved runs, as the differences are small next
+    to the noise; the time spent decompressing is measured apart. Exits 1
+    if any result differs.
+    """
+    from search import Search, is_phrase, sample_queries
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    queries = sample_queries(conn, n)
+    kinds = { 'words': [ q for q in queries if not is_phrase(q) ], 'phrases': [ q for q in queries if is_phrase(q) ] }
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = decompressed_copy(db_path, os.path.join(tmp, 'plain.db'))
+        searches = { 'text': Search(plain), 'cold': Search(conn, cache_size=0), 'cached': Search(conn) }
+        decoding = { name: [ 0, 0.0 ] for name in searches }
+        for name, search in searches.items():
+            search.reader.decode = timed(search.reader.decode, decoding[name])
+        for kind, kind_queries in kinds.items():
+            if not kind_queries: continue
+            expected = [ searches['text'].query(q) for q in kind_queries ]
+            times = {}
+            decoded = {}
+            for counts in decoding.values():
+                counts[:] = [ 0, 0.0 ]
+            for _ in range(rounds):
+                for name, search in searches.items():
+                    if name == 'cached':
+                        search.reader.cache.clear()
+                        for q in kind_queries:
+                            search.query(q)
+                    before = list(decoding[name])
+                    start = time.perf_counter()
+                    results = [ search.query(q) for q in kind_queries ]
+                    elapsed = (time.perf_counter() - start) / len(kind_queries) * 1000
+                    times[name] = min(times.get(name, elapsed), elapsed)
+                    decoded[name] = [ (after - b) / len(kind_queries) for after, b in zip(decoding[name], before) ]
+                    if results != expected:
+                        print(f'  {kind}, {name}: results differ')
+                        return 1
+            print(f'{len(kind_queries)} {kind}, per query: {times["text"]:.2f} ms as text, '
+                  f'{times["cold"]:.2f} ms cold, {times["cached"]:.2f} ms cached')
+            for name in ('cold', 'cached'):
+                values, seconds = decoded[name]
+                print(f'  {name:<6} decompresses {values:.1f} values in {seconds * 1000:.2f} ms')
+        plain.close()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compression of the transcript columns of squeex.db.')
+    parser.add_argument('--db', default=DB_PATH, help=f'database (default: {DB_PATH})')
+    parser.add_argument('--stats', action='store_true', help='sizes per column, with and without the dictionary')
+    parser.add_argument('--bench', action='store_true', help='search latency against a decompressed copy')
+    parser.add_argument('--queries', type=int, default=200, help='--bench: sampled words and phrases (default: 200 each)')
+    args = parser.parse_args()
+
+    if args.stats:
+        stats(sqlite3.connect(f'file:{args.db}?mode=ro', uri=True))
+    if args.bench:
+        sys.exit(bench(args.db, args.queries))
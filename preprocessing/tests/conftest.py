@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import subprocess
+
+"""
+The scripts are run from preprocessing/ and import each other by name, so
+the tests put scripts/ on the path the same way.
+"""
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', 'scripts'))
+REPO_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', '..'))
+
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def run_script(cwd, script, *args, check=True):
+    """Run scripts/<script> from cwd, like the pipeline does. Returns the CompletedProcess."""
+    return subprocess.run([ sys.executable, os.path.join('scripts', script), *args ], cwd=cwd, check=check,
+                          capture_output=True, text=True)
+
+
+def full_build(cwd, db, updated_at):
+    """
+    Build db from every parsed file, as the pipeline's build_db fallback
+    does, at version updated_at so it can be compared with an updated one.
+    """
+    run_script(cwd, 'final.py', '--stream')
+    path = os.path.join(cwd, 'data', 'final.json')
+    with open(path) as f:
+        final = json.load(f)
+    final['updatedAt'] = updated_at
+    with open(path, 'w') as f:
+        json.dump(final, f)
+    run_script(cwd, 'build_db.py', '--db', db)
+
+
+def parsed_video(vid, upload_date, texts):
+    """A video of texts, one per segment, in parse.py's output format."""
+    word_map = {}
+    idx_to_time = {}
+    length = 0
+    for idx, text in enumerate(texts):
+        for word in text.split():
+            word_map.setdefault(word, [])
+            if idx not in word_map[word]:
+                word_map[word].append(idx)
+        length += 1 + len(text)
+        idx_to_time[length] = idx * 5 + 4
+    return {
+        'id': vid,
+        'segments': [ [ idx * 5, text ] for idx, text in enumerate(texts) ],
+        'word_map': word_map,
+        'full_text': ''.join(' ' + text for text in texts),
+        'idx_to_time': idx_to_time,
+        'upload_date': upload_date,
+    }
+
+
+def write_final(videos, updated_at):
+    """
+    final.py's output (data/final.json, data/full.json) of videos, { vid:
+    (upload_date, texts) }, through data/parsed in the current directory.
+    """
+    import final
+
+    path = 'data/parsed'
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+    files = []
+    for vid, (upload_date, texts) in videos.items():
+        files.append(f'Video {vid} [{vid}].en.json')
+        with open(os.path.join(path, files[-1]), 'w') as f:
+            json.dump(parsed_video(vid, upload_date, texts), f)
+    final.build_in_memory(path, files, updated_at)
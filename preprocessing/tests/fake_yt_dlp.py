@@ -0,0 +1,44 @@
+import os
+import sys
+
+"""
+Stand-in for yt-dlp in the fetch_subtitles.py tests, called the way
+fetch() calls it: ... -o <template> -P <dir> <url>. The video ID decides
+what happens:
+
+    private*   reports the video as unavailable
+    flaky*     fails like a throttled request
+    other      prints id:date and writes '<title> [<id>].en.vtt' into <dir>
+
+Every call appends the ID to $FAKE_YT_DLP_LOG, if set. The upload date is
+$FAKE_YT_DLP_DATE_<id>, or 20200101.
+"""
+
+VTT = 'WEBVTT\n\n00:00:00.000 --> 00:00:02.000\nhello chat\n'
+
+
+def main(argv):
+    url = argv[-1]
+    directory = argv[argv.index('-P') + 1]
+    vid = url.split('v=', 1)[1] if 'v=' in url else url.rsplit('/', 1)[-1]
+    log = os.environ.get('FAKE_YT_DLP_LOG')
+    if log:
+        with open(log, 'a') as f:
+            f.write(vid + '\n')
+
+    if vid.startswith('private'):
+        print(f'ERROR: [youtube] {vid}: Private video. Sign in if you\'ve been granted access', file=sys.stderr)
+        return 1
+    if vid.startswith('flaky'):
+        print(f'ERROR: [youtube] {vid}: HTTP Error 429: Too Many Requests', file=sys.stderr)
+        return 1
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'Squeex VOD [{vid}].en.vtt'), 'w') as f:
+        f.write(VTT)
+    print(f'{vid}:{os.environ.get("FAKE_YT_DLP_DATE_" + vid, "20200101")}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,112 @@
+import json
+import random
+import shutil
+import subprocess
+
+import pytest
+
+import boundaries
+from conftest import REPO_DIR
+from search import to_utf16, from_utf16
+
+"""
+Phrase-match snippets from the packed boundaries (boundaries.snippet and
+app/lib/boundaries.js) against the walk over idx_to_time they replaced.
+
+Offsets count UTF-16 code units, as JavaScript indexes strings, so the
+Python side works on search.to_utf16 of the text like search.py does.
+"""
+
+# Characters outside the BMP take two code units each.
+ALPHABET = 'xyz é😀𝔘'
+
+NODE_SCRIPT = r'''
+const { decodeBoundaries, boundarySnippet } = require('./app/lib/boundaries');
+const cases = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+console.log(JSON.stringify(cases.map(c =>
+    boundarySnippet(c.text, decodeBoundaries(Buffer.from(c.packed, 'hex')), c.index, c.length))));
+'''
+
+needs_node = pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+
+
+def transcript(rng, cues):
+    """(full_text, idx_to_time) built the way parse.py does, offsets in UTF-16 units."""
+    full_text = ''
+    idx_to_time = {}
+    time = rng.randint(0, 5)
+    for _ in range(cues):
+        full_text += ' ' + ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12)))
+        time += rng.randint(-1, 4)
+        idx_to_time[len(to_utf16(full_text))] = time
+    return full_text, idx_to_time
+
+
+def generated_cases(n=300, seed=0):
+    """(full_text, idx_to_time, index, length) with random and edge-case matches."""
+    rng = random.Random(seed)
+    cases = []
+    for t in range(n):
+        full_text, idx_to_time = transcript(rng, 0 if t % 25 == 0 else rng.randint(1, 30))
+        if t % 10 == 1:
+            idx_to_time[0] = rng.randint(0, 3)
+        text_length = len(to_utf16(full_text))
+        matches = [ (0, rng.randint(1, 15)), (max(text_length - 3, 0), 3), (text_length, 1) ]
+        matches += [ (rng.randint(0, text_length), rng.randint(1, 15)) for _ in range(10) ]
+        cases += [ (full_text, idx_to_time, index, length) for index, length in matches ]
+    return cases
+
+
+def python_snippets(case):
+    full_text, idx_to_time, index, length = case
+    text = to_utf16(full_text)
+    offsets, times = boundaries.unpack(boundaries.pack(*boundaries.from_idx_to_time(idx_to_time)))
+    walked = boundaries.walk_snippet(text, idx_to_time, index, length)
+    bisected = boundaries.snippet(text, offsets, times, index, length)
+    return walked, bisected
+
+
+def test_pack_round_trip():
+    rng = random.Random(1)
+    for cues in (0, 1, 30):
+        _, idx_to_time = transcript(rng, cues)
+        offsets, times = boundaries.from_idx_to_time(idx_to_time)
+        assert boundaries.unpack(boundaries.pack(offsets, times)) == (offsets, times)
+
+
+def test_empty_map():
+    assert boundaries.unpack(boundaries.pack([], [])) == ([], [])
+    assert boundaries.snippet(' abc def', [], [], 1, 3) == [ 0, 'abc def' ]
+    assert boundaries.walk_snippet(' abc def', {}, 1, 3) == [ 0, 'abc def' ]
+
+
+def test_non_bmp_offsets():
+    full_text = ' 😀 a 😀 b'
+    idx_to_time = { 5: 1, 10: 2 }
+    text = to_utf16(full_text)
+    assert len(text) == 10
+    offsets, times = boundaries.from_idx_to_time(idx_to_time)
+    snippet = boundaries.snippet(text, offsets, times, text.index('b'), 1)
+    assert [ snippet[0], from_utf16(snippet[1]) ] == [ 1, '😀 b' ]
+
+
+def test_bisection_matches_walk():
+    for case in generated_cases():
+        walked, bisected = python_snippets(case)
+        assert bisected == walked, case
+
+
+@needs_node
+def test_bisection_matches_node():
+    cases = generated_cases()
+    stdin = json.dumps([ {
+        'text': full_text,
+        'packed': boundaries.pack(*boundaries.from_idx_to_time(idx_to_time)).hex(),
+        'index': index,
+        'length': length,
+    } for full_text, idx_to_time, index, length in cases ])
+    result = subprocess.run([ 'node', '-e', NODE_SCRIPT ], input=stdin, capture_output=True,
+                            text=True, cwd=REPO_DIR, check=True)
+    for case, from_node in zip(cases, json.loads(result.stdout)):
+        _, bisected = python_snippets(case)
+        assert [ bisected[0], from_utf16(bisected[1]) ] == from_node, case
@@ -0,0 +1,123 @@
+import os
+import json
+import sqlite3
+
+import pytest
+
+import build_db
+import corpus
+import delta
+import final
+import transcripts
+from conftest import write_final
+from search import Search
+
+"""
+build_db.py on a small hand-written corpus: a full build followed by
+--incremental against a fresh full build of the same videos, the
+videos_fts candidates of a phrase against scanning every transcript, and
+transcripts.Reader against the JSON the database was built from.
+"""
+
+VIDEOS = {
+    'vid00000001': (20210101, [ 'hello chat welcome back', 'squeex is here today', 'the chat is happy' ]),
+    'vid00000002': (20210102, [ 'valorant time with chat', 'no more valorant please', 'über cool 日本 🎉' ]),
+    'vid00000003': (20210101, [ 'goodbye chat', 'see you tomorrow squeex' ]),
+}
+# The refresh: vid00000002 replaced, vid00000003 deleted, vid00000004 added.
+REFRESH = {
+    'vid00000002': (20210102, [ 'valorant again tonight', 'chat says hello' ]),
+    'vid00000004': (20210103, [ 'brand new video here', 'hello chat again', 'is here today' ]),
+}
+DELETED = [ 'vid00000003' ]
+
+PHRASES = [
+    'hello chat', 'HELLO Chat', 'chat is', 'is here today',
+    # Across segments.
+    'welcome back squeex', 'tonight chat says',
+    # Only in the videos the refresh replaced or deleted.
+    'no more valorant', 'see you tomorrow',
+    'not in any video', 'über cool', 'cool 日本 🎉',
+]
+
+
+@pytest.fixture(scope='module')
+def built(tmp_path_factory):
+    """data/squeex.db updated with --incremental, data/fresh.db built whole, and the final.py output of the latter."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp_path_factory.mktemp('build_db'))
+
+        write_final(VIDEOS, 'v1')
+        build_db.build('data/squeex.db')
+
+        write_final(REFRESH, 'v2')
+        changeset = corpus.new_changeset('v1', 'v2')
+        changeset['added'] = [ 'vid00000004' ]
+        changeset['replaced'] = [ 'vid00000002' ]
+        changeset['deleted'] = DELETED
+        corpus.save_changeset(changeset, 'data/changeset.json')
+        build_db.incremental('data/squeex.db', 'data/changeset.json')
+
+        videos = { vid: video for vid, video in { **VIDEOS, **REFRESH }.items() if vid not in DELETED }
+        write_final(videos, 'v2')
+        build_db.build('data/fresh.db')
+        with open(final.FINAL_PATH) as f:
+            final_json = json.load(f)
+        with open(final.FULL_PATH) as f:
+            full_json = json.load(f)
+        yield os.path.abspath('data/squeex.db'), os.path.abspath('data/fresh.db'), final_json, full_json
+
+
+@pytest.fixture(params=[ 'incremental', 'fresh' ])
+def conn(request, built):
+    conn = sqlite3.connect(built[0] if request.param == 'incremental' else built[1])
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('table', list(delta.VERIFY_TABLES))
+def test_incremental_matches_full_build(built, table):
+    incremental, fresh = (sqlite3.connect(path) for path in built[:2])
+    order = delta.VERIFY_TABLES[table]
+    digest = delta.table_digest(fresh, table, order)
+    # results is only written by materialize.py.
+    assert (digest is None) == (table == 'results')
+    assert delta.table_digest(incremental, table, order) == digest
+
+
+def test_fts_candidates_match_scan(conn):
+    reader = transcripts.Reader(conn)
+    texts = { rowid: reader.decode(text) for rowid, text in conn.execute('SELECT rowid, full_text FROM videos') }
+    for phrase in PHRASES:
+        if not phrase.isascii(): continue
+        candidates = { rowid for rowid, in conn.execute('SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?',
+                                                        ('"' + phrase.lower() + '"',)) }
+        assert candidates == { rowid for rowid, text in texts.items() if phrase.lower() in text }, phrase
+
+
+def test_fts_phrase_matches_scan(conn):
+    with_fts = Search(conn)
+    without_fts = Search(conn)
+    without_fts.has_fts = False
+    assert with_fts.can_use_fts('hello chat')
+    for phrase in PHRASES:
+        expected = without_fts.phrase(phrase)
+        assert list(with_fts.phrase(phrase).items()) == list(expected.items()), phrase
+    assert with_fts.phrase('hello chat') != {}
+    assert with_fts.phrase('no more valorant') == {}
+
+
+def test_reader_round_trips(built):
+    _, fresh, final_json, full_json = built
+    conn = sqlite3.connect(fresh)
+    for column in transcripts.COLUMNS:
+        assert all(isinstance(value, bytes) for value, in conn.execute(f'SELECT {column} FROM videos'))
+
+    reader = transcripts.Reader(conn, cache_size=2)
+    for _ in range(2):
+        for vid in final_json['meta']:
+            assert reader.full_text(vid) == full_json[vid]['text']
+            assert reader.segments(vid) == final_json['segments'][vid]
+            assert reader.idx_to_time(vid) == full_json[vid]['idx_to_time']
+    assert len(reader.cache) == 2
+    assert reader.full_text('missing') is None
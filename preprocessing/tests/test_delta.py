@@ -0,0 +1,82 @@
+import os
+import re
+import shutil
+import argparse
+
+import pytest
+
+import corpus
+import delta
+from bench_pipeline import make_workspace
+from conftest import full_build, run_script as stage
+
+"""
+A refresh that replaces, adds and deletes videos, applied to the published
+database through a delta package (delta.py build / apply) must give the
+database the incremental build wrote and the one a full build writes.
+"""
+
+QUERIES = 100
+
+
+@pytest.fixture(scope='module')
+def refreshed(tmp_path_factory):
+    """The workspace after the refresh, and the vids it added, replaced and deleted."""
+    work_dir = str(tmp_path_factory.mktemp('delta'))
+    new_files = make_workspace(work_dir, argparse.Namespace(videos=8, new=2, hours=0.2, seed=3, style='youtube'))
+    cwd = os.path.join(work_dir, 'preprocessing')
+    vtt_dir = os.path.join(cwd, 'data', 'vtt')
+    app_data = os.path.join(work_dir, 'app', 'data')
+
+    # The base: a full build, published.
+    stage(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    stage(cwd, 'final.py', '--stream')
+    stage(cwd, 'merge.py')
+    stage(cwd, 'build_db.py')
+    stage(cwd, 'materialize.py')
+    shutil.copy(os.path.join(cwd, 'data', 'squeex.db'), os.path.join(app_data, 'squeex.db'))
+
+    # The refresh: one transcript cut short, the held back videos added, one video deleted.
+    vtts = sorted(os.listdir(vtt_dir))
+    replaced = os.path.join(vtt_dir, vtts[2])
+    with open(replaced, 'rb') as f:
+        head = f.read(os.path.getsize(replaced) // 2)
+    with open(replaced, 'wb') as f:
+        f.write(head[:head.rindex(b'\n\n') + 2])
+    for path in new_files:
+        shutil.move(path, os.path.join(vtt_dir, os.path.basename(path)))
+    deleted = re.search(r'\[([^\]]+)\]', vtts[5]).group(1)
+
+    stage(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    stage(cwd, 'final.py', '--changed', '--stream')
+    stage(cwd, 'merge.py', '--delete', deleted)
+    stage(cwd, 'build_db.py', '--incremental')
+    stage(cwd, 'materialize.py')
+    return cwd, app_data
+
+
+@pytest.fixture(scope='module')
+def applied(refreshed):
+    """The published database with the package applied."""
+    cwd, app_data = refreshed
+    stage(cwd, 'delta.py', 'build')
+    stage(cwd, 'delta.py', 'apply', 'data/deltas/latest', '--db', '../app/data/squeex.db')
+    return os.path.join(app_data, 'squeex.db')
+
+
+def test_changeset(refreshed):
+    cwd, _ = refreshed
+    changeset = corpus.load_changeset(os.path.join(cwd, 'data', 'changeset.json'))
+    assert (len(changeset['added']), len(changeset['replaced']), len(changeset['deleted'])) == (2, 1, 1)
+
+
+def test_delta_matches_incremental(refreshed, applied):
+    cwd, _ = refreshed
+    assert delta.verify(os.path.join(cwd, 'data', 'squeex.db'), applied, QUERIES) == 0
+
+
+def test_delta_matches_full_build(refreshed, applied):
+    cwd, _ = refreshed
+    full_build(cwd, 'data/full.db', corpus.load_changeset(os.path.join(cwd, 'data', 'changeset.json'))['updatedAt'])
+    stage(cwd, 'materialize.py', '--db', 'data/full.db')
+    assert delta.verify(os.path.join(cwd, 'data', 'full.db'), applied, QUERIES) == 0
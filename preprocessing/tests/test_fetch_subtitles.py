@@ -0,0 +1,70 @@
+import os
+import sys
+import shlex
+import argparse
+from collections import Counter
+
+import pytest
+
+import fetch_subtitles
+from conftest import TESTS_DIR
+
+"""
+fetch_subtitles.run() against tests/fake_yt_dlp.py, without network access.
+"""
+
+FAKE_YT_DLP = os.path.join(TESTS_DIR, 'fake_yt_dlp.py')
+RETRIES = 2
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    log = tmp_path / 'calls.txt'
+    monkeypatch.setenv('FAKE_YT_DLP_LOG', str(log))
+    monkeypatch.setenv('FAKE_YT_DLP_DATE_newer', '20210305')
+    (tmp_path / 'vtt').mkdir()
+    (tmp_path / 'vtt' / 'Squeex VOD [local].en.vtt').write_text('WEBVTT\n')
+    (tmp_path / 'dates.txt').write_text('older:20190101\nnewer:20210305\n')
+    (tmp_path / 'urls.txt').write_text('\n'.join([
+        'https://www.youtube.com/watch?v=newer',
+        'https://www.youtube.com/watch?v=first',
+        'https://www.youtube.com/watch?v=first',
+        'https://www.youtube.com/watch?v=local',
+        'https://www.youtube.com/watch?v=private1',
+        'https://www.youtube.com/watch?v=flaky1',
+    ]) + '\n')
+    args = argparse.Namespace(
+        urls=str(tmp_path / 'urls.txt'),
+        db=str(tmp_path / 'missing.db'),
+        vtt=str(tmp_path / 'vtt'),
+        dates=str(tmp_path / 'dates.txt'),
+        jobs=2,
+        retries=RETRIES,
+        backoff=0,
+        yt_dlp=shlex.join([ sys.executable, FAKE_YT_DLP ]),
+    )
+    return tmp_path, args
+
+
+def test_run(workspace, capsys):
+    tmp_path, args = workspace
+    fetch_subtitles.run(args)
+    out = capsys.readouterr().out
+
+    assert sorted(os.listdir(tmp_path / 'vtt')) == [
+        'Squeex VOD [first].en.vtt', 'Squeex VOD [local].en.vtt', 'Squeex VOD [newer].en.vtt' ]
+    assert (tmp_path / 'dates.txt').read_text() == 'first:20200101\nnewer:20210305\nolder:20190101\n'
+
+    calls = Counter((tmp_path / 'calls.txt').read_text().split())
+    assert calls == { 'newer': 1, 'first': 1, 'private1': 1, 'flaky1': RETRIES + 1 }
+    assert 'private1 unavailable' in out
+    assert 'flaky1 failed' in out
+    assert 'Not fetched, tried again on the next run: flaky1' in out
+
+
+def test_nothing_to_fetch(workspace, capsys):
+    tmp_path, args = workspace
+    (tmp_path / 'urls.txt').write_text('https://www.youtube.com/watch?v=local\n')
+    fetch_subtitles.run(args)
+    assert not (tmp_path / 'calls.txt').exists()
+    assert (tmp_path / 'dates.txt').read_text() == 'older:20190101\nnewer:20210305\n'
@@ -0,0 +1,83 @@
+import json
+import os
+import random
+
+import final
+
+"""
+final.build_streaming against final.build_in_memory: the same parsed
+files give byte-identical final.json and full.json, even when the word map
+spills to disk after a few records.
+"""
+
+WORDS = [ 'squeex', 'chat', 'valorant', 'pog', 'über', '"quoted"', 'back\\slash', '日本' ]
+
+
+def parsed_file(rng, n):
+    """A parsed video in parse.py's format, with words shared across videos."""
+    segments = []
+    word_map = {}
+    idx_to_time = {}
+    length = 0
+    for idx in range(rng.randint(1, 12)):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5)))
+        segments.append([ idx * 3, text ])
+        for word in text.split():
+            word_map.setdefault(word, [])
+            if idx not in word_map[word]:
+                word_map[word].append(idx)
+        length += 1 + len(text)
+        idx_to_time[str(length)] = idx * 3 + 2
+    return {
+        'id': f'vid{n:08d}',
+        'segments': segments,
+        'word_map': word_map,
+        'full_text': ''.join(' ' + text for _, text in segments),
+        'idx_to_time': idx_to_time,
+        'upload_date': 20200101 + n,
+    }
+
+
+def write_parsed(path, count):
+    rng = random.Random(0)
+    os.makedirs(path)
+    files = []
+    for n in range(count):
+        filename = f'Video {n} [vid{n:08d}].en.json'
+        with open(os.path.join(path, filename), 'w') as f:
+            json.dump(parsed_file(rng, n), f)
+        files.append(filename)
+    # Not sorted, so the output follows the file order given.
+    rng.shuffle(files)
+    return files
+
+
+def build(build_fn, *args):
+    build_fn('data/parsed', *args)
+    outputs = []
+    for path in (final.FINAL_PATH, final.FULL_PATH):
+        with open(path, 'rb') as f:
+            outputs.append(f.read())
+    return outputs
+
+
+def test_streaming_matches_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    files = write_parsed('data/parsed', 25)
+
+    spills = []
+    spill = final.RunWriter.spill
+    def counted_spill(self):
+        spills.append(self.name)
+        spill(self)
+    monkeypatch.setattr(final.RunWriter, 'spill', counted_spill)
+
+    expected = build(final.build_in_memory, files, 'now')
+    assert spills == []
+    streamed = build(final.build_streaming, files, 'now', 0.001, str(tmp_path))
+
+    assert streamed == expected
+    assert spills.count('postings') > 1
+    assert spills.count('entries') > 1
+    # The runs are removed once merged.
+    assert [ name for name in os.listdir(tmp_path) if name.startswith('final-') ] == []
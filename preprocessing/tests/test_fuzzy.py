@@ -0,0 +1,57 @@
+import random
+import sqlite3
+import string
+
+import fuzzy
+
+"""
+fuzzy.expand against ranking the vocabulary directly, including lookups
+with more candidates than MAX_CANDIDATES.
+"""
+
+WORD = 'squeex'
+
+
+def vocabulary():
+    """
+    Spellings near WORD, with ties in mentions: those one edit away are
+    mentioned less than those two edits away.
+    """
+    rng = random.Random(0)
+    near = { WORD[:5] + c for c in string.ascii_lowercase } | { WORD + c for c in string.ascii_lowercase }
+    far = { WORD[:3] + a + b + WORD[5] for a in 'aiou' for b in 'aiou' }
+    return sorted([ (word, rng.choice([ 2, 3 ])) for word in near - { WORD } ] +
+                  [ (word, rng.choice([ 5, 8 ])) for word in far ])
+
+
+def database(words):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE word_totals (word TEXT PRIMARY KEY, mentions INTEGER, videos INTEGER) WITHOUT ROWID')
+    conn.execute('CREATE TABLE fuzzy (key TEXT, word TEXT, PRIMARY KEY (key, word)) WITHOUT ROWID')
+    for word, mentions in words:
+        conn.execute('INSERT INTO word_totals VALUES (?, ?, 1)', (word, mentions))
+        conn.executemany('INSERT INTO fuzzy VALUES (?, ?)', fuzzy.rows(word, mentions))
+    return conn
+
+
+def test_expand_matches_scan():
+    words = vocabulary()
+    conn = database(words)
+    for word in (WORD, 'squeexa', 'squeaz', 'squx'):
+        assert fuzzy.expand(conn, word) == fuzzy.rank(word, words)
+
+
+def test_candidate_limit(monkeypatch):
+    words = vocabulary()
+    limit = 12
+    assert len(words) > limit
+    monkeypatch.setattr(fuzzy, 'MAX_CANDIDATES', limit)
+    kept = sorted(words, key=lambda w: (-w[1], w[0]))[:limit]
+    expected = fuzzy.rank(WORD, kept)
+    assert expected != fuzzy.rank(WORD, words)
+
+    # The same expansions whatever order the rows were written in.
+    shuffled = list(words)
+    random.Random(1).shuffle(shuffled)
+    for order in (words, words[::-1], shuffled):
+        assert fuzzy.expand(database(order), WORD) == expected
@@ -0,0 +1,162 @@
+import os
+import json
+import random
+import shutil
+import sqlite3
+import subprocess
+
+import pytest
+
+import build_db
+from conftest import REPO_DIR, write_final
+from search import Search
+
+"""
+app/lib/get.js on a small database: paging through results with the
+`next` cursor and the route's query parameters (app/lib/params.js), one or
+two videos at a time, gives every video once, newest first, with its match
+count, and the per-day histogram adds up to the same counts.
+
+Needs node and the app's better-sqlite3 (npm install in app/).
+"""
+
+WORDS = [ 'hello', 'chat', 'squeex', 'is', 'here', 'valorant', 'welcome', 'back' ]
+# Ties on upload days, and the characters of YouTube ids that the cursor
+# (`${day}_${vid}`) has to keep.
+VIDEOS = {
+    'aaaaaaaaaaa': 20210101,
+    'b_bbbbbbbbb': 20210103,
+    'c-ccccccccc': 20210103,
+    'ddddddddddd': 20210103,
+    'eeeeeeeeeee': 20210105,
+    'f_f-fffffff': 20210107,
+    'ggggggggggg': 20210107,
+    'hhhhhhhhhhh': 20210110,
+}
+QUERIES = [ 'chat', 'squeex', 'hello chat', 'chat hello' ]
+# Query parameters and the upload days they select.
+PAGES = [
+    ({ 'limit': '1' }, (0, 99999999)),
+    ({ 'limit': '2', 'snippets': '1' }, (0, 99999999)),
+    ({ 'limit': '2', 'meta': 'results', 'from': '20210103', 'to': '20210107' }, (20210103, 20210107)),
+    ({ 'limit': '1', 'to': '20210103' }, (0, 20210103)),
+    ({ 'limit': '2', 'from': '2021-01-05' }, (0, 99999999)),
+]
+
+NODE_SCRIPT = r'''
+const { getPage, getHistogram } = require('./lib/get');
+const { parseRange, parsePage } = require('./lib/params');
+const cases = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+
+function pages(query, params) {
+    const range = parseRange(params);
+    const out = [];
+    let cursor;
+    do {
+        const page = JSON.parse(getPage(query, range, parsePage({ ...params, cursor })).body);
+        out.push(page);
+        cursor = page.next;
+    } while (cursor && out.length < 100);
+    return out;
+}
+
+console.log(JSON.stringify(cases.map(({ query, params }) => {
+    // Phrases run the regex first, then page through the cached result.
+    const uncached = pages(query, params);
+    return { uncached, histogram: getHistogram(query), cached: pages(query, params) };
+})));
+'''
+
+
+def node_env():
+    env = dict(os.environ)
+    env['NODE_PATH'] = os.pathsep.join(filter(None, [ os.path.join(REPO_DIR, 'app', 'node_modules'), env.get('NODE_PATH') ]))
+    return env
+
+
+def has_driver():
+    if shutil.which('node') is None:
+        return False
+    return subprocess.run([ 'node', '-e', "require.resolve('better-sqlite3')" ], env=node_env(),
+                          capture_output=True).returncode == 0
+
+
+pytestmark = pytest.mark.skipif(not has_driver(), reason='needs node and better-sqlite3 (npm install in app/)')
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """A copy of app/lib next to data/squeex.db, where get.js opens it, and the expected results by query."""
+    app_dir = tmp_path_factory.mktemp('get') / 'app'
+    shutil.copytree(os.path.join(REPO_DIR, 'app', 'lib'), app_dir / 'lib')
+    rng = random.Random(60)
+    videos = { vid: (day, [ ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) for _ in range(rng.randint(3, 9)) ])
+               for vid, day in VIDEOS.items() }
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(app_dir)
+        write_final(videos, 'v1')
+        build_db.build('data/squeex.db')
+    conn = sqlite3.connect(app_dir / 'data' / 'squeex.db')
+    search = Search(conn)
+    expected = { query: search.query(query) for query in QUERIES }
+    conn.close()
+    return app_dir, expected
+
+
+@pytest.fixture(scope='module')
+def results(app):
+    app_dir, _ = app
+    cases = [ { 'query': query, 'params': params } for query in QUERIES for params, _ in PAGES ]
+    result = subprocess.run([ 'node', '-e', NODE_SCRIPT ], input=json.dumps(cases), capture_output=True, text=True,
+                            cwd=app_dir, env=node_env(), check=True)
+    return dict(zip([ (case['query'], json.dumps(case['params'])) for case in cases ], json.loads(result.stdout)))
+
+
+def newest_first(segments, days):
+    vids = [ vid for vid in segments if days[0] <= VIDEOS[vid] <= days[1] ]
+    return sorted(vids, key=lambda vid: (VIDEOS[vid], vid), reverse=True)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+@pytest.mark.parametrize('params,days', PAGES)
+def test_pages_cover_every_video_once(app, results, query, params, days):
+    _, expected = app
+    segments = expected[query]
+    assert 5 <= len(segments) < len(VIDEOS)
+    limit = int(params['limit'])
+    snippets = int(params.get('snippets', 0))
+
+    for key in ('uncached', 'cached'):
+        pages = results[(query, json.dumps(params))][key]
+        vids = [ vid for page in pages for vid in page['segments'] ]
+        assert vids == newest_first(segments, days)
+
+        for n, page in enumerate(pages):
+            page_vids = list(page['segments'])
+            assert 0 < len(page_vids) <= limit or vids == []
+            assert list(page['counts']) == page_vids
+            if n < len(pages) - 1:
+                assert page['next'] == f'{VIDEOS[page_vids[-1]]}_{page_vids[-1]}'
+            else:
+                assert page['next'] is None
+            assert set(page['meta']) == (set(page_vids) if params.get('meta') == 'results' else set(VIDEOS))
+            for vid in page_vids:
+                assert page['counts'][vid] == len(segments[vid])
+                assert page['segments'][vid] == segments[vid][:snippets or None]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_histogram_sums_to_counts(app, results, query):
+    _, expected = app
+    pages = results[(query, json.dumps(PAGES[0][0]))]['uncached']
+    counts = { vid: count for page in pages for vid, count in page['counts'].items() }
+
+    days = {}
+    for vid, count in counts.items():
+        day = days.setdefault(VIDEOS[vid], [ VIDEOS[vid], 0, 0 ])
+        day[1] += count
+        day[2] += 1
+    histogram = results[(query, json.dumps(PAGES[0][0]))]['histogram']
+    assert histogram['days'] == sorted(days.values())
+    assert sum(mentions for _, mentions, _ in histogram['days']) == sum(len(s) for s in expected[query].values())
+    assert histogram['range'] == [ min(VIDEOS.values()), max(VIDEOS.values()) ]
@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+
+import pytest
+
+import corpus
+import manifest
+import parse
+from bench_pipeline import make_workspace
+from conftest import run_script
+
+"""
+The parse manifest: which inputs manifest.plan skips and reparses, the
+pending -> final promotion, and a refresh with nothing new doing nothing
+from parse.py to merge.py.
+"""
+
+VIDS = [ 'aaaaaaaaaaa', 'bbbbbbbbbbb' ]
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    """Two vtt files, with their parse.py outputs in place."""
+    jobs = []
+    for vid in VIDS:
+        vtt_path = str(tmp_path / f'Video [{vid}].en.vtt')
+        with open(vtt_path, 'w') as f:
+            f.write(f'WEBVTT\n\n00:00:01.000 --> 00:00:02.000\n{vid}\n')
+        output_path = parse.get_output_path(vtt_path, str(tmp_path))
+        with open(output_path, 'w') as f:
+            f.write('{}\n')
+        jobs.append((vtt_path, output_path))
+    return jobs
+
+
+def plan(m, jobs, fingerprint='parser1'):
+    """manifest.plan, recording the entries as run_batch does once parsed."""
+    dates = { vid: 20200101 for vid in VIDS }
+    todo, skipped, entries = manifest.plan(m, jobs, fingerprint, dates, parse.get_vid)
+    m['files'].update(entries)
+    return [ parse.get_vid(vtt) for vtt, _ in todo ], [ parse.get_vid(vtt) for vtt in skipped ]
+
+
+def test_skips_unchanged(jobs, tmp_path):
+    m = manifest.load(str(tmp_path / 'manifest.json'))
+    assert plan(m, jobs) == (VIDS, [])
+    assert plan(m, jobs) == ([], VIDS)
+
+
+def test_reparses_changed_content(jobs, tmp_path):
+    m = manifest.load(str(tmp_path / 'manifest.json'))
+    plan(m, jobs)
+    with open(jobs[1][0], 'a') as f:
+        f.write('\n00:00:02.000 --> 00:00:03.000\nmore\n')
+    assert plan(m, jobs) == ([ VIDS[1] ], [ VIDS[0] ])
+    assert plan(m, jobs) == ([], VIDS)
+
+
+def test_reparses_missing_output(jobs, tmp_path):
+    m = manifest.load(str(tmp_path / 'manifest.json'))
+    plan(m, jobs)
+    os.remove(jobs[0][1])
+    assert plan(m, jobs) == ([ VIDS[0] ], [ VIDS[1] ])
+
+
+def test_reparses_on_new_fingerprint(jobs, tmp_path):
+    m = manifest.load(str(tmp_path / 'manifest.json'))
+    plan(m, jobs)
+    assert plan(m, jobs, 'parser2') == (VIDS, [])
+    assert plan(m, jobs, 'parser2') == ([], VIDS)
+
+
+def test_fingerprint_follows_stopwords_and_flags():
+    fingerprints = { manifest.parser_fingerprint([ 'a', 'the' ]), manifest.parser_fingerprint([ 'a' ]),
+                     manifest.parser_fingerprint([ 'a', 'the' ], flags=[ '--normalize' ]) }
+    assert len(fingerprints) == 3
+
+
+def test_promote_pending(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    assert manifest.promote_pending(path) == 0
+    assert not os.path.exists(path)
+
+    m = manifest.load(path)
+    m['final'] = { 'old': 'sha0:p', 'changed': 'sha1:p' }
+    m['pending'] = { 'changed': 'sha2:p', 'new': 'sha3:p' }
+    manifest.save(m, path)
+    assert manifest.promote_pending(path, deleted=[ 'gone' ]) == 2
+
+    m = manifest.load(path)
+    assert m['final'] == { 'old': 'sha0:p', 'changed': 'sha2:p', 'new': 'sha3:p' }
+    assert m['pending'] == {}
+    assert m['deleted'] == [ 'gone' ]
+
+
+def refresh(cwd):
+    """parse -> final --changed -> merge. Returns the parse and final logs, what final left pending and the changeset."""
+    parsed = run_script(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    built = run_script(cwd, 'final.py', '--changed', '--stream')
+    pending = manifest.load(os.path.join(cwd, 'data', 'manifest.json'))['pending']
+    run_script(cwd, 'merge.py')
+    return parsed.stdout, built.stderr, pending, corpus.load_changeset(os.path.join(cwd, 'data', 'changeset.json'))
+
+
+def test_second_refresh_does_nothing(tmp_path):
+    make_workspace(str(tmp_path), argparse.Namespace(videos=4, new=0, hours=0.1, seed=2, style='youtube'))
+    cwd = str(tmp_path / 'preprocessing')
+
+    parsed, built, pending, changeset = refresh(cwd)
+    assert '4 vtt files: 0 unchanged, 4 to parse' in parsed
+    assert 'Building from 4 parsed files' in built
+    assert len(pending) == 4
+    assert len(changeset['added']) == 4
+    m = manifest.load(os.path.join(cwd, 'data', 'manifest.json'))
+    assert (m['final'], m['pending']) == (pending, {})
+    run_script(cwd, 'build_db.py')
+
+    parsed, built, pending, changeset = refresh(cwd)
+    assert '4 vtt files: 4 unchanged, 0 to parse' in parsed
+    assert 'Building from 0 parsed files' in built
+    assert pending == {}
+    assert (changeset['added'], changeset['replaced'], changeset['deleted']) == ([], [], [])
+    with open(os.path.join(cwd, 'data', 'final.json')) as f:
+        assert json.load(f)['meta'] == {}
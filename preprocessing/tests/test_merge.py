@@ -0,0 +1,90 @@
+import os
+import re
+import json
+import shutil
+import sqlite3
+import argparse
+
+import pytest
+
+import corpus
+import delta
+import manifest
+from bench_pipeline import make_workspace
+from conftest import full_build, run_script as stage
+
+"""
+merge.py against a full rebuild: a changeset that adds, replaces and
+deletes videos, applied with build_db.py --incremental, must give the
+database a full build of every parsed file gives. The merge reads only
+the changed videos and leaves final.py's output alone.
+"""
+
+QUERIES = 100
+
+
+def contents(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(scope='module')
+def merged(tmp_path_factory):
+    """The workspace after the refresh, with final.py's output as merge.py found and left it."""
+    work_dir = str(tmp_path_factory.mktemp('merge'))
+    new_files = make_workspace(work_dir, argparse.Namespace(videos=8, new=2, hours=0.2, seed=7, style='youtube'))
+    cwd = os.path.join(work_dir, 'preprocessing')
+    vtt_dir = os.path.join(cwd, 'data', 'vtt')
+
+    stage(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    stage(cwd, 'final.py', '--stream')
+    stage(cwd, 'merge.py')
+    stage(cwd, 'build_db.py')
+
+    # One transcript cut short, the held back videos added, one video deleted.
+    vtts = sorted(os.listdir(vtt_dir))
+    replaced = os.path.join(vtt_dir, vtts[1])
+    with open(replaced, 'rb') as f:
+        head = f.read(os.path.getsize(replaced) // 2)
+    with open(replaced, 'wb') as f:
+        f.write(head[:head.rindex(b'\n\n') + 2])
+    for path in new_files:
+        shutil.move(path, os.path.join(vtt_dir, os.path.basename(path)))
+    deleted = re.search(r'\[([^\]]+)\]', vtts[4]).group(1)
+
+    stage(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    stage(cwd, 'final.py', '--changed', '--stream')
+    before = [ contents(os.path.join(cwd, 'data', name)) for name in ('final.json', 'full.json') ]
+    stage(cwd, 'merge.py', '--delete', deleted)
+    after = [ contents(os.path.join(cwd, 'data', name)) for name in ('final.json', 'full.json') ]
+    stage(cwd, 'build_db.py', '--incremental')
+    return cwd, deleted, before, after
+
+
+def test_merge_reads_only_the_changeset(merged):
+    cwd, deleted, before, after = merged
+    changeset = corpus.load_changeset(os.path.join(cwd, 'data', 'changeset.json'))
+    assert (len(changeset['added']), len(changeset['replaced']), changeset['deleted']) == (2, 1, [ deleted ])
+
+    assert after == before
+    final = json.loads(after[0])
+    assert sorted(final['meta']) == sorted(corpus.changed_vids(changeset))
+    assert sorted(json.loads(after[1])) == sorted(corpus.changed_vids(changeset))
+
+
+def test_deleted_recorded_in_manifest(merged):
+    cwd, deleted, _, _ = merged
+    m = manifest.load(os.path.join(cwd, 'data', 'manifest.json'))
+    assert m['deleted'] == [ deleted ]
+    assert m['pending'] == {}
+
+
+def test_incremental_matches_full_build(merged):
+    cwd, deleted, _, _ = merged
+    changeset = corpus.load_changeset(os.path.join(cwd, 'data', 'changeset.json'))
+    full_build(cwd, 'data/full.db', changeset['updatedAt'])
+
+    conn = sqlite3.connect(os.path.join(cwd, 'data', 'full.db'))
+    assert conn.execute('SELECT COUNT(*) FROM videos WHERE vid = ?', (deleted,)).fetchone()[0] == 0
+    conn.close()
+    assert delta.verify(os.path.join(cwd, 'data', 'full.db'), os.path.join(cwd, 'data', 'squeex.db'), QUERIES) == 0
@@ -0,0 +1,109 @@
+import glob
+import io
+import json
+import os
+
+import pytest
+
+import parse
+from conftest import TESTS_DIR
+
+"""
+parse.parse_vtt against the output of the webvtt based parser it replaced,
+kept next to each vtt file in tests/data/parse, and the rules of
+normalized_segments on hand written cues.
+"""
+
+DATA_DIR = os.path.join(TESTS_DIR, 'data', 'parse')
+VTT_FILES = sorted(glob.glob(os.path.join(glob.escape(DATA_DIR), '*.en.vtt')))
+
+
+def golden(vtt_filename):
+    with open(vtt_filename[:-len('.en.vtt')] + '.json', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('vtt_filename', VTT_FILES, ids=os.path.basename)
+def test_matches_webvtt_parser(vtt_filename):
+    expected = golden(vtt_filename)
+    parsed = parse.parse_vtt(vtt_filename, parse.load_dates(os.path.join(DATA_DIR, 'dates.txt')))
+
+    assert parsed['id'] == expected['id']
+    assert parsed['upload_date'] == expected['upload_date']
+    # json turns the idx_to_time keys into strings, so compare what is written.
+    for key in ('segments', 'word_map', 'full_text', 'idx_to_time'):
+        assert json.dumps(parsed[key]) == json.dumps(expected[key]), key
+
+
+def vtt(*cues):
+    """An open vtt file of (start, end, lines) cues."""
+    blocks = [ 'WEBVTT' ] + [ f'{start} --> {end}\n' + '\n'.join(lines) for start, end, lines in cues ]
+    return io.StringIO('\n\n'.join(blocks) + '\n')
+
+
+def test_carried_lines():
+    assert parse.carried_lines([ 'a', 'b' ], []) == 0
+    assert parse.carried_lines([ 'c' ], [ 'a', 'b' ]) == 0
+    assert parse.carried_lines([ 'b', 'c' ], [ 'a', 'b' ]) == 1
+    assert parse.carried_lines([ 'a', 'b' ], [ 'a', 'b' ]) == 2
+    # Only a run at the end of recent counts.
+    assert parse.carried_lines([ 'a', 'c' ], [ 'a', 'b' ]) == 0
+    # A grown last line is new, to replace the one emitted.
+    assert parse.carried_lines([ 'a', 'b c' ], [ 'a', 'b' ]) == 1
+    assert parse.carried_lines([ 'b c' ], [ 'a', 'b' ]) == 0
+    # But not a longer word.
+    assert parse.carried_lines([ 'bc' ], [ 'a', 'b' ]) == 0
+
+
+def test_tagged_cues():
+    f = vtt(('00:00:01.000', '00:00:03.000', [ ' ', 'hello<00:00:01.500><c> everyone</c>' ]),
+            ('00:00:03.000', '00:00:03.010', [ 'hello everyone', ' ' ]),
+            ('00:00:03.010', '00:00:05.000', [ 'hello everyone', 'welcome<00:00:04.000><c> back</c>' ]),
+            ('00:00:05.000', '00:00:05.010', [ 'welcome back', ' ' ]),
+            # Said twice in a row: tagged again, so kept.
+            ('00:00:05.010', '00:00:07.000', [ 'welcome back', 'welcome<00:00:06.000><c> back</c>' ]),
+            ('00:00:07.000', '00:00:07.010', [ 'welcome back', ' ' ]))
+    assert list(parse.normalized_segments(f)) == [
+        (1, 3, 'hello everyone'),
+        (3, 5, 'welcome back'),
+        (5, 7, 'welcome back'),
+    ]
+
+
+def test_spacer_line_stays_in_its_cue():
+    cues = (('00:00:01.000', '00:00:03.000', [ ' ', 'hello<00:00:01.500><c> everyone</c>' ]),)
+    # A whitespace-only line ends a block for webvtt-py, cutting the cue off
+    # from its text; only an empty line does in the spec.
+    assert list(parse.read_cues(vtt(*cues))) == []
+    assert list(parse.read_cues(vtt(*cues), spec=True)) == [
+        ('00:00:01.000', '00:00:03.000', [ ' ', 'hello<00:00:01.500><c> everyone</c>' ]),
+    ]
+    assert list(parse.normalized_segments(vtt(*cues))) == [ (1, 3, 'hello everyone') ]
+
+
+def test_untagged_repeated_lines():
+    f = vtt(('00:00:01.000', '00:00:02.000', [ 'one' ]),
+            ('00:00:02.000', '00:00:04.000', [ 'one', 'two' ]),
+            ('00:00:04.000', '00:00:06.000', [ 'two', 'three' ]),
+            ('00:00:06.000', '00:00:06.010', [ 'three' ]),
+            ('00:00:06.010', '00:00:08.000', [ 'three', 'three' ]))
+    assert list(parse.normalized_segments(f)) == [
+        (1, 2, 'one'),
+        (2, 4, 'two'),
+        (4, 6, 'three'),
+        (6, 8, 'three'),
+    ]
+
+
+def test_roll_up_replaces_prefix():
+    f = vtt(('00:00:01.000', '00:00:02.000', [ 'squeex' ]),
+            ('00:00:02.000', '00:00:03.000', [ 'squeex is' ]),
+            ('00:00:03.000', '00:00:05.000', [ 'squeex is here' ]),
+            ('00:00:05.000', '00:00:06.000', [ 'squeex is here', 'next' ]),
+            # Tagged lines are said anew, even when they extend the last one.
+            ('00:00:06.000', '00:00:07.000', [ 'next', 'next<00:00:06.500><c> up</c>' ]))
+    assert list(parse.normalized_segments(f)) == [
+        (1, 5, 'squeex is here'),
+        (5, 6, 'next'),
+        (6, 7, 'next up'),
+    ]
@@ -0,0 +1,76 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import postings
+from conftest import REPO_DIR
+
+"""
+postings.py against app/lib/postings.js: lists encoded by one are decoded
+by the other, and both encode to the same bytes.
+"""
+
+CASES = [
+    [],
+    [0],
+    [127],
+    [128],
+    [0, 127, 128],
+    [127, 255, 256, 383],
+    [2 ** 21 - 1],
+    [2 ** 21],
+    [2 ** 14 - 1, 2 ** 14, 2 ** 21, 2 ** 28],
+    [2 ** 32 - 1],
+    [0, 2 ** 32 - 1],
+    list(range(5000)),
+    list(range(0, 2 ** 32 - 1, 2 ** 20 + 7)),
+    [ i * 128 for i in range(2000) ],
+]
+
+NODE_SCRIPT = r'''
+const { decodePostings, encodePostings } = require('./app/lib/postings');
+const cases = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+console.log(JSON.stringify({
+    decoded: cases.map(c => decodePostings(Buffer.from(c.hex, 'hex'))),
+    encoded: cases.map(c => encodePostings(c.list).toString('hex')),
+}));
+'''
+
+needs_node = pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+
+
+def run_node(cases):
+    stdin = json.dumps([ { 'hex': postings.encode(case).hex(), 'list': case } for case in cases ])
+    result = subprocess.run([ 'node', '-e', NODE_SCRIPT ], input=stdin, capture_output=True,
+                            text=True, cwd=REPO_DIR, check=True)
+    return json.loads(result.stdout)
+
+
+def test_round_trip():
+    for case in CASES:
+        blob = postings.encode(case)
+        assert postings.decode(blob) == case
+        assert postings.count(blob) == len(case)
+
+
+def test_one_byte_per_small_gap():
+    assert postings.encode([0, 127]) == bytes([0, 127])
+    assert postings.encode([128]) == bytes([0x80, 0x01])
+    assert postings.encode([2 ** 21]) == bytes([0x80, 0x80, 0x80, 0x01])
+    assert postings.encode([2 ** 32 - 1]) == bytes([0xff, 0xff, 0xff, 0xff, 0x0f])
+
+
+@needs_node
+def test_python_encoded_decodes_in_node():
+    assert run_node(CASES)['decoded'] == CASES
+
+
+@needs_node
+def test_node_encoded_decodes_in_python():
+    encoded = run_node(CASES)['encoded']
+    for case, hex_blob in zip(CASES, encoded):
+        blob = bytes.fromhex(hex_blob)
+        assert blob == postings.encode(case)
+        assert postings.decode(blob) == case
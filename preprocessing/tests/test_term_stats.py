@@ -0,0 +1,80 @@
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+
+import pytest
+
+import term_stats
+from bench_pipeline import make_workspace
+from conftest import run_script
+
+"""
+The term_stats.py sidecar kept up to date with --update against a
+recount, and analyze_deviance.py reading it against reading squeex.db.
+"""
+
+
+@pytest.fixture(scope='module')
+def workspace(tmp_path_factory):
+    """A workspace after a refresh that added videos, with the sidecar from before it in data/base_stats.db."""
+    work_dir = str(tmp_path_factory.mktemp('term_stats'))
+    new_files = make_workspace(work_dir, argparse.Namespace(videos=8, new=3, hours=0.2, seed=5, style='youtube'))
+    cwd = os.path.join(work_dir, 'preprocessing')
+
+    run_script(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    run_script(cwd, 'final.py', '--stream')
+    run_script(cwd, 'merge.py')
+    run_script(cwd, 'build_db.py')
+    run_script(cwd, 'term_stats.py')
+    shutil.copy(os.path.join(cwd, 'data', 'term_stats.db'), os.path.join(cwd, 'data', 'base_stats.db'))
+
+    for path in new_files:
+        shutil.move(path, os.path.join(cwd, 'data', 'vtt', os.path.basename(path)))
+    run_script(cwd, 'parse.py', '--batch', 'data/vtt', '--out', 'data/parsed')
+    run_script(cwd, 'final.py', '--changed', '--stream')
+    run_script(cwd, 'merge.py')
+    run_script(cwd, 'build_db.py', '--incremental')
+    run_script(cwd, 'term_stats.py', '--update')
+    return cwd
+
+
+def data(cwd, name):
+    return os.path.join(cwd, 'data', name)
+
+
+def test_update_matches_recount(workspace):
+    assert term_stats.check(data(workspace, 'term_stats.db'), data(workspace, 'squeex.db')) == 0
+
+
+def test_check_fails_on_word_order(workspace):
+    path = data(workspace, 'swapped.db')
+    shutil.copy(data(workspace, 'term_stats.db'), path)
+    conn = sqlite3.connect(path)
+    (first, first_pos), (second, second_pos) = conn.execute('SELECT id, pos FROM words ORDER BY pos LIMIT 2').fetchall()
+    conn.execute('UPDATE words SET pos = ? WHERE id = ?', (second_pos, first))
+    conn.execute('UPDATE words SET pos = ? WHERE id = ?', (first_pos, second))
+    conn.commit()
+    conn.close()
+    assert term_stats.check(path, data(workspace, 'squeex.db')) == 1
+
+
+def test_update_refuses_rebuilt_database(workspace):
+    run_script(workspace, 'build_db.py', '--db', 'data/rebuilt.db')
+    result = run_script(workspace, 'term_stats.py', '--update', '--stats', 'data/base_stats.db', '--db', 'data/rebuilt.db',
+                        check=False)
+    assert result.returncode == 1
+    assert 'rebuilt' in result.stdout
+
+
+def test_analyze_same_with_sidecar(workspace):
+    freq = os.path.join(workspace, '..', 'corpus', 'freq.txt')
+    outputs = []
+    for source in ([ '--db', 'data/squeex.db' ], [ '--stats', 'data/term_stats.db' ]):
+        out = data(workspace, f'suggestions{len(outputs)}.json')
+        run_script(workspace, 'analyze_deviance.py', *source, '--freq-file', freq, '--out', out)
+        with open(out) as f:
+            outputs.append(json.load(f))
+    assert outputs[0] == outputs[1]
+    assert outputs[0]['pills']